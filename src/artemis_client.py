@@ -1,9 +1,10 @@
 import sys
 import socket
-from multiprocessing import Pool
 
 from board import Board
+from minimax import time_budget_for_move
 from minimax_process import parallel_minimax_pool
+from search_pool import SearchPool
 
 
 class ArtemisClient:
@@ -22,14 +23,30 @@ class ArtemisClient:
     PASS = "10"
     OPPONENT = "7"
 
+    # Kinds of server messages, see parse_message
+    USERNAME_REQUEST = "username request"
+    PASSWORD_REQUEST = "password request"
+    OPPONENT_REQUEST = "opponent request"
+    LOGIN_REQUESTS = (USERNAME_REQUEST, PASSWORD_REQUEST, OPPONENT_REQUEST)
+    MOVE_REQUEST = "move request"
+    UNKNOWN_REQUEST = "unknown request"
+    MOVE = "move"
+    COIN_TOSS = "coin toss"
+    COLOR = "color"
+    GAME = "game"
+    GAME_OVER = "game over"
+    ERROR = "error"
+    UNKNOWN = "unknown"
+
     def __init__(self, gui=None):
         self.s = None
-        self.gui = False
-        if gui is not None:
-            self.graphics = True
-            self.graphics_obj = gui
+        # Bytes of a message whose end hasn't been received yet
+        self._partial = b""
+        self.graphics = gui is not None
+        self.graphics_obj = gui
 
-    def do_server_connection(self, ai, connection_index, verbose=False, size=18, username=1, opponent=2, depth=5):
+    def do_server_connection(self, ai, connection_index, verbose=False, size=18, username=1, opponent=2, depth=5,
+                             book=None, host=None, port=None, ponderer=None):
         """
         Connects to the server and plays a game from the point of one player
         :param ai: the heuristic to use
@@ -38,7 +55,12 @@ class ArtemisClient:
         :param size: size of the board to use
         :param username: username and password
         :param opponent: opponent name
-        :param depth: the depth of the minimax search
+        :param depth: the maximum depth of the minimax search. The search deepens until its share of the remaining
+        clock time is used up.
+        :param book: optional OpeningBook to play from before searching
+        :param host: the server's host name, defaults to HOST
+        :param port: the server's port, defaults to PORT
+        :param ponderer: optional Ponderer that searches while waiting for the opponent's move
         :return: (player number of this connection i.e. 1 or -1, winning player, final board state, remaining time)
         """
         log = (lambda x: print("Connection %d: [%s]" % (connection_index, x))) if verbose else (lambda x: x)
@@ -50,13 +72,14 @@ class ArtemisClient:
             return None
 
         try:
-            host_ip = socket.gethostbyname(ArtemisClient.HOST)
+            host_ip = socket.gethostbyname(host or ArtemisClient.HOST)
         except socket.gaierror:
             print("There was an error resolving the host")
             return None
 
         # connecting to the server
-        self.s.connect((host_ip, ArtemisClient.PORT))
+        self.s.connect((host_ip, port or ArtemisClient.PORT))
+        self._partial = b""
         version_message = self.get_message_from_socket()
         log("Connected to server version %s" % version_message.split("v")[-1])
 
@@ -66,12 +89,13 @@ class ArtemisClient:
         winner = 0
         remaining_time = 180
         log("Using AI: " + str(ai))
-        pool = Pool()
+        pool = SearchPool()
 
         if not verbose:
             print("Turn\tTime")
 
         last_response = None
+        last_reply = None
         while winner == 0:
             message = self.get_message_from_socket()
             # time.sleep(1)
@@ -80,86 +104,165 @@ class ArtemisClient:
 
             try:
                 for message in messages:
-                    if "?" in message:
-                        # It is a request:
-                        request = message[message.index("?") + 1:]
+                    kind, value = ArtemisClient.parse_message(message, size)
+                    response = None
+                    if kind in ArtemisClient.LOGIN_REQUESTS:
+                        response = ArtemisClient.login_response(kind, username, opponent)
+
+                    elif kind == ArtemisClient.MOVE_REQUEST:
+                        if value is not None:
+                            remaining_time = value
+                            log("Time Left: " + str(remaining_time))
 
-                        if request.startswith("Username"):
-                            response = username
+                        move = book.probe(board, my_player) if book is not None else None
+                        if move is not None:
+                            log("Book move")
+                        else:
+                            budget = time_budget_for_move(remaining_time, board.get_move_number(), size)
+                            log("Time budget: " + str(budget))
+                            pondered = None
+                            if ponderer is not None and ponderer.is_pondering():
+                                pondered = ponderer.respond(board, last_reply, time_budget=budget)
+                            if pondered is not None:
+                                log("Ponder hit")
+                                move = pondered[1]
+                            else:
+                                h, move = parallel_minimax_pool(board, my_player, ai, depth, pool=pool,
+                                                                time_budget=budget)
+                        response = ArtemisClient.my_move_to_server_move(move, size)
+                        if self.graphics:
+                            self.graphics_obj.graphics_move(move)
 
-                        elif request.startswith("Password"):
-                            response = username
+                    elif kind == ArtemisClient.UNKNOWN_REQUEST:
+                        print("Unknown request: " + str(value))
 
-                        elif request.startswith("Opponent"):
-                            response = opponent
+                    elif kind == ArtemisClient.MOVE:
+                        log("Doing Move: " + str(value))
+                        board.do_move(value)
+                        self._track_move(ponderer, board, my_player)
+                        last_reply = value
+                        if verbose:
+                            board.print()
+                        elif board.get_move_number() % 5 == 0:
+                            print(board.get_move_number(), "\t", remaining_time, sep="")
+                        if self.graphics:
+                            self.graphics_obj.graphics_move(value)
 
-                        elif request.startswith("Move") or request.startswith("Remove"):
-                            if "(" in message:
-                                remaining_time = message[message.index("(") + 1: message.index(")")]
-                                remaining_time = int(remaining_time) / 1000
-                                log("Time Left: " + str(remaining_time))
+                    elif kind == ArtemisClient.COIN_TOSS:
+                        log("I won the coin toss" if value else "I lost the coin toss")
 
-                            h, move = parallel_minimax_pool(board, my_player, ai, depth, pool=pool)
-                            response = ArtemisClient.my_move_to_server_move(move, size)
-                            if self.graphics:
-                                self.graphics_obj.graphics_move(move)
-                        else:
-                            print("Unknown request: " + str(request))
-                            continue
+                    elif kind == ArtemisClient.COLOR:
+                        my_player = value
+                        log("My player is " + str(my_player))
 
+                    elif kind == ArtemisClient.GAME:
+                        game_num = value
+                        log("Game Number: " + str(game_num))
+
+                    elif kind == ArtemisClient.GAME_OVER:
+                        log(message)
+                        winner = my_player if value else -my_player
+                        break
+                    elif kind == ArtemisClient.ERROR:
+                        raise ValueError(message + " | Last response: " + last_response)
+                    else:
+                        print("Unknown message: " + str(message))
+                        raise ValueError(message, "Opponent Crashed")
+
+                    if response is not None:
                         log("Response:" + response)
                         self.send_response_to_socket(response)
                         last_response = response
-                    else:
-                        if message.startswith("Move"):
-                            server_move = message[4:]
-                            my_move = ArtemisClient.server_move_to_my_move(server_move, size)
-                            log("Doing Move: " + str(my_move))
-                            board.do_move(my_move)
-                            if verbose:
-                                board.print()
-                            elif board.get_move_number() % 5 == 0:
-                                print(board.get_move_number(), "\t", remaining_time, sep="")
-                            if self.graphics:
-                                self.graphics_obj.graphics_move(my_move)
-
-                        elif message.startswith("Removed"):
-                            server_move = str(message[8:])
-                            my_move = ArtemisClient.server_move_to_my_move(server_move, size)
-                            log("Doing Initial Move: " + str(my_move))
-                            board.do_move(my_move)
-                            if self.graphics:
-                                self.graphics_obj.graphics_move(my_move)
-
-                        elif message.startswith("Player:"):
-                            log("I won the coin toss" if message[7:] == "1" else "I lost the coin toss")
-
-                        elif message.startswith("Color:"):
-                            my_player = 1 if message[6:] == "BLACK" else -1
-                            log("My player is " + str(my_player))
-
-                        elif message.startswith("Game:"):
-                            game_num = message[5:]
-                            log("Game Number: " + str(game_num))
-
-                        elif message.startswith("Opponent wins!") or message.startswith("You win!"):
-                            log(message)
-                            winner = my_player if message.startswith("You") else -my_player
-                            break
-                        elif message.startswith("Error"):
-                            raise ValueError(message + " | Last response: " + last_response)
-                        else:
-                            print("Unknown message: " + str(message))
-                            raise ValueError(message, "Opponent Crashed")
             except Exception as e:
                 print("Other messages: " + str(messages) + " " + str(e))
         self.s.close()
         pool.close()
+        if ponderer is not None:
+            ponderer.stop()
+            log("Ponder hits: %d/%d" % (ponderer.hits, ponderer.ponders))
         return my_player, winner, board, remaining_time
 
+    @staticmethod
+    def _track_move(ponderer, board, my_player):
+        """
+        Starts pondering after this player's own moves come back from the server
+        """
+        if ponderer is not None and ArtemisClient.last_mover(board) == my_player:
+            ponderer.start(board, my_player)
+
+    @staticmethod
+    def last_mover(board):
+        """
+        :return: the player who made the last move on the board
+        """
+        # Move numbers start at 1 and black makes the odd numbered moves
+        return 1 if board.get_move_number() % 2 == 0 else -1
+
+    @staticmethod
+    def parse_message(message, size):
+        """
+        Parses one message from the server
+        :param message: the message without its line ending
+        :param size: the size of the board
+        :return: (kind, value). The kind is one of the message kinds of this class and the value depends on it: the
+        seconds left on the clock or None for MOVE_REQUEST, the move in the format of Board.do_move for MOVE, True if
+        this player won for COIN_TOSS and GAME_OVER, the player number for COLOR, the game number for GAME and the text
+        of the request or message otherwise.
+        """
+        if "?" in message:
+            request = message[message.index("?") + 1:]
+            if request.startswith("Username"):
+                return ArtemisClient.USERNAME_REQUEST, request
+            if request.startswith("Password"):
+                return ArtemisClient.PASSWORD_REQUEST, request
+            if request.startswith("Opponent"):
+                return ArtemisClient.OPPONENT_REQUEST, request
+            if request.startswith("Move") or request.startswith("Remove"):
+                remaining_time = None
+                if "(" in request:
+                    remaining_time = int(request[request.index("(") + 1:request.index(")")]) / 1000
+                return ArtemisClient.MOVE_REQUEST, remaining_time
+            return ArtemisClient.UNKNOWN_REQUEST, request
+        if message.startswith("Move"):
+            return ArtemisClient.MOVE, ArtemisClient.server_move_to_my_move(message[4:], size)
+        if message.startswith("Removed"):
+            return ArtemisClient.MOVE, ArtemisClient.server_move_to_my_move(message[8:], size)
+        if message.startswith("Player:"):
+            return ArtemisClient.COIN_TOSS, message[7:] == "1"
+        if message.startswith("Color:"):
+            return ArtemisClient.COLOR, 1 if message[6:] == "BLACK" else -1
+        if message.startswith("Game:"):
+            return ArtemisClient.GAME, message[5:]
+        if message.startswith("Opponent wins!") or message.startswith("You win!"):
+            return ArtemisClient.GAME_OVER, message.startswith("You")
+        if message.startswith("Error"):
+            return ArtemisClient.ERROR, message
+        return ArtemisClient.UNKNOWN, message
+
+    @staticmethod
+    def login_response(kind, username, opponent):
+        """
+        :param kind: USERNAME_REQUEST, PASSWORD_REQUEST or OPPONENT_REQUEST
+        :param username: username and password
+        :param opponent: opponent name
+        :return: the response to the request
+        """
+        return str(opponent) if kind == ArtemisClient.OPPONENT_REQUEST else str(username)
+
     def get_message_from_socket(self):
-        m = str(self.s.recv(1024).decode(ArtemisClient.ENCODING))
-        return m[0:-1]
+        """
+        Reads the next message, one line at a time. A message split over two reads is kept until its end arrives and
+        messages after it that arrived in the same read are kept for the next calls, so none are lost.
+        :return: the message without its line ending
+        :raises ConnectionError: if the server closed the connection
+        """
+        while b"\n" not in self._partial:
+            data = self.s.recv(1024)
+            if not data:
+                raise ConnectionError("Server closed connection")
+            self._partial += data
+        line, _newline, self._partial = self._partial.partition(b"\n")
+        return line.decode(ArtemisClient.ENCODING).rstrip("\r")
 
     def send_response_to_socket(self, message):
         try:
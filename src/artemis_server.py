@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+from artemis_client import ArtemisClient
+from board import Board
+
+
+class LocalArtemisServer:
+    """
+    Local stand-in for the Artemis game server, for testing clients offline.
+
+    Speaks the same line based protocol: it sends a version line, asks every connection for its username, password and
+    opponent, pairs connections in the order they log in and then referees one game per pair. The first connection of
+    a pair wins the coin toss and plays BLACK. Each player is asked for moves with ?Remove(<ms>) or ?Move(<ms>) where ms
+    is what is left on their clock, and every move is sent to both players as Removed:<move> or Move<move>. A player
+    who runs out of time or sends an invalid move loses.
+    """
+
+    VERSION = "Konane stand-in server v1.0"
+
+    def __init__(self, size=18, clock_seconds=180, host="127.0.0.1", port=0, verbose=False):
+        """
+        Server constructor
+        :param size: the size of the board
+        :param clock_seconds: the time each player has for the whole game
+        :param host: the address to listen on
+        :param port: the port to listen on, 0 for any free port
+        :param verbose: print every message sent and received
+        """
+        self._size = size
+        self._clock_seconds = clock_seconds
+        self._host = host
+        self._port = port
+        self._verbose = verbose
+        self._server = None
+        self._waiting = None
+        self._logins = 0
+        self._games = 0
+
+    def get_port(self):
+        return self._port
+
+    def get_login_count(self):
+        return self._logins
+
+    async def start(self):
+        """
+        Starts listening for connections
+        :return: the port the server listens on
+        """
+        self._waiting = asyncio.Queue()
+        self._server = await asyncio.start_server(self._login, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        return self._port
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def log(self, text):
+        if self._verbose:
+            print("Server: [%s]" % text)
+
+    async def _send(self, writer, message):
+        self.log("-> " + message)
+        writer.write((message + "\n").encode(ArtemisClient.ENCODING))
+        await writer.drain()
+
+    async def _receive(self, reader, timeout=None):
+        """
+        :return: the next line from a client without its line ending
+        :raises ConnectionError: if the client closed the connection
+        :raises asyncio.TimeoutError: if the timeout passes first
+        """
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if not line:
+            raise ConnectionError("Client closed the connection")
+        message = line.decode(ArtemisClient.ENCODING).rstrip("\r\n")
+        self.log("<- " + message)
+        return message
+
+    async def _login(self, reader, writer):
+        await self._send(writer, LocalArtemisServer.VERSION)
+        names = []
+        for request in ("Username", "Password", "Opponent"):
+            await self._send(writer, "?" + request)
+            names.append(await self._receive(reader))
+        self._logins += 1
+        await self._waiting.put((names[0], reader, writer))
+
+    async def serve_game(self):
+        """
+        Waits for two players to log in and referees a game between them
+        :return: a dict with the names of the black and white players, the winning color (1 for BLACK, -1 for WHITE),
+        the reason the game ended, the moves played and the time left on each clock
+        """
+        black = await self._waiting.get()
+        white = await self._waiting.get()
+        players = {1: black, -1: white}
+        self._games += 1
+        for player, (_name, _reader, writer) in players.items():
+            await self._send(writer, "Game:%d" % self._games)
+            await self._send(writer, "Player:%d" % (1 if player == 1 else 2))
+            await self._send(writer, "Color:%s" % ("BLACK" if player == 1 else "WHITE"))
+
+        board = Board(size=self._size)
+        clocks = {1: float(self._clock_seconds), -1: float(self._clock_seconds)}
+        moves = []
+        player = 1
+        reason = "no moves"
+        while len(board.get_possible_moves(player)) > 0:
+            _name, reader, writer = players[player]
+            request = "Remove" if board.get_move_number() <= 2 else "Move"
+            await self._send(writer, "?%s(%d)" % (request, int(clocks[player] * 1000)))
+            start = time.time()
+            try:
+                response = await self._receive(reader, timeout=clocks[player])
+            except asyncio.TimeoutError:
+                reason = "time"
+                break
+            clocks[player] -= time.time() - start
+            try:
+                move = ArtemisClient.server_move_to_my_move(response, self._size)
+            except (ValueError, IndexError):
+                move = None
+            if move is None or move not in board.get_possible_moves(player):
+                await self._send(writer, "Error:Invalid move %s" % response)
+                reason = "invalid move"
+                break
+            board.do_move(move)
+            moves.append(move)
+            server_move = ArtemisClient.my_move_to_server_move(move, self._size)
+            for _name, _reader, other in players.values():
+                await self._send(other, ("Removed:" if move[1] is None else "Move") + server_move)
+            player *= -1
+
+        winner = -player
+        await self._send(players[winner][2], "You win!")
+        await self._send(players[-winner][2], "Opponent wins!")
+        for _name, _reader, writer in players.values():
+            writer.close()
+        return {
+            "black": black[0],
+            "white": white[0],
+            "winner": winner,
+            "reason": reason,
+            "moves": moves,
+            "clocks": clocks,
+        }
+
+
+def play_local_game(heuristic_obj_1, heuristic_obj_2, size=18, depth=25, clock_seconds=180, processes=1,
+                    verbose=False, ponderer_1=None, ponderer_2=None):
+    """
+    Plays a game between two AsyncArtemisClients through a LocalArtemisServer, all in this process
+    :param heuristic_obj_1: the heuristic of the client that logs in first and plays BLACK
+    :param heuristic_obj_2: the heuristic of the client that plays WHITE
+    :param size: the size of the board
+    :param depth: the maximum search depth of both clients
+    :param clock_seconds: the time each player has for the whole game
+    :param processes: the number of search worker processes of each client
+    :param verbose: print every message sent and received
+    :param ponderer_1: optional Ponderer for the first client
+    :param ponderer_2: optional Ponderer for the second client
+    :return: (the server's result dict, the results of the two clients' play calls)
+    """
+    # Imported here since the client imports the search, which the server doesn't need
+    from async_client import AsyncArtemisClient
+
+    async def run():
+        server = LocalArtemisServer(size=size, clock_seconds=clock_seconds, verbose=verbose)
+        port = await server.start()
+        game = asyncio.ensure_future(server.serve_game())
+        clients = [AsyncArtemisClient(heuristic_obj, username=name, opponent=other, size=size, depth=depth,
+                                      processes=processes, verbose=verbose, connection_index=i, ponderer=ponderer)
+                   for i, (heuristic_obj, name, other, ponderer) in enumerate(((heuristic_obj_1, "1", "2", ponderer_1),
+                                                                               (heuristic_obj_2, "2", "1", ponderer_2)))]
+        first = asyncio.ensure_future(clients[0].play("127.0.0.1", port))
+        # Giving the first client time to log in so it is paired as BLACK
+        while server.get_login_count() == 0 and not first.done():
+            await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(clients[1].play("127.0.0.1", port))
+        results = await asyncio.gather(game, first, second)
+        await server.close()
+        return results[0], results[1:]
+
+    return asyncio.run(run())
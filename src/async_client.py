@@ -0,0 +1,193 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from artemis_client import ArtemisClient
+from board import Board
+from minimax import time_budget_for_move
+from minimax_process import parallel_minimax_pool
+from search_pool import SearchPool
+
+
+class AsyncArtemisClient:
+    """
+    Asyncio version of ArtemisClient.
+
+    Messages are read one line at a time by a reader task that runs for the whole game, so a message split over two
+    reads or two messages in one read are handled, and the time every message arrived is recorded. Searches run on an
+    executor thread so the event loop keeps reading while a search is going, and the time budget of a move is computed
+    from the clock the server sent minus the time since that request arrived.
+    """
+
+    # Seconds of the server clock a game starts with, used until the server reports the clock
+    START_CLOCK = 180
+
+    def __init__(self, heuristic_obj, username=ArtemisClient.USER, opponent=ArtemisClient.OPPONENT, size=18,
+                 depth=25, book=None, processes=None, verbose=False, gui=None, connection_index=0, ponderer=None):
+        """
+        Client constructor
+        :param heuristic_obj: the heuristic to search with
+        :param username: username and password
+        :param opponent: opponent name
+        :param size: the size of the board
+        :param depth: the maximum depth of the search. The search deepens until its share of the remaining clock time
+        is used up.
+        :param book: optional OpeningBook to play from before searching
+        :param processes: the number of search worker processes, defaults to the number of cores
+        :param verbose: log every message
+        :param gui: optional GUI to show the moves on
+        :param connection_index: unique identifier used in logging output
+        :param ponderer: optional Ponderer that searches while the opponent thinks
+        """
+        self._heuristic = heuristic_obj
+        self._username = str(username)
+        self._opponent = str(opponent)
+        self._size = size
+        self._depth = depth
+        self._book = book
+        self._processes = processes
+        self._verbose = verbose
+        self._gui = gui
+        self._connection_index = connection_index
+        self._ponderer = ponderer
+        self._last_reply = None
+
+        self.board = None
+        self.player = 0
+        self.winner = 0
+        self.remaining_time = AsyncArtemisClient.START_CLOCK
+        self.game_number = None
+        self._pool = None
+        self._executor = None
+        self._messages = None
+        self._writer = None
+
+    def log(self, text):
+        if self._verbose:
+            print("Connection %d: [%s]" % (self._connection_index, text))
+
+    async def play(self, host=ArtemisClient.HOST, port=ArtemisClient.PORT):
+        """
+        Connects to the server and plays a game from the point of one player
+        :param host: the server's host name
+        :param port: the server's port
+        :return: (player number of this connection i.e. 1 or -1, winning player, final board state, remaining time)
+        """
+        reader, self._writer = await asyncio.open_connection(host, port)
+        self.board = Board(size=self._size)
+        self.winner = 0
+        self._messages = asyncio.Queue()
+        # The workers are started before the executor thread so they are not forked from a process with threads
+        self._pool = SearchPool(processes=self._processes)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        reading = asyncio.ensure_future(self._read_messages(reader))
+        try:
+            version_message = await self._next_message()
+            self.log("Connected to server version %s" % version_message.split("v")[-1])
+            while self.winner == 0:
+                received, message = await self._next_message(with_time=True)
+                await self.handle_message(message, received)
+        finally:
+            if self._ponderer is not None:
+                self._ponderer.stop()
+                self.log("Ponder hits: %d/%d" % (self._ponderer.hits, self._ponderer.ponders))
+            reading.cancel()
+            self._writer.close()
+            self._executor.shutdown()
+            self._pool.close()
+        return self.player, self.winner, self.board, self.remaining_time
+
+    async def _read_messages(self, reader):
+        """
+        Reads the server's messages one line at a time for as long as the connection is open, queuing each one with
+        the time it arrived. None is queued when the server closes the connection.
+        """
+        while True:
+            line = await reader.readline()
+            if not line:
+                await self._messages.put((time.time(), None))
+                return
+            await self._messages.put((time.time(), line.decode(ArtemisClient.ENCODING).rstrip("\r\n")))
+
+    async def _next_message(self, with_time=False):
+        received, message = await self._messages.get()
+        if message is None:
+            raise ConnectionError("Server closed the connection")
+        self.log("message: " + message)
+        return (received, message) if with_time else message
+
+    async def send(self, response):
+        self.log("Response: " + response)
+        self._writer.write((response + "\r\n").encode(ArtemisClient.ENCODING))
+        await self._writer.drain()
+
+    async def handle_message(self, message, received):
+        """
+        Handles one message from the server
+        :param message: the message without its line ending
+        :param received: the time.time() the message arrived
+        """
+        kind, value = ArtemisClient.parse_message(message, self._size)
+        if kind in ArtemisClient.LOGIN_REQUESTS:
+            await self.send(ArtemisClient.login_response(kind, self._username, self._opponent))
+        elif kind == ArtemisClient.MOVE_REQUEST:
+            if value is not None:
+                self.remaining_time = value
+                self.log("Time Left: " + str(self.remaining_time))
+            # The clock has been running since the request arrived
+            remaining = self.remaining_time - (time.time() - received)
+            move = await self.choose_move(remaining)
+            await self.send(ArtemisClient.my_move_to_server_move(move, self._size))
+        elif kind == ArtemisClient.UNKNOWN_REQUEST:
+            print("Unknown request: " + value)
+        elif kind == ArtemisClient.MOVE:
+            self.log("Doing Move: " + str(value))
+            if not self.board.do_move(value):
+                raise ValueError("The server sent an invalid move: " + message)
+            if self._ponderer is not None:
+                if ArtemisClient.last_mover(self.board) == self.player:
+                    self._ponderer.start(self.board, self.player)
+                else:
+                    self._last_reply = value
+            if self._gui is not None:
+                self._gui.graphics_move(value)
+        elif kind == ArtemisClient.COIN_TOSS:
+            self.log("I won the coin toss" if value else "I lost the coin toss")
+        elif kind == ArtemisClient.COLOR:
+            self.player = value
+            self.log("My player is " + str(self.player))
+        elif kind == ArtemisClient.GAME:
+            self.game_number = value
+            self.log("Game Number: " + str(self.game_number))
+        elif kind == ArtemisClient.GAME_OVER:
+            self.log(message)
+            self.winner = self.player if value else -self.player
+        elif kind == ArtemisClient.ERROR:
+            raise ValueError(message)
+        else:
+            print("Unknown message: " + message)
+
+    async def choose_move(self, remaining_time):
+        """
+        Picks the move to play from the book or with a search on the executor thread
+        :param remaining_time: the seconds left on this player's clock
+        :return: the move
+        """
+        move = self._book.probe(self.board, self.player) if self._book is not None else None
+        if move is not None:
+            self.log("Book move")
+            return move
+        budget = time_budget_for_move(max(0.0, remaining_time), self.board.get_move_number(), self._size)
+        self.log("Time budget: " + str(budget))
+        # The search gets its own copy so nothing the event loop does can change the board under it
+        board = Board(board=self.board)
+        loop = asyncio.get_event_loop()
+        if self._ponderer is not None and self._ponderer.is_pondering():
+            pondered = await loop.run_in_executor(self._executor, lambda: self._ponderer.respond(
+                board, self._last_reply, time_budget=budget))
+            if pondered is not None:
+                self.log("Ponder hit")
+                return pondered[1]
+        _value, move = await loop.run_in_executor(self._executor, lambda: parallel_minimax_pool(
+            board, self.player, self._heuristic, self._depth, pool=self._pool, time_budget=budget))
+        return move
@@ -0,0 +1,324 @@
+import json
+import os
+import random
+import time
+
+from bitboard import BitBoard
+from board import Board
+from heuristic import MoveCountHeuristic, PieceDifferenceHeuristic, MCPDLearningHeuristic, write_file_atomically
+from minimax import alpha_beta, alpha_beta_helper, minimax
+from minimax_process import parallel_minimax_pool
+from ordering import MoveOrderer
+from search_pool import SearchPool
+from search_stats import SearchStats
+from transposition import TranspositionTable
+
+PHASES = ("early", "mid", "late")
+
+# How far through a game each phase's positions are taken, as a fraction of the game's length
+PHASE_FRACTIONS = {"early": 0.1, "mid": 0.45, "late": 0.8}
+
+# Depth of each fixed depth search benchmark
+SEARCH_DEPTHS = {"minimax": 2, "alpha_beta_helper": 3, "alpha_beta": 4, "parallel_minimax_pool": 4}
+
+# A metric more than this fraction worse than the baseline is reported as a regression
+REGRESSION_TOLERANCE = 0.1
+
+DEFAULT_BASELINE = os.path.join("../const", "benchmark_baseline.json")
+
+
+def benchmark_corpus(size=18, games=2, seed=0):
+    """
+    Builds the fixed set of positions every benchmark runs on. Each game is played out with seeded random moves and
+    one position is taken from it at every phase, so the same arguments always give the same positions.
+    :param size: the size of the board
+    :param games: the number of games, and so the number of positions per phase
+    :param seed: the seed of the games
+    :return: a dict from phase to a list of (board, player to move) pairs
+    """
+    rand = random.Random(seed)
+    corpus = {phase: [] for phase in PHASES}
+    while len(corpus["late"]) < games:
+        board = Board(size=size)
+        player = 1
+        history = []
+        while True:
+            moves = board.get_possible_moves(player)
+            if len(moves) == 0:
+                break
+            history.append(Board(board=board))
+            # Sorted so the same seed always gives the same game
+            board.do_move(rand.choice(sorted(moves)))
+            player *= -1
+        if len(history) < 10:
+            continue
+        for phase in PHASES:
+            # Never one of the two removals at the start, which have their own move generators
+            ply = max(2, int(len(history) * PHASE_FRACTIONS[phase]))
+            corpus[phase].append((history[ply], 1 if ply % 2 == 0 else -1))
+    return corpus
+
+
+def corpus_hash(corpus):
+    """
+    :return: a hash of the positions of a corpus, so results measured on different positions aren't compared
+    """
+    h = 0
+    for phase in PHASES:
+        for board, player in corpus[phase]:
+            h = (h * 31 + (board.get_hash() ^ player)) % 2 ** 64
+    return "%016x" % h
+
+
+def _best_time(function, repeat):
+    """
+    :return: the shortest time out of repeat calls of function
+    """
+    best = float("inf")
+    for _i in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _metric(value, unit, higher_is_better):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def benchmark_move_generation(corpus, repeat=5):
+    """
+    Measures move generation on every position of a corpus, both from scratch on freshly loaded boards with an empty
+    line cache and after making each move of the position, as a search does
+    :return: a dict of metrics
+    """
+    positions = [position for phase in PHASES for position in corpus[phase]]
+    data = [(board.get_bitboard().to_bytes(), player) for board, player in positions]
+
+    best = float("inf")
+    for _i in range(repeat):
+        # Loading the boards is not part of the measurement
+        fresh = [(Board.from_bytes(position), player) for position, player in data]
+        # Lines memoized by an earlier repeat or by anything else that generated moves would be cache hits
+        BitBoard.clear_line_cache()
+        start = time.perf_counter()
+        for board, player in fresh:
+            board.get_possible_moves(player)
+        best = min(best, time.perf_counter() - start)
+    metrics = {"movegen_scratch": _metric(len(positions) / best, "positions/s", True)}
+
+    children = 0
+    for board, player in positions:
+        children += len(board.get_possible_moves(player))
+
+    def incremental():
+        for board, player in positions:
+            for move in board.get_possible_moves(player):
+                board.make_move(move)
+                board.get_possible_moves(-player)
+                board.unmake_move()
+    seconds = _best_time(incremental, repeat)
+    metrics["movegen_incremental"] = _metric(children / seconds, "positions/s", True)
+    return metrics
+
+
+def benchmark_move_making(corpus, repeat=5):
+    """
+    Measures playing every move of every position of a corpus, with do_move on a copy of the board as the old searches
+    did and with make_move and unmake_move as the current ones do
+    :return: a dict of metrics
+    """
+    positions = [position for phase in PHASES for position in corpus[phase]]
+    moves = [(board, move) for board, player in positions for move in board.get_possible_moves(player)]
+
+    def copy_do_move():
+        for board, move in moves:
+            Board(board=board).do_move(move)
+
+    def make_unmake():
+        for board, move in moves:
+            board.make_move(move)
+            board.unmake_move()
+    return {
+        "copy_do_move": _metric(len(moves) / _best_time(copy_do_move, repeat), "moves/s", True),
+        "make_unmake": _metric(len(moves) / _best_time(make_unmake, repeat), "moves/s", True),
+    }
+
+
+def benchmark_evaluation(corpus, repeat=5, heuristics=None):
+    """
+    Measures each heuristic on every child of every position of a corpus, one call per child, and in one
+    heuristic_batch call per position for heuristics that support it
+    :param heuristics: the heuristics to measure, defaults to one of each class with its saved constants
+    :return: a dict of metrics
+    """
+    heuristics = heuristics or [MoveCountHeuristic(), PieceDifferenceHeuristic(), MCPDLearningHeuristic()]
+    positions = [position for phase in PHASES for position in corpus[phase]]
+    children = [(board.get_possible_resultant_states(player), player) for board, player in positions]
+    count = sum(len(boards) for boards, _player in children)
+
+    metrics = {}
+    for heuristic_obj in heuristics:
+        name = heuristic_obj.__class__.__name__
+
+        def single():
+            for boards, player in children:
+                for board in boards:
+                    heuristic_obj.heuristic(board, player)
+        metrics["eval_" + name] = _metric(count / _best_time(single, repeat), "evals/s", True)
+
+        if heuristic_obj.BATCH_EVALUATION:
+            def batch():
+                for boards, player in children:
+                    heuristic_obj.heuristic_batch(boards, player)
+            metrics["eval_batch_" + name] = _metric(count / _best_time(batch, repeat), "evals/s", True)
+    return metrics
+
+
+def benchmark_search(corpus, repeat=3, depths=None, processes=None, heuristic_obj=None):
+    """
+    Measures fixed depth searches of every position of a corpus with each search function. The node counts of the
+    alpha beta search, with and without selective extensions and reductions, are recorded too since they only change
+    when the search itself does.
+    :param depths: a dict from search name to depth, defaults to SEARCH_DEPTHS
+    :param processes: the number of workers of the parallel search, defaults to the number of cores
+    :param heuristic_obj: the heuristic to search with, defaults to MoveCountHeuristic
+    :return: a dict of metrics
+    """
+    depths = dict(SEARCH_DEPTHS, **(depths or {}))
+    heuristic_obj = heuristic_obj or MoveCountHeuristic()
+    metrics = {}
+    for phase in PHASES:
+        positions = corpus[phase]
+
+        def run_minimax():
+            for board, player in positions:
+                minimax(board, player, heuristic_obj, depths["minimax"])
+
+        def run_helper():
+            for board, player in positions:
+                alpha_beta_helper(board, player, heuristic_obj, depths["alpha_beta_helper"])
+
+        def run_alpha_beta():
+            for board, player in positions:
+                alpha_beta(board, player, heuristic_obj, depths["alpha_beta"], table=TranspositionTable(16),
+                           orderer=MoveOrderer())
+
+        for name, function in (("minimax", run_minimax), ("alpha_beta_helper", run_helper),
+                               ("alpha_beta", run_alpha_beta)):
+            metrics["%s_%s" % (name, phase)] = _metric(_best_time(function, repeat), "s", False)
+
+        stats = SearchStats()
+        for board, player in positions:
+            alpha_beta(board, player, heuristic_obj, depths["alpha_beta"], table=TranspositionTable(16),
+                       orderer=MoveOrderer(), stats=stats)
+        metrics["alpha_beta_nodes_%s" % phase] = _metric(stats.nodes, "nodes", False)
+
+        stats = SearchStats()
+        for board, player in positions:
+            alpha_beta(board, player, heuristic_obj, depths["alpha_beta"], table=TranspositionTable(16),
+                       orderer=MoveOrderer(), stats=stats, selective=True)
+        metrics["alpha_beta_selective_nodes_%s" % phase] = _metric(stats.nodes, "nodes", False)
+
+    for phase in PHASES:
+        best = float("inf")
+        for _i in range(repeat):
+            # A new pool every time, since workers keep their tables and a second search of a position is much faster
+            with SearchPool(processes=processes) as pool:
+                start = time.perf_counter()
+                for board, player in corpus[phase]:
+                    parallel_minimax_pool(board, player, heuristic_obj, depths["parallel_minimax_pool"], pool=pool)
+                best = min(best, time.perf_counter() - start)
+        metrics["parallel_minimax_pool_%s" % phase] = _metric(best, "s", False)
+    return metrics
+
+
+def run_benchmarks(size=18, games=2, seed=0, repeat=5, search_repeat=3, depths=None, processes=None, verbose=True):
+    """
+    Runs every benchmark on the same corpus
+    :param size: the size of the board
+    :param games: the number of corpus positions per phase
+    :param seed: the seed of the corpus
+    :param repeat: the number of times each move generation, move making and evaluation benchmark is run. The best
+    time is kept.
+    :param search_repeat: the number of times each search benchmark is run
+    :param depths: optional dict from search name to depth, overriding SEARCH_DEPTHS
+    :param processes: the number of workers of the parallel search, defaults to the number of cores
+    :param verbose: print the results as a table
+    :return: a dict with the settings, the corpus hash and a dict of metrics, each with a value, a unit and whether
+    higher is better
+    """
+    corpus = benchmark_corpus(size=size, games=games, seed=seed)
+    metrics = {}
+    metrics.update(benchmark_move_generation(corpus, repeat))
+    metrics.update(benchmark_move_making(corpus, repeat))
+    metrics.update(benchmark_evaluation(corpus, repeat))
+    metrics.update(benchmark_search(corpus, search_repeat, depths, processes))
+    results = {
+        "size": size,
+        "games": games,
+        "seed": seed,
+        "depths": dict(SEARCH_DEPTHS, **(depths or {})),
+        "processes": processes or os.cpu_count(),
+        "corpus": corpus_hash(corpus),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "metrics": metrics,
+    }
+    if verbose:
+        print_results(results)
+    return results
+
+
+def print_results(results):
+    print("%-36s %16s  %s" % ("Benchmark", "Value", "Unit"))
+    for name, metric in results["metrics"].items():
+        print("%-36s %16.4f  %s" % (name, metric["value"], metric["unit"]))
+
+
+def save_results(results, file_name=DEFAULT_BASELINE):
+    write_file_atomically(file_name, json.dumps(results, indent=1))
+
+
+def load_results(file_name=DEFAULT_BASELINE):
+    """
+    :return: results saved with save_results, or None if the file doesn't exist
+    """
+    if not os.path.isfile(file_name):
+        return None
+    with open(file_name, "r") as file:
+        return json.load(file)
+
+
+def compare_results(results, baseline, tolerance=REGRESSION_TOLERANCE, verbose=True):
+    """
+    Compares results against a baseline, metric by metric
+    :param results: the new results
+    :param baseline: the results to compare against, usually loaded with load_results
+    :param tolerance: how much worse than the baseline a metric can be before it counts as a regression
+    :param verbose: print the comparison as a table
+    :return: a dict from metric name to the speedup over the baseline, above 1 if the new result is better. Timings
+    are only comparable when both were measured on the same machine with nothing else running.
+    :raises ValueError: if the results were measured on a different corpus or with different depths
+    """
+    for key in ("corpus", "depths"):
+        if results[key] != baseline[key]:
+            raise ValueError("The results and the baseline have different %s: %s and %s" %
+                             (key, str(results[key]), str(baseline[key])))
+
+    ratios = {}
+    if verbose:
+        print("%-36s %16s %16s %8s" % ("Benchmark", "Baseline", "New", "Speedup"))
+    for name, metric in results["metrics"].items():
+        if name not in baseline["metrics"]:
+            continue
+        old = baseline["metrics"][name]["value"]
+        new = metric["value"]
+        if metric["higher_is_better"]:
+            ratio = new / old if old else float("inf")
+        else:
+            ratio = old / new if new else float("inf")
+        ratios[name] = ratio
+        if verbose:
+            flag = "  REGRESSION" if ratio < 1 - tolerance else ""
+            print("%-36s %16.4f %16.4f %8.2f%s" % (name, old, new, ratio, flag))
+    return ratios
@@ -0,0 +1,507 @@
+import struct
+
+from symmetry import Symmetry
+from zobrist import Zobrist
+
+
+class BitBoard:
+    """
+    Bit-packed Konane position.
+
+    Each player's pieces are stored in a single Python int where square (r, c) is bit r * size + c. Player 1 (black)
+    owns the squares where (r + c) is even at the start of the game, player -1 (white) owns the rest. Moves are made
+    and unmade in place with an undo stack so a search can walk the tree without allocating child positions.
+
+    Once moves are first asked for, the legal moves of both players are kept per line (every row and every column) and
+    make_move only regenerates the lines that cross the squares it changed. The moves of a line only depend on the
+    pieces in it, so they are memoized by line contents. Columns are read from a second, transposed copy of the bits.
+
+    Instances have no __dict__ and copies share everything they can with the original: the bits are immutable ints,
+    the tracked line move lists are never changed in place, and the undo stack is only created by the first make_move.
+
+    Once get_symmetric_hashes is first called, the hashes of the 8 symmetric images of the position are kept up to date
+    by make_move too, from the squares it changed.
+    """
+
+    __slots__ = ("_size", "_black", "_white", "_move_number", "_positives", "_negatives", "_hash", "_full", "_undo",
+                 "_black_t", "_white_t", "_lines", "_move_counts", "_symmetric")
+
+    __MASK_CACHE = {}
+    __LINE_CACHE = {}
+
+    # The line cache is cleared when it grows past this many entries. An entry of an 18x18 board takes about 900 bytes,
+    # so a full cache holds about 30 MB in every process that searches, e.g. each worker of a pool.
+    LINE_CACHE_LIMIT = 2 ** 15
+
+    # size, move number, positives, negatives. Followed by the black and then the white bits.
+    HEADER_FORMAT = "<HIII"
+
+    def __init__(self, size=18, bitboard=None):
+        """
+        BitBoard constructor
+        :param size: the size of the board, defaults to 18
+        :param bitboard: the bitboard to copy for a copy constructor. The undo stack is not copied.
+        """
+        if bitboard is None:
+            if not size % 2 == 0:
+                raise ValueError("Board size must be even")
+            self._size = size
+            self._black, self._white = BitBoard.starting_bits(size)
+            self._move_number = 1
+            self._positives = int((size ** 2) / 2)
+            self._negatives = int((size ** 2) / 2)
+            self._hash = Zobrist.hash_bits(size, self._black, self._white)
+            self._full = (1 << (size ** 2)) - 1
+        else:
+            self._size = bitboard._size
+            self._black = bitboard._black
+            self._white = bitboard._white
+            self._move_number = bitboard._move_number
+            self._positives = bitboard._positives
+            self._negatives = bitboard._negatives
+            self._hash = bitboard._hash
+            self._full = bitboard._full
+        # Created by the first make_move, since most copies are only ever searched from or have one move done on them
+        self._undo = None
+        # Move tracking state, see start_tracking. Line move lists are never changed in place so they can be shared.
+        if bitboard is not None and bitboard._lines is not None:
+            self._black_t = bitboard._black_t
+            self._white_t = bitboard._white_t
+            self._lines = bitboard._lines
+            self._move_counts = bitboard._move_counts
+        else:
+            self._black_t = self._white_t = None
+            self._lines = None
+            self._move_counts = None
+        # Hashes of the symmetric images, see get_symmetric_hashes. Tuples, so they can be shared too.
+        self._symmetric = bitboard._symmetric if bitboard is not None else None
+
+    @staticmethod
+    def starting_bits(size):
+        """
+        Generates the bits of the starting position
+        :param size: one side length of the board
+        :return: (black bits, white bits)
+        """
+        black = 0
+        for r in range(size):
+            for c in range(size):
+                if (r + c) % 2 == 0:
+                    black |= 1 << (r * size + c)
+        return black, ((1 << (size ** 2)) - 1) & ~black
+
+    @staticmethod
+    def from_array(array, move_number=3):
+        """
+        Builds a bitboard from a 2D array in the same format as Board.generate_board
+        :param array: the array to read the position from
+        :param move_number: the move number of the position. Defaults to the first move after the two removals.
+        :return: a new BitBoard
+        """
+        size = len(array)
+        bitboard = BitBoard(size=size)
+        bitboard._black = bitboard._white = 0
+        bitboard._positives = bitboard._negatives = 0
+        for r in range(size):
+            for c in range(size):
+                if array[r][c] == 1:
+                    bitboard._black |= 1 << (r * size + c)
+                    bitboard._positives += 1
+                elif array[r][c] == -1:
+                    bitboard._white |= 1 << (r * size + c)
+                    bitboard._negatives += 1
+        bitboard._move_number = move_number
+        bitboard._hash = Zobrist.hash_bits(size, bitboard._black, bitboard._white)
+        bitboard._symmetric = None
+        return bitboard
+
+    def to_bytes(self):
+        """
+        Packs the position into bytes so it can be shared between processes without pickling. The undo stack is not
+        included.
+        :return: a bytes object that from_bytes turns back into an equal BitBoard
+        """
+        num_bytes = (self._size ** 2 + 7) // 8
+        return struct.pack(BitBoard.HEADER_FORMAT, self._size, self._move_number, self._positives, self._negatives) + \
+            self._black.to_bytes(num_bytes, "little") + self._white.to_bytes(num_bytes, "little")
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Reads a position written by to_bytes
+        :param data: a bytes-like object. Anything past the end of the position is ignored.
+        :return: a new BitBoard
+        """
+        header_bytes = struct.calcsize(BitBoard.HEADER_FORMAT)
+        size, move_number, positives, negatives = struct.unpack_from(BitBoard.HEADER_FORMAT, data)
+        num_bytes = (size ** 2 + 7) // 8
+        bitboard = BitBoard(size=size)
+        bitboard._black = int.from_bytes(data[header_bytes:header_bytes + num_bytes], "little")
+        bitboard._white = int.from_bytes(data[header_bytes + num_bytes:header_bytes + 2 * num_bytes], "little")
+        bitboard._move_number = move_number
+        bitboard._positives = positives
+        bitboard._negatives = negatives
+        bitboard._hash = Zobrist.hash_bits(size, bitboard._black, bitboard._white)
+        bitboard._symmetric = None
+        return bitboard
+
+    @staticmethod
+    def get_byte_size(size):
+        """
+        :return: the number of bytes to_bytes uses for a board of the given size
+        """
+        return struct.calcsize(BitBoard.HEADER_FORMAT) + 2 * ((size ** 2 + 7) // 8)
+
+    @staticmethod
+    def column_masks(size):
+        """
+        Masks used to stop horizontal shifts from wrapping around onto the next row. Cached per board size.
+        :param size: one side length of the board
+        :return: a dict mapping a column offset o to the squares (r, c) where c + o is still on the board
+        """
+        if size not in BitBoard.__MASK_CACHE:
+            masks = {}
+            for offset in range(-size + 1, size):
+                mask = 0
+                for c in range(size):
+                    if 0 <= c + offset < size:
+                        for r in range(size):
+                            mask |= 1 << (r * size + c)
+                masks[offset] = mask
+            BitBoard.__MASK_CACHE[size] = masks
+        return BitBoard.__MASK_CACHE[size]
+
+    def get_size(self):
+        return self._size
+
+    def get_move_number(self):
+        return self._move_number
+
+    def get_hash(self):
+        """
+        :return: the Zobrist hash of the pieces on the board. Kept up to date incrementally by make_move.
+        """
+        return self._hash
+
+    def get_symmetric_hashes(self):
+        """
+        :return: the hashes of the position's images under the 8 symmetries of the board, see Symmetry. Computed the
+        first time and kept up to date incrementally by make_move from then on.
+        """
+        if self._symmetric is None:
+            self._symmetric = Symmetry.hash_bits(self._size, self._black, self._white)
+        return self._symmetric
+
+    def get_bits(self, player):
+        return self._black if player == 1 else self._white
+
+    def get_empty_bits(self):
+        return self._full & ~(self._black | self._white)
+
+    def get_player_piece_count(self, player):
+        if player == 1:
+            return self._positives
+        return self._negatives
+
+    def get(self, r, c):
+        """
+        Gets the value of a single square
+        :return: 1, -1 or 0 if the square is empty
+        """
+        bit = 1 << (r * self._size + c)
+        if self._black & bit:
+            return 1
+        if self._white & bit:
+            return -1
+        return 0
+
+    def to_array(self, use_numpy=True):
+        """
+        Expands the bits into a 2D array in the same format as Board.generate_board
+        :param use_numpy: True for an int8 numpy array, False for a list of lists
+        """
+        n = self._size
+        if use_numpy:
+            import numpy as np
+            num_bytes = (n * n + 7) // 8
+            black, white = [np.unpackbits(np.frombuffer(bits.to_bytes(num_bytes, "little"), dtype=np.uint8),
+                                          bitorder="little")[:n * n].astype(np.int8)
+                            for bits in (self._black, self._white)]
+            return (black - white).reshape((n, n))
+        return [[self.get(r, c) for c in range(n)] for r in range(n)]
+
+    def get_zeros(self):
+        """
+        :return: a set of (row, col) tuples for every empty square
+        """
+        n = self._size
+        return {divmod(i, n) for i in BitBoard.bit_indices(self.get_empty_bits())}
+
+    @staticmethod
+    def bit_indices(bits):
+        """
+        Generator over the indices of the set bits of an int, lowest first
+        """
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    @staticmethod
+    def _shift(bits, offset, full):
+        """
+        Moves bits so that bit i of the result is bit i + offset of the input
+        :param full: the bits of every square of the board, to drop what is shifted off it
+        """
+        if offset >= 0:
+            return bits >> offset
+        return (bits << -offset) & full
+
+    def generate_moves(self, player):
+        """
+        Computes every single and multi jump for a player with whole-board shifts, one jump length at a time.
+        Does not handle the first two removal moves of the game, and does not use or update the tracked moves.
+        :param player: the player to compute moves for
+        :return: a list of moves in the ((r1, c1), (r2, c2)) format
+        """
+        return BitBoard.jumps(self._size, self.get_bits(player), self.get_bits(-player), self.get_empty_bits())
+
+    @staticmethod
+    def jumps(size, own, opp, empty):
+        """
+        Computes every single and multi jump of a set of pieces with whole-board shifts, see generate_moves
+        :param size: one side length of the board
+        :param own: the bits of the pieces to move
+        :param opp: the bits of the pieces that can be jumped
+        :param empty: the bits of the squares that can be landed on
+        :return: a list of moves in the ((r1, c1), (r2, c2)) format
+        """
+        n = size
+        full = (1 << (n * n)) - 1
+        col_masks = BitBoard.column_masks(n)
+        moves = []
+        for step, d_col in ((1, 1), (-1, -1), (n, 0), (-n, 0)):
+            candidates = own
+            jumps = 1
+            while candidates:
+                # A piece can make <jumps> jumps if every odd square along the line is an opponent and every even one
+                # is empty
+                candidates &= BitBoard._shift(opp, step * (2 * jumps - 1), full)
+                candidates &= BitBoard._shift(empty, step * 2 * jumps, full)
+                candidates &= col_masks.get(d_col * 2 * jumps, 0) if d_col else full
+                for i in BitBoard.bit_indices(candidates):
+                    moves.append((divmod(i, n), divmod(i + step * 2 * jumps, n)))
+                jumps += 1
+        return moves
+
+    def get_possible_moves(self, player):
+        """
+        Gets every single and multi jump for a player from the tracked per-line moves. The moves are the same as
+        generate_moves returns, in line order. Does not handle the first two removal moves of the game.
+        :param player: the player to get moves for
+        :return: a list of moves in the ((r1, c1), (r2, c2)) format
+        """
+        if self._lines is None:
+            self.start_tracking()
+        return [move for line in self._lines[player] for move in line]
+
+    def get_move_count(self, player):
+        """
+        :return: the number of moves get_possible_moves would return, without building the list
+        """
+        if self._lines is None:
+            self.start_tracking()
+        return self._move_counts[player]
+
+    def start_tracking(self):
+        """
+        Generates the moves of every line for both players. From here on make_move and unmake_move keep them up to
+        date.
+        """
+        n = self._size
+        self._black_t = self._transpose(self._black)
+        self._white_t = self._transpose(self._white)
+        both = [self._line_moves(line) for line in range(2 * n)]
+        self._lines = {1: [black for black, _white in both], -1: [white for _black, white in both]}
+        self._move_counts = {player: sum(len(line) for line in self._lines[player]) for player in (1, -1)}
+
+    def _transpose(self, bits):
+        n = self._size
+        transposed = 0
+        for i in BitBoard.bit_indices(bits):
+            r, c = divmod(i, n)
+            transposed |= 1 << (c * n + r)
+        return transposed
+
+    @staticmethod
+    def clear_line_cache():
+        """
+        Forgets the moves memoized for every line contents, e.g. to time move generation from scratch
+        """
+        BitBoard.__LINE_CACHE.clear()
+
+    def _line_moves(self, line):
+        """
+        Gets the moves of both players that start and end in one line
+        :param line: 0 to size - 1 for the rows, size to 2 * size - 1 for the columns
+        :return: (tuple of player 1's moves, tuple of player -1's moves)
+        """
+        n = self._size
+        low = (1 << n) - 1
+        if line < n:
+            black = (self._black >> (line * n)) & low
+            white = (self._white >> (line * n)) & low
+        else:
+            black = (self._black_t >> ((line - n) * n)) & low
+            white = (self._white_t >> ((line - n) * n)) & low
+
+        key = (n, line, black, white)
+        both = BitBoard.__LINE_CACHE.get(key)
+        if both is None:
+            both = (self._generate_line_moves(line, black, white), self._generate_line_moves(line, white, black))
+            if len(BitBoard.__LINE_CACHE) >= BitBoard.LINE_CACHE_LIMIT:
+                BitBoard.__LINE_CACHE.clear()
+            BitBoard.__LINE_CACHE[key] = both
+        return both
+
+    def _generate_line_moves(self, line, own, opp):
+        """
+        Generates the moves along one line from the bits of that line alone
+        :return: a tuple of moves
+        """
+        n = self._size
+        moves = []
+        pieces = own | opp
+        for i in BitBoard.bit_indices(own):
+            for d in (1, -1):
+                end = i + 2 * d
+                while 0 <= end < n and opp >> (end - d) & 1 and not pieces >> end & 1:
+                    moves.append((i, end))
+                    end += 2 * d
+        if line < n:
+            return tuple(((line, a), (line, b)) for a, b in moves)
+        return tuple(((a, line - n), (b, line - n)) for a, b in moves)
+
+    def _update_lines(self, squares):
+        """
+        Brings the tracked moves up to date after the given squares changed. Only the rows and columns through the
+        squares are generated again.
+        :param squares: the (row, col) squares that changed
+        """
+        n = self._size
+        old_black, old_white = self._lines[1], self._lines[-1]
+        black_lines, white_lines = list(old_black), list(old_white)
+        black_count, white_count = self._move_counts[1], self._move_counts[-1]
+        for line in {r for r, _c in squares} | {n + c for _r, c in squares}:
+            black_lines[line], white_lines[line] = self._line_moves(line)
+            black_count += len(black_lines[line]) - len(old_black[line])
+            white_count += len(white_lines[line]) - len(old_white[line])
+        self._lines = {1: black_lines, -1: white_lines}
+        self._move_counts = {1: black_count, -1: white_count}
+
+    def _push_undo(self):
+        if self._undo is None:
+            self._undo = []
+        self._undo.append((self._black, self._white, self._move_number, self._positives, self._negatives,
+                           self._hash, self._black_t, self._white_t, self._lines, self._move_counts, self._symmetric))
+
+    def make_move(self, move):
+        """
+        Performs a move in place and pushes the previous position onto the undo stack. Uses the same move format and
+        capture rules as Board.do_move.
+        :param move: the move to perform
+        :return: the success of the move (True or False). Failed moves are not pushed onto the undo stack.
+        """
+        n = self._size
+        (r1, c1), end = move
+        start_bit = 1 << (r1 * n + c1)
+        black_keys, white_keys = Zobrist.keys(n)
+        tracking = self._lines is not None
+
+        if end is None:
+            self._push_undo()
+            if self._black & start_bit:
+                self._positives -= 1
+                self._hash ^= black_keys[r1 * n + c1]
+            elif self._white & start_bit:
+                self._negatives -= 1
+                self._hash ^= white_keys[r1 * n + c1]
+            if self._symmetric is not None:
+                self._symmetric = Symmetry.update_hashes(n, self._symmetric, self._black & start_bit,
+                                                         self._white & start_bit)
+            self._black &= ~start_bit
+            self._white &= ~start_bit
+            self._move_number += 1
+            if tracking:
+                transposed_bit = 1 << (c1 * n + r1)
+                self._black_t &= ~transposed_bit
+                self._white_t &= ~transposed_bit
+                self._update_lines(((r1, c1),))
+            return True
+
+        (r2, c2) = end
+        if not (r1 == r2 or c1 == c2):
+            return False
+        if self._black & start_bit:
+            player = 1
+        elif self._white & start_bit:
+            player = -1
+        else:
+            return False
+
+        self._push_undo()
+        old_black, old_white = self._black, self._white
+        num_captured = int((abs(r1 - r2) + abs(c1 - c2)) / 2)
+        if player == 1:
+            self._negatives -= num_captured
+        else:
+            self._positives -= num_captured
+
+        # Clearing the whole line between the start and end, then placing the moving piece
+        if r1 == r2:
+            squares = [(r1, c) for c in range(min(c1, c2), max(c1, c2) + 1)]
+            low = r1 * n + min(c1, c2)
+            line = ((1 << (abs(c1 - c2) + 1)) - 1) << low
+        else:
+            squares = [(r, c1) for r in range(min(r1, r2), max(r1, r2) + 1)]
+            line = 0
+            for r, c in squares:
+                line |= 1 << (r * n + c)
+        for i in BitBoard.bit_indices(self._black & line):
+            self._hash ^= black_keys[i]
+        for i in BitBoard.bit_indices(self._white & line):
+            self._hash ^= white_keys[i]
+        self._black &= ~line
+        self._white &= ~line
+        if player == 1:
+            self._black |= 1 << (r2 * n + c2)
+            self._hash ^= black_keys[r2 * n + c2]
+        else:
+            self._white |= 1 << (r2 * n + c2)
+            self._hash ^= white_keys[r2 * n + c2]
+        if self._symmetric is not None:
+            self._symmetric = Symmetry.update_hashes(n, self._symmetric, old_black ^ self._black,
+                                                     old_white ^ self._white)
+
+        self._move_number += 1
+        if tracking:
+            transposed_line = 0
+            for r, c in squares:
+                transposed_line |= 1 << (c * n + r)
+            self._black_t &= ~transposed_line
+            self._white_t &= ~transposed_line
+            if player == 1:
+                self._black_t |= 1 << (c2 * n + r2)
+            else:
+                self._white_t |= 1 << (c2 * n + r2)
+            self._update_lines(squares)
+        return True
+
+    def unmake_move(self):
+        """
+        Restores the position, and the tracked moves, from before the last successful make_move
+        """
+        if not self._undo:
+            raise IndexError("unmake_move without a move to take back")
+        (self._black, self._white, self._move_number, self._positives, self._negatives, self._hash,
+         self._black_t, self._white_t, self._lines, self._move_counts, self._symmetric) = self._undo.pop()
@@ -1,10 +1,26 @@
+import struct
+
 import numpy as np
 
+from bitboard import BitBoard
+from movegen import numpy_possible_moves
+
 
 class Board:
+    """
+    Konane board state. Acts as a facade over a BitBoard, which holds the actual position. Searches can either copy
+    boards with the copy constructor or walk the tree in place with make_move and unmake_move.
+
+    Uses __slots__ so a board is only its BitBoard, its size and the cached move lists of each player.
+    """
+
+    __slots__ = ("_bits", "_size", "_black_moves", "_white_moves")
 
     __USE_NUMPY = True
 
+    # BITBOARD or NUMPY, the backend used by get_possible_moves
+    MOVE_GENERATOR = "BITBOARD"
+
     def __init__(self, size=18, board=None):
         """
         Board constructor
@@ -12,23 +28,37 @@ class Board:
         :param board: the board to copy for a copy constructor
         """
         if board is None:
-            self._board = Board.generate_board(size)
-            self._move_number = 1
-            self._size = size
-            self._zeros = set()
+            self._bits = BitBoard(size=size)
         else:
             # Copy constructor
-            old_board = board.get_array()
-            self._size = len(old_board)
-            if Board.__USE_NUMPY:
-                self._board = np.copy(old_board)
-            else:
-                self._board = [[old_board[r][c] for c in range(self._size)] for r in range(self._size)]
-            self._move_number = board.get_move_number()
-            self._zeros = set(board.get_zeros())
-        self._positives = int((size ** 2) / 2)
-        self._negatives = int((size ** 2) / 2)
-        self._moves = {}
+            self._bits = BitBoard(bitboard=board.get_bitboard())
+        self._size = self._bits.get_size()
+        # Move lists from get_possible_moves, kept until the position changes
+        self._black_moves = None
+        self._white_moves = None
+
+    @staticmethod
+    def from_array(array, move_number=3):
+        """
+        Creates a board from a 2D array in the same format as generate_board
+        :param array: the array to read the position from
+        :param move_number: the move number of the position
+        :return: a new Board
+        """
+        board = Board(size=len(array))
+        board._bits = BitBoard.from_array(array, move_number=move_number)
+        return board
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Creates a board from bytes written by BitBoard.to_bytes
+        :param data: the bytes to read the position from
+        :return: a new Board
+        """
+        board = Board(size=struct.unpack_from(BitBoard.HEADER_FORMAT, data)[0])
+        board._bits = BitBoard.from_bytes(data)
+        return board
 
     @staticmethod
     def generate_board(size):
@@ -49,18 +79,31 @@ class Board:
         return board
 
     def get_array(self):
-        return self._board
+        """
+        :return: the board expanded into a 2D array. This is a fresh copy, changing it does not change the board.
+        """
+        return self._bits.to_array(use_numpy=Board.__USE_NUMPY)
+
+    def get_size(self):
+        return self._size
+
+    def get_bitboard(self):
+        return self._bits
 
     def get_zeros(self):
-        return self._zeros
+        return self._bits.get_zeros()
+
+    def get_hash(self):
+        return self._bits.get_hash()
+
+    def get_symmetric_hashes(self):
+        return self._bits.get_symmetric_hashes()
 
     def get_move_number(self):
-        return self._move_number
+        return self._bits.get_move_number()
 
     def get_player_piece_count(self, player):
-        if player == 1:
-            return self._positives
-        return self._negatives
+        return self._bits.get_player_piece_count(player)
 
     def do_move(self, move):
         """
@@ -74,58 +117,28 @@ class Board:
         :param move: the move to perform on the board state
         :return The success of the move (True or False)
         """
-        self._move_number += 1
+        return self.make_move(move)
 
-        if move[1] is None:
-            # Update number of pieces
-            if self._board[move[0][0]][move[0][1]] > 0:
-                self._positives -= 1
-            elif self._board[move[0][0]][move[0][1]] < 0:
-                self._negatives -= 1
-            self._board[move[0][0]][move[0][1]] = 0
-            self._zeros.add(move[0])
-            return True
-
-        ((r1, c1), (r2, c2)) = move
-        if not (r1 == r2 or c1 == c2):
-            return False
-
-        # Saving the attacking player
-        player = self._board[r1][c1]
-        if player != -1 and player != 1:
+    def make_move(self, move):
+        """
+        Performs a move in place so that it can be taken back with unmake_move
+        :param move: the move to perform on the board state
+        :return The success of the move (True or False)
+        """
+        if not self._bits.make_move(move):
             return False
 
-        # Update pieces on the board
-        num_captured = self.captured_pieces_for_move(move)
-        if player == 1:
-            self._negatives -= num_captured
-        elif player == -1:
-            self._positives -= num_captured
-
-        # Logic for computing which pieces have been captured
-        if r1 == r2:
-            # Columns are different:
-            min_col = min(c1, c2)
-            max_col = max(c1, c2)
-            for c in range(min_col, max_col + 1):
-                self._board[r1][c] = 0
-                self._zeros.add((r1, c))
-        else:
-            # Rows are different:
-            min_row = min(r1, r2)
-            max_row = max(r1, r2)
-            for r in range(min_row, max_row + 1):
-                self._board[r][c1] = 0
-                self._zeros.add((r, c1))
-
-        # Placing the piece that did the capturing in its final position
-        self._board[r2][c2] = player
-        self._zeros.remove((r2, c2))
-
         # Resetting the move cache when the board state changes
-        self._moves = {}
+        self._black_moves = self._white_moves = None
         return True
 
+    def unmake_move(self):
+        """
+        Takes back the last move performed with make_move or do_move
+        """
+        self._bits.unmake_move()
+        self._black_moves = self._white_moves = None
+
     def captured_pieces_for_move(self, move):
         """
         Gets the number of captured pieces that a player can take in a given move.
@@ -165,7 +178,7 @@ class Board:
         ((r1, c1), (r2, c2)) = move
 
         # Making sure start is not empty and player is correct if given
-        if (player and self._board[r1][c1] != player) or self._board[r1][c1] == 0:
+        if (player and self._bits.get(r1, c1) != player) or self._bits.get(r1, c1) == 0:
             return False
 
         # Making sure either rows or cols are different
@@ -178,20 +191,20 @@ class Board:
 
         # Finally making sure every other tile is of the opposite player
         if player is None:
-            player = self._board[r1][c1]
+            player = self._bits.get(r1, c1)
         if r1 != r2:
             for r in range(r1 + 1, r2, 2):
-                if self._board[r][c1] != -player:
+                if self._bits.get(r, c1) != -player:
                     return False
             for r in range(r1 + 2, r2 + 1, 2):
-                if self._board[r][c1] != 0:
+                if self._bits.get(r, c1) != 0:
                     return False
         else:
             for c in range(c1 + 1, c2, 2):
-                if self._board[r1][c] != -player:
+                if self._bits.get(r1, c) != -player:
                     return False
             for c in range(c1 + 2, c2 + 1, 2):
-                if self._board[r1][c] != 0:
+                if self._bits.get(r1, c) != 0:
                     return False
 
         # Finally we return true if the move is correct!
@@ -212,9 +225,9 @@ class Board:
         ]
 
     def get_second_moves(self):
-        for r in range(len(self._board)):
-            for c in range(len(self._board[r])):
-                if self._board[r][c] == 0:
+        for r in range(self._size):
+            for c in range(self._size):
+                if self._bits.get(r, c) == 0:
                     moves = []
                     if r > 0:
                         moves.append(((r - 1, c), None))
@@ -231,44 +244,44 @@ class Board:
 
         # Up
         for i in range(r - 2, -1, -2):
-            if self._board[i + 1][c] == -player:
-                if self._board[i][c] == player:
+            if self._bits.get(i + 1, c) == -player:
+                if self._bits.get(i, c) == player:
                     moves.append(((i, c), (r, c)))
                     break
-                elif self._board[i][c] == -player:
+                elif self._bits.get(i, c) == -player:
                     break
             else:
                 break
 
         # Down
         for i in range(r + 2, self._size, 2):
-            if self._board[i - 1][c] == -player:
-                if self._board[i][c] == player:
+            if self._bits.get(i - 1, c) == -player:
+                if self._bits.get(i, c) == player:
                     moves.append(((i, c), (r, c)))
                     break
-                elif self._board[i][c] == -player:
+                elif self._bits.get(i, c) == -player:
                     break
             else:
                 break
 
         # Left
         for i in range(c - 2, -1, -2):
-            if self._board[r][i + 1] == -player:
-                if self._board[r][i] == player:
+            if self._bits.get(r, i + 1) == -player:
+                if self._bits.get(r, i) == player:
                     moves.append(((r, i), (r, c)))
                     break
-                elif self._board[r][i] == -player:
+                elif self._bits.get(r, i) == -player:
                     break
             else:
                 break
 
         # Right
         for i in range(c + 2, self._size, 2):
-            if self._board[r][i - 1] == -player:
-                if self._board[r][i] == player:
+            if self._bits.get(r, i - 1) == -player:
+                if self._bits.get(r, i) == player:
                     moves.append(((r, i), (r, c)))
                     break
-                elif self._board[r][i] == -player:
+                elif self._bits.get(r, i) == -player:
                     break
             else:
                 break
@@ -280,23 +293,63 @@ class Board:
         Returns a list of all possible moves that the given player can perform in the current board state.
         :return a list of moves that can be performed
         """
-        if self._move_number == 1:
+        if self.get_move_number() == 1:
             return self.get_first_moves()
-        if self._move_number == 2:
+        if self.get_move_number() == 2:
             return self.get_second_moves()
 
-        if player in self._moves:
-            return self._moves[player]
+        moves = self._black_moves if player == 1 else self._white_moves
+        if moves is not None:
+            return moves
 
-        moves = set()
-        for r, c, in self._zeros:
-            if self._board[r][c] == 0:
-                moves.update(self._get_moves_for_blank_space(r, c, player))
-        moves = list(moves)
+        if Board.MOVE_GENERATOR == "NUMPY":
+            moves = self.get_possible_moves_numpy(player)
+        else:
+            moves = self._bits.get_possible_moves(player)
 
-        self._moves[player] = moves
+        if player == 1:
+            self._black_moves = moves
+        else:
+            self._white_moves = moves
         return moves
 
+    def get_move_count(self, player=None):
+        """
+        :return: the number of moves get_possible_moves would return. Kept up to date by the bitboard after the first
+        two moves, so this is much cheaper than building the move list.
+        """
+        if self.get_move_number() <= 2 or Board.MOVE_GENERATOR == "NUMPY":
+            return len(self.get_possible_moves(player))
+        return self._bits.get_move_count(player)
+
+    def get_possible_moves_numpy(self, player=None):
+        """
+        Computes the moves for a player with the batched numpy move generator. Returns the same moves as
+        get_possible_moves.
+        :return a list of moves that can be performed
+        """
+        if self.get_move_number() == 1:
+            return self.get_first_moves()
+        if self.get_move_number() == 2:
+            return self.get_second_moves()
+        return numpy_possible_moves(self.get_array(), player)
+
+    def get_possible_moves_scan(self, player=None):
+        """
+        The original move generator, which scans outwards from every empty square one square at a time. Much slower
+        than get_possible_moves but kept as a reference implementation.
+        :return a list of moves that can be performed
+        """
+        if self.get_move_number() == 1:
+            return self.get_first_moves()
+        if self.get_move_number() == 2:
+            return self.get_second_moves()
+
+        moves = set()
+        for r, c, in self.get_zeros():
+            moves.update(self._get_moves_for_blank_space(r, c, player))
+        return list(moves)
+
     def get_possible_resultant_states(self, player, moves=None):
         """
         Returns a list of resultant board states based on the moves given or the possible moves for the given player
@@ -313,16 +366,16 @@ class Board:
 
     def get_num_pieces(self, player=None):
         if player > 0:
-            return self._positives
+            return self.get_player_piece_count(1)
         if player < 0:
-            return self._negatives
+            return self.get_player_piece_count(-1)
 
     def print(self):
         """
         Prints the board neatly
         """
         sep = " "
-        for row in self._board:
+        for row in self.get_array():
             for val in row:
                 if val == -1:
                     print(sep + str(val), end="")
@@ -0,0 +1,535 @@
+import time
+
+from bitboard import BitBoard
+from minimax import SearchTimeout
+
+
+class Game:
+    """
+    A short combinatorial game in canonical form, {left options | right options}, where black is Left and white is
+    Right.
+
+    Games are built with make, which reduces the options to the canonical form by removing dominated options and
+    bypassing reversible ones. Canonical forms are unique, so games are interned and two games are equal exactly when
+    they are the same object. Comparisons and sums of interned games are memoized.
+
+    A game is won by Left moving first unless it is <= 0, and by Right moving first unless it is >= 0. The value of a
+    sum of independent games is the sum of their values, which is what makes the decomposition in RegionDecomposer
+    work.
+    """
+
+    __slots__ = ("left", "right", "index")
+
+    __INTERNED = {}
+    __LE = {}
+    __SUM = {}
+
+    # The comparison and sum memos are cleared when they grow past this many entries. Interned games are kept.
+    MEMO_LIMIT = 2 ** 20
+
+    ZERO = None
+
+    def __init__(self, left, right, index=None):
+        """
+        Game constructor. Use make instead, which returns the interned canonical form.
+        :param left: tuple of Left's options
+        :param right: tuple of Right's options
+        :param index: the intern index, or None for a game that is only used while canonicalizing
+        """
+        self.left = left
+        self.right = right
+        self.index = index
+
+    def __repr__(self):
+        if self is Game.ZERO:
+            return "0"
+        return "{%s|%s}" % (",".join(repr(game) for game in self.left), ",".join(repr(game) for game in self.right))
+
+    @staticmethod
+    def make(left=(), right=()):
+        """
+        Builds a game from its options
+        :param left: Left's options, as interned games
+        :param right: Right's options, as interned games
+        :return: the interned canonical form of {left | right}
+        """
+        left, right = list(set(left)), list(set(right))
+        while True:
+            left = Game._undominated(left, True)
+            right = Game._undominated(right, False)
+            game = Game(tuple(left), tuple(right))
+            new_left, new_right = Game._bypass(game, True), Game._bypass(game, False)
+            if new_left is None and new_right is None:
+                break
+            left = left if new_left is None else new_left
+            right = right if new_right is None else new_right
+        key = (tuple(sorted(option.index for option in left)), tuple(sorted(option.index for option in right)))
+        game = Game.__INTERNED.get(key)
+        if game is None:
+            game = Game(tuple(left), tuple(right), len(Game.__INTERNED))
+            Game.__INTERNED[key] = game
+        return game
+
+    @staticmethod
+    def _undominated(options, left):
+        """
+        :return: the options that no other option is at least as good as for the player choosing between them
+        """
+        if left:
+            return [a for a in options if not any(b is not a and Game.le(a, b) for b in options)]
+        return [a for a in options if not any(b is not a and Game.le(b, a) for b in options)]
+
+    @staticmethod
+    def _bypass(game, left):
+        """
+        Replaces every reversible option of one player with the options it reverses through
+        :return: the new options, or None if none of them were reversible
+        """
+        changed = False
+        options = []
+        for option in (game.left if left else game.right):
+            if left:
+                reversing = next((reply for reply in option.right if Game.le(reply, game)), None)
+            else:
+                reversing = next((reply for reply in option.left if Game.le(game, reply)), None)
+            if reversing is None:
+                options.append(option)
+            else:
+                changed = True
+                options.extend(reversing.left if left else reversing.right)
+        return list(set(options)) if changed else None
+
+    @staticmethod
+    def le(g, h):
+        """
+        :return: True if g <= h, that is if Right moving first can't win h - g
+        """
+        key = None
+        if g.index is not None and h.index is not None:
+            key = (g.index, h.index)
+            result = Game.__LE.get(key)
+            if result is not None:
+                return result
+        result = not any(Game.le(h, option) for option in g.left) and \
+            not any(Game.le(option, g) for option in h.right)
+        if key is not None:
+            if len(Game.__LE) >= Game.MEMO_LIMIT:
+                Game.__LE.clear()
+            Game.__LE[key] = result
+        return result
+
+    def __add__(self, other):
+        if self is Game.ZERO:
+            return other
+        if other is Game.ZERO:
+            return self
+        key = (min(self.index, other.index), max(self.index, other.index))
+        result = Game.__SUM.get(key)
+        if result is None:
+            result = Game.make([option + other for option in self.left] + [self + option for option in other.left],
+                               [option + other for option in self.right] + [self + option for option in other.right])
+            if len(Game.__SUM) >= Game.MEMO_LIMIT:
+                Game.__SUM.clear()
+            Game.__SUM[key] = result
+        return result
+
+    def wins_moving_first(self, player):
+        """
+        :param player: 1 for Left (black), -1 for Right (white)
+        :return: True if player wins the game by moving first
+        """
+        if player == 1:
+            return not Game.le(self, Game.ZERO)
+        return not Game.le(Game.ZERO, self)
+
+    def wins_moving_second(self, player):
+        """
+        :param player: 1 for Left (black), -1 for Right (white)
+        :return: True if player wins the game when the opponent moves first
+        """
+        if player == 1:
+            return Game.le(Game.ZERO, self)
+        return Game.le(self, Game.ZERO)
+
+
+Game.ZERO = Game.make()
+
+
+# The deadline is checked once every this many positions
+CHECK_INTERVAL = 64
+
+# (size, move) -> (origin bit, landing bit, jumped bits, every bit of the line it covers)
+_MOVE_BITS = {}
+
+
+def move_bits(size, move):
+    """
+    :param size: one side length of the board
+    :param move: a move in the ((r1, c1), (r2, c2)) format
+    :return: the bits of the move's origin, its landing square, the squares it jumps over, and every square it covers
+    """
+    key = (size, move)
+    if key not in _MOVE_BITS:
+        (r1, c1), (r2, c2) = move
+        dr, dc = (r2 > r1) - (r2 < r1), (c2 > c1) - (c2 < c1)
+        squares = [1 << ((r1 + dr * i) * size + c1 + dc * i) for i in range(max(abs(r2 - r1), abs(c2 - c1)) + 1)]
+        _MOVE_BITS[key] = (squares[0], squares[-1], sum(squares[1::2]), sum(squares))
+    return _MOVE_BITS[key]
+
+
+def region_moves(size, own, opp, squares):
+    """
+    Generates the jumps of a set of pieces
+    :param size: one side length of the board
+    :param own: the bits of the pieces of the player to move
+    :param opp: the bits of the opponent's pieces
+    :param squares: the bits of the squares that pieces may land on when empty
+    :return: a list of moves in the ((r1, c1), (r2, c2)) format
+    """
+    return BitBoard.jumps(size, own, opp, squares & ~(own | opp))
+
+
+def apply_move(size, own, opp, move):
+    """
+    :return: the (own, opp) bits after the player owning own makes move
+    """
+    origin, landing, jumped, _line = move_bits(size, move)
+    return own & ~origin | landing, opp & ~jumped
+
+
+def _lines(size, bits):
+    """
+    :return: the bits of every row and column that holds one of the bits
+    """
+    row = (1 << size) - 1
+    column = sum(1 << (r * size) for r in range(size))
+    lines = 0
+    for i in BitBoard.bit_indices(bits):
+        lines |= row << (i - i % size) | column << (i % size)
+    return lines
+
+
+def _closure(size, black, white, region, max_positions, deadline=None):
+    """
+    Grows a set of squares until every move that covers one of them, in every position such moves lead to, only
+    covers squares of the set. Only the squares of the set change in those positions.
+    :param size: one side length of the board
+    :param black: the bits of black's pieces
+    :param white: the bits of white's pieces
+    :param region: the bits of the squares to start from
+    :param max_positions: the number of positions to give up after
+    :param deadline: optional time.time() value to raise SearchTimeout at
+    :return: the grown bits tupled with True, or the bits it had grown to so far tupled with False if the moves lead to
+    more than max_positions positions
+    """
+    full = (1 << (size * size)) - 1
+    while True:
+        grown = False
+        black_outside, white_outside = black & ~region, white & ~region
+        # A move that covers a square of the region starts on the same row or column as it
+        lines = _lines(size, region)
+        start = (black & region, white & region)
+        seen = {start}
+        stack = [start]
+        while stack and not grown:
+            black_inside, white_inside = stack.pop()
+            position = (black_outside | black_inside, white_outside | white_inside)
+            empty = full & ~(position[0] | position[1])
+            for player in (1, -1):
+                own, opp = position if player == 1 else position[::-1]
+                for move in BitBoard.jumps(size, own & lines, opp, empty):
+                    line = move_bits(size, move)[3]
+                    if not line & region:
+                        continue
+                    if line & ~region:
+                        region |= line
+                        grown = True
+                        break
+                    own_after, opp_after = apply_move(size, own & region, opp & region, move)
+                    child = (own_after, opp_after) if player == 1 else (opp_after, own_after)
+                    if child not in seen:
+                        if len(seen) >= max_positions:
+                            return region, False
+                        if deadline is not None and len(seen) % CHECK_INTERVAL == 0 and time.time() > deadline:
+                            raise SearchTimeout()
+                        seen.add(child)
+                        stack.append(child)
+                if grown:
+                    break
+        if not grown:
+            return region, True
+
+
+def _close(size, region, other):
+    """
+    :return: True if a jump could cover squares of both regions, because they are within two squares of each other
+    along a row or column
+    """
+    full = (1 << (size * size)) - 1
+    col_masks = BitBoard.column_masks(size)
+    around = region
+    for offset in (1, 2):
+        around |= (region << offset * size) & full | region >> offset * size
+        around |= (region & col_masks[offset]) << offset | (region & col_masks[-offset]) >> offset
+    return around & other != 0
+
+
+def find_regions(size, black, white, max_positions, explored=None, deadline=None):
+    """
+    Splits a position into regions that can't interact for the rest of the game.
+
+    Every move that can be made now starts a region, which is grown with _closure until it holds every square that
+    its moves, and the moves those lead to, cover. Squares outside every region never change. A jump whose squares are
+    all in one region or unchanging only depends on the squares of that region, so two regions are independent as long
+    as no jump can cover squares of both. Regions that are too close for that are merged and grown again.
+
+    :param size: one side length of the board
+    :param black: the bits of black's pieces
+    :param white: the bits of white's pieces
+    :param max_positions: the number of positions the moves of a region may lead to before giving up
+    :param explored: optional dict to remember grown regions in, including the ones that gave up. A region grows the
+    same way as long as the rows and columns it covers hold the same pieces, and most of the board doesn't change from
+    one move to the next, so this should be kept for calls with the same board size.
+    :param deadline: optional time.time() value to raise SearchTimeout at
+    :return: a list of (black, white, squares) bits, the squares of each region and the pieces on them, or None if a
+    region's moves lead to more than max_positions positions
+    """
+    def grow(region):
+        if explored is not None:
+            for grown, complete, lines, pieces in explored.get(region, ()):
+                if (black & lines, white & lines) == pieces:
+                    return grown if complete else None
+        grown, complete = _closure(size, black, white, region, max_positions, deadline)
+        if explored is not None:
+            lines = _lines(size, grown)
+            explored.setdefault(region, []).append((grown, complete, lines, (black & lines, white & lines)))
+        return grown if complete else None
+
+    full = (1 << (size * size)) - 1
+    regions = []
+    for own, opp in ((black, white), (white, black)):
+        for move in BitBoard.jumps(size, own, opp, full & ~(black | white)):
+            line = move_bits(size, move)[3]
+            if any(line & ~region == 0 for region in regions):
+                continue
+            region = grow(line)
+            if region is None:
+                return None
+            regions.append(region)
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if _close(size, regions[i], regions[j]):
+                    region = grow(regions[i] | regions.pop(j))
+                    if region is None:
+                        return None
+                    regions[i] = region
+                    merged = True
+                    break
+            if merged:
+                break
+
+    regions.sort(key=lambda region: region & -region)
+    return [(black & region, white & region, region) for region in regions]
+
+
+class RegionDecomposer:
+    """
+    Solves endgames as sums of independent regions, see find_regions.
+
+    The value of a region is its canonical combinatorial game value, computed by recursing over its moves. The value
+    only depends on the region's pieces and squares, so values are cached with the region moved to the origin. The
+    same small regions come up over and over at the end of a game, and so do the positions that the regions' own moves
+    lead to. The value of a position is the sum of the values of its regions, and the player to move wins if that sum
+    is a first player win for them.
+    """
+
+    # Positions with a region that can reach more positions than this aren't solved, the region's value would take
+    # too long
+    MAX_REGION_POSITIONS = 2048
+
+    # Rough size of one cache entry in bytes, including the key and the dict slot
+    ENTRY_BYTES = 400
+
+    def __init__(self, max_megabytes=16, max_region_positions=MAX_REGION_POSITIONS):
+        """
+        Decomposer constructor
+        :param max_megabytes: the memory cap of the cache of region values. It is emptied when full.
+        :param max_region_positions: positions with a larger region are left to the search
+        """
+        self._max_entries = max(1, int(max_megabytes * 2 ** 20 / RegionDecomposer.ENTRY_BYTES))
+        self._max_region_positions = max_region_positions
+        # (board size, region bits moved to the origin) -> Game
+        self._values = {}
+        # Board size -> the explored argument of find_regions for boards of that size
+        self._explored = {}
+        self._deadline = None
+        self.lookups = 0
+        self.hits = 0
+        self.solves = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def clear(self):
+        self._values = {}
+        self._explored = {}
+
+    def regions(self, board, deadline=None):
+        """
+        :param board: the position
+        :param deadline: optional time.time() value to raise SearchTimeout at
+        :return: the regions of a board where either player has a move, see find_regions, or None if one of them is
+        larger than the maximum
+        """
+        explored = self._explored.setdefault(board.get_size(), {})
+        if len(explored) >= self._max_entries:
+            explored.clear()
+        bits = board.get_bitboard()
+        return find_regions(board.get_size(), bits.get_bits(1), bits.get_bits(-1),
+                            max_positions=self._max_region_positions, explored=explored, deadline=deadline)
+
+    def solve(self, board, player, deadline=None):
+        """
+        Solves a position by adding up the values of its regions
+        :param board: the position, after the two removal moves
+        :param player: the player whose turn it is
+        :param deadline: optional time.time() value to give up at
+        :return: (True, winning move) if player wins with best play, (False, None) if player loses whatever they do,
+        or None if a region is too large to solve or the deadline was reached first
+        """
+        if board.get_move_number() <= 2:
+            return None
+        self._deadline = deadline
+        try:
+            solved = self._solve(board, player)
+        except SearchTimeout:
+            return None
+        if solved is not None:
+            self.solves += 1
+        return solved
+
+    def _solve(self, board, player):
+        regions = self.regions(board, self._deadline)
+        if regions is None:
+            return None
+        size = board.get_size()
+        values = [self._region_value(size, *region) for region in regions]
+        total = Game.ZERO
+        for value in values:
+            total += value
+        if not total.wins_moving_first(player):
+            return False, None
+
+        for i, (region_black, region_white, region_squares) in enumerate(regions):
+            rest = Game.ZERO
+            for j, value in enumerate(values):
+                if j != i:
+                    rest += value
+            own, opp = (region_black, region_white) if player == 1 else (region_white, region_black)
+            for move in region_moves(size, own, opp, region_squares):
+                own_after, opp_after = apply_move(size, own, opp, move)
+                if player == 1:
+                    after = self._region_value(size, own_after, opp_after, region_squares)
+                else:
+                    after = self._region_value(size, opp_after, own_after, region_squares)
+                if (after + rest).wins_moving_second(player):
+                    return True, move
+        raise ValueError("No winning move found in a won position")
+
+    def _region_value(self, size, black, white, squares):
+        """
+        :return: the value of a region, or of a position its moves lead to, from the cache if a region of the same
+        shape was seen before
+        """
+        # Moving the region up and left until it touches the first row and column doesn't wrap any square around
+        offset = (squares & -squares).bit_length() - 1
+        offset -= offset % size - min(i % size for i in BitBoard.bit_indices(squares))
+        black, white, squares = black >> offset, white >> offset, squares >> offset
+        key = (size, black, white, squares)
+
+        self.lookups += 1
+        value = self._values.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        if self._deadline is not None and self.lookups % CHECK_INTERVAL == 0 and time.time() > self._deadline:
+            raise SearchTimeout()
+        left_options = [self._region_value(size, *apply_move(size, black, white, move), squares)
+                        for move in region_moves(size, black, white, squares)]
+        right_options = [self._region_value(size, *reversed(apply_move(size, white, black, move)), squares)
+                         for move in region_moves(size, white, black, squares)]
+        value = Game.make(left_options, right_options)
+        if len(self._values) >= self._max_entries:
+            self._values = {}
+        self._values[key] = value
+        return value
+
+
+def fuzz_against_search(trials=30, seed=0, size=8):
+    """
+    Checks the decomposition against a plain search to the end of the game on random positions close to the end
+    :param trials: the number of positions to check
+    :param seed: the seed for the random positions
+    :param size: the size of the board
+    :return: the number of positions checked
+    :raises ValueError: if the regions miss a move of the board, or the decomposer disagrees with the full search or
+    returns a move that doesn't win
+    """
+    # Only the fuzz needs these
+    import random
+    from board import Board
+
+    known = {}
+
+    def wins(board, player):
+        key = (board.get_bitboard().to_bytes(), player)
+        if key not in known:
+            known[key] = False
+            for move in board.get_possible_moves(player):
+                board.make_move(move)
+                won = not wins(board, -player)
+                board.unmake_move()
+                if won:
+                    known[key] = True
+                    break
+        return known[key]
+
+    rand = random.Random(seed)
+    decomposer = RegionDecomposer(max_megabytes=0.05, max_region_positions=256)
+    checked = 0
+    while checked < trials:
+        board = Board(size=size)
+        player = 1
+        regions = None
+        # Far enough into the game for the plain search to finish quickly and for the regions to be small
+        while len(board.get_possible_moves(player)) > 0:
+            if board.get_move_number() >= size ** 2 // 2:
+                regions = decomposer.regions(board)
+                if regions is not None:
+                    break
+            board.do_move(rand.choice(board.get_possible_moves(player)))
+            player *= -1
+        if regions is None:
+            continue
+        for mover in (1, -1):
+            region_moves_all = sorted(move for region_black, region_white, region_squares in regions
+                                      for move in region_moves(size, *((region_black, region_white)[::mover]),
+                                                               region_squares))
+            if region_moves_all != sorted(board.get_possible_moves(mover)):
+                raise ValueError("The regions have the moves %s instead of %s" %
+                                 (region_moves_all, sorted(board.get_possible_moves(mover))))
+        expected = wins(board, player)
+        won, move = decomposer.solve(board, player)
+        if won != expected:
+            raise ValueError("The decomposition says %s instead of %s" % (won, expected))
+        if won:
+            board.make_move(move)
+            if wins(board, -player):
+                raise ValueError("The decomposition's move %s doesn't win" % str(move))
+            board.unmake_move()
+        checked += 1
+    return checked
@@ -0,0 +1,212 @@
+import time
+
+from cgt import RegionDecomposer
+from minimax import SearchTimeout
+from zobrist import Zobrist
+
+
+class EndgameSolver:
+    """
+    Exact win/loss solver for the end of a game, when few moves are left.
+
+    The player who can't move loses, so a position is won if some move leads to a position lost for the opponent. The
+    solver searches for such a move depth first until the game ends, trying first the moves that leave the opponent
+    the fewest replies, and caches every solved position by hash and side to move. The results don't depend on a
+    heuristic, so one solver can be shared by both players and kept for every game. A position that was solved before,
+    or that a solved position led through, is answered from the cache at once. A solve that runs out of nodes or time
+    keeps the positions it did solve, so the next attempt gets further.
+
+    Before searching, a solve tries to split the board into independent regions and add up their game values with a
+    RegionDecomposer. That answers positions made of several small regions at once, where the search would have to
+    try every interleaving of their moves.
+    """
+
+    # Positions where both players together have at most this many moves are solved instead of searched
+    MOBILITY_THRESHOLD = 12
+
+    # Mobility is low in the opening too, so positions are only solved once this many moves per square of the board
+    # have been played
+    MIN_MOVES_PER_SQUARE = 0.25
+
+    # Nodes a solve may take when the search has no time budget. A solve usually needs far fewer.
+    MAX_NODES = 20000
+
+    # Rough size of one cache entry in bytes, including the dict slot
+    ENTRY_BYTES = 150
+
+    # The deadline is checked once every this many nodes
+    CHECK_INTERVAL = 256
+
+    def __init__(self, max_megabytes=64, mobility_threshold=MOBILITY_THRESHOLD, decompose=True):
+        """
+        Solver constructor
+        :param max_megabytes: the memory cap of the cache of solved positions. It is emptied when full.
+        :param mobility_threshold: the total number of moves at or below which should_solve is true
+        :param decompose: try to solve positions as sums of independent regions before searching them
+        """
+        self._max_entries = max(1, int(max_megabytes * 2 ** 20 / EndgameSolver.ENTRY_BYTES))
+        self._mobility_threshold = mobility_threshold
+        # Position key -> winning move for the player to move, or None if the position is lost
+        self._solved = {}
+        self._decomposer = RegionDecomposer() if decompose else None
+        self._deadline = None
+        self._max_nodes = None
+        self.nodes = 0
+        self.solves = 0
+        self.proven_wins = 0
+
+    def __len__(self):
+        return len(self._solved)
+
+    def clear(self):
+        self._solved = {}
+        if self._decomposer is not None:
+            self._decomposer.clear()
+
+    def should_solve(self, board, player):
+        """
+        :return: True if the position is late enough in the game to be solved
+        """
+        if board.get_move_number() <= max(2, EndgameSolver.MIN_MOVES_PER_SQUARE * board.get_size() ** 2):
+            return False
+        return board.get_move_count(player) + board.get_move_count(-player) <= self._mobility_threshold
+
+    def probe(self, board, player):
+        """
+        :return: None if the position hasn't been solved, otherwise (True, winning move) or (False, None)
+        """
+        key = board.get_hash() ^ Zobrist.side_key(player)
+        if key not in self._solved:
+            return None
+        move = self._solved[key]
+        return move is not None, move
+
+    def solve(self, board, player, deadline=None, max_nodes=None):
+        """
+        Solves a position
+        :param board: the position. Moves are made and unmade on it, and it is left as it was even if the solve gives
+        up.
+        :param player: the player whose turn it is
+        :param deadline: optional time.time() value to give up at
+        :param max_nodes: optional number of nodes to give up after
+        :return: (True, winning move) if player wins with best play, (False, None) if player loses whatever they do,
+        or None if the deadline or node limit was reached first
+        """
+        solved = self.probe(board, player)
+        if solved is not None:
+            return solved
+        if self._decomposer is not None:
+            solved = self._decomposer.solve(board, player, deadline=deadline)
+            if solved is not None:
+                self._store(board.get_hash() ^ Zobrist.side_key(player), solved[1])
+                self.solves += 1
+                self.proven_wins += solved[0]
+                return solved
+        self._deadline = deadline
+        self._max_nodes = None if max_nodes is None else self.nodes + max_nodes
+        played = board.get_move_number()
+        try:
+            won = self._wins(board, player)
+        except SearchTimeout:
+            while board.get_move_number() > played:
+                board.unmake_move()
+            return None
+        self.solves += 1
+        self.proven_wins += won
+        return self.probe(board, player)
+
+    def _wins(self, board, player):
+        """
+        :return: True if player, whose turn it is, wins the position with best play
+        """
+        key = board.get_hash() ^ Zobrist.side_key(player)
+        if key in self._solved:
+            return self._solved[key] is not None
+        self.nodes += 1
+        if self.nodes % EndgameSolver.CHECK_INTERVAL == 0:
+            if self._deadline is not None and time.time() > self._deadline:
+                raise SearchTimeout()
+            if self._max_nodes is not None and self.nodes > self._max_nodes:
+                raise SearchTimeout()
+
+        # Moves leaving the opponent the fewest replies first, since they are the most likely to win
+        children = []
+        for move in board.get_possible_moves(player):
+            board.make_move(move)
+            replies = board.get_move_count(-player)
+            board.unmake_move()
+            if replies == 0:
+                self._store(key, move)
+                return True
+            children.append((replies, move))
+        children.sort(key=lambda child: child[0])
+
+        for _replies, move in children:
+            board.make_move(move)
+            won = not self._wins(board, -player)
+            board.unmake_move()
+            if won:
+                self._store(key, move)
+                return True
+        self._store(key, None)
+        return False
+
+    def _store(self, key, move):
+        if len(self._solved) >= self._max_entries:
+            self._solved = {}
+        self._solved[key] = move
+
+
+def fuzz_against_minimax(trials=30, seed=0, size=6):
+    """
+    Checks the solver against a plain search to the end of the game on random positions close to the end
+    :param trials: the number of positions to check
+    :param seed: the seed for the random positions
+    :param size: the size of the board
+    :return: the number of positions checked
+    :raises ValueError: if the solver disagrees with the full search or returns a move that doesn't win
+    """
+    # Imported here so the solver doesn't depend on the board module
+    import random
+    from board import Board
+
+    # Keyed by the position bytes instead of the hash, so hash collisions in the solver would show up
+    known = {}
+
+    def wins(board, player):
+        key = (board.get_bitboard().to_bytes(), player)
+        if key not in known:
+            known[key] = False
+            for move in board.get_possible_moves(player):
+                board.make_move(move)
+                won = not wins(board, -player)
+                board.unmake_move()
+                if won:
+                    known[key] = True
+                    break
+        return known[key]
+
+    rand = random.Random(seed)
+    solver = EndgameSolver(max_megabytes=0.05, decompose=False)
+    checked = 0
+    while checked < trials:
+        board = Board(size=size)
+        player = 1
+        # Far enough into the game for the plain search to finish quickly
+        while len(board.get_possible_moves(player)) > 0 and \
+                (board.get_move_number() < size ** 2 // 2 or not solver.should_solve(board, player)):
+            board.do_move(rand.choice(board.get_possible_moves(player)))
+            player *= -1
+        if len(board.get_possible_moves(player)) == 0:
+            continue
+        expected = wins(board, player)
+        won, move = solver.solve(board, player)
+        if won != expected:
+            raise ValueError("The solver says %s instead of %s" % (won, expected))
+        if won:
+            board.make_move(move)
+            if wins(board, -player):
+                raise ValueError("The solver's move %s doesn't win" % str(move))
+            board.unmake_move()
+        checked += 1
+    return checked
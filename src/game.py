@@ -1,10 +1,21 @@
-from multiprocessing import Pool
+import time
 
 from board import Board
+from endgame import EndgameSolver
+from minimax import alpha_beta, iterative_deepening, knockout_move
+from mcts import mcts_search
 from minimax_process import parallel_minimax_pool
+from ordering import MoveOrderer
+from search_pool import SearchPool
+from search_stats import SearchStats
+from shared_cache import heuristic_salt, SharedCache
+from transposition import TranspositionTable
 
 
-def do_game(heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, player=1, verbose=False):
+def do_game(heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, player=1, verbose=False,
+            table_megabytes=TranspositionTable.DEFAULT_MEGABYTES, time_budget1=None, time_budget2=None, pool=None,
+            book=None, stats_log=None, mcts1=None, mcts2=None, ponder1=None, ponder2=None, selective1=False,
+            selective2=False, symmetric_tables=False):
     """
     Completes a game with the given inputs
     :param heuristic_obj_1: player 1's heuristic
@@ -14,22 +25,66 @@ def do_game(heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, playe
     :param size: the size of the board
     :param player: the starting player
     :param verbose:
+    :param table_megabytes: the memory cap of each pool worker's transposition table. The tables are kept for the
+    whole game so positions analysed on earlier moves are reused. Ignored if a pool is given.
+    :param time_budget1: optional seconds per move for the first heuristic's search. If given, depth1 becomes the
+    maximum depth of an iterative deepening search.
+    :param time_budget2: optional seconds per move for the second heuristic's search
+    :param pool: optional SearchPool to search with. It is left open so it can be reused for the next game.
+    :param book: optional OpeningBook that both sides play from before searching
+    :param stats_log: optional SearchLog that the SearchStats of every searched move are recorded in
+    :param mcts1: optional MCTS that player 1 searches with instead of alpha beta. It uses heuristic_obj_1 for its
+    playouts and searches for time_budget1 seconds, or its default number of iterations without a budget.
+    :param mcts2: optional MCTS that player -1 searches with instead of alpha beta
+    :param ponder1: optional Ponderer that searches for player 1 while player -1 moves. Its hit rate is left on it.
+    :param ponder2: optional Ponderer that searches for player -1 while player 1 moves
+    :param selective1: player 1 extends and reduces its search as described in AlphaBetaSearch
+    :param selective2: player -1 extends and reduces its search
+    :param symmetric_tables: the workers' tables share entries between positions that are symmetric images of each
+    other, see TranspositionTable. Ignored if a pool is given.
     :return: the winning player of the game tupled with the turn count
     """
     board = Board(size=size)
-    pool = Pool()
+    own_pool = pool is None
+    if own_pool:
+        pool = SearchPool(table_megabytes=table_megabytes, symmetric_tables=symmetric_tables)
+    ponderers = {1: ponder1, -1: ponder2}
+    move = None
     while True:
         moves = board.get_possible_moves(player=player)
         if len(moves) == 0:
             break
         h = 0
-        if board.get_move_number() < 2:
+        ponderer = ponderers[player]
+        pondered = None
+        book_move = book.probe(board, player) if book is not None else None
+        if ponderer is not None:
+            if book_move is None and board.get_move_number() >= 2:
+                pondered = ponderer.respond(board, move, depth=depth1 if player == 1 else depth2,
+                                            time_budget=time_budget1 if player == 1 else time_budget2)
+            else:
+                ponderer.stop()
+        if book_move is not None:
+            move = book_move
+        elif board.get_move_number() < 2:
             move = moves[0]
+        elif pondered is not None:
+            h, move = pondered
+        elif (mcts1 if player == 1 else mcts2) is not None:
+            if player == 1:
+                h, move = mcts_search(board, player, heuristic_obj_1, time_budget=time_budget1, engine=mcts1)
+            else:
+                h, move = mcts_search(board, player, heuristic_obj_2, time_budget=time_budget2, engine=mcts2)
         else:
+            stats = SearchStats() if stats_log is not None else None
             if player == 1:
-                h, move = parallel_minimax_pool(board, player, heuristic_obj_1, depth1, pool=pool)
+                h, move = parallel_minimax_pool(board, player, heuristic_obj_1, depth1, pool=pool,
+                                                time_budget=time_budget1, stats=stats, selective=selective1)
             else:
-                h, move = parallel_minimax_pool(board, player, heuristic_obj_2, depth2, pool=pool)
+                h, move = parallel_minimax_pool(board, player, heuristic_obj_2, depth2, pool=pool,
+                                                time_budget=time_budget2, stats=stats, selective=selective2)
+            if stats is not None:
+                stats_log.record(board.get_move_number(), player, move, h, stats)
 
         if verbose:
             print("\n")
@@ -41,12 +96,112 @@ def do_game(heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, playe
 
         if not board.do_move(move):
             raise ValueError("Invalid move: " + str(move))
+        if ponderer is not None:
+            ponderer.start(board, player)
         player *= -1
-    pool.close()
+    for ponderer in ponderers.values():
+        if ponderer is not None:
+            ponderer.stop()
+    if own_pool:
+        pool.close()
     return -player, board.get_move_number()
 
 
-def do_games(game_number, heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, verbose=False):
+def do_serial_game(heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, player=1,
+                   table_megabytes=TranspositionTable.DEFAULT_MEGABYTES, time_budget1=None, time_budget2=None,
+                   opening=(), book=None, cache_file=None, stats_log=None, selective1=False, selective2=False,
+                   solve_endgames=True, symmetric_tables=False, moves_log=None):
+    """
+    Completes a game in this process only, for running many games side by side in a process pool. Each side searches
+    with its own transposition table and move orderer, kept for the whole game.
+    :param heuristic_obj_1: player 1's heuristic
+    :param heuristic_obj_2: player -1's heuristic
+    :param depth1: the depth of the first heuristic's search
+    :param depth2: the depth of the second heuristic's search
+    :param size: the size of the board
+    :param player: the starting player
+    :param table_megabytes: the memory cap of each side's transposition table
+    :param time_budget1: optional seconds per move for the first heuristic's search. If given, depth1 becomes the
+    maximum depth of an iterative deepening search.
+    :param time_budget2: optional seconds per move for the second heuristic's search
+    :param opening: moves to play before either side starts searching, starting with player
+    :param book: optional OpeningBook that both sides play from before searching
+    :param cache_file: optional SharedCache file that both sides use as their table instead of a private one, so
+    games running at the same time share their results
+    :param stats_log: optional SearchLog that the SearchStats of every searched move are recorded in
+    :param selective1: player 1 extends and reduces its search as described in AlphaBetaSearch
+    :param selective2: player -1 extends and reduces its search
+    :param solve_endgames: once few moves are left, both sides try to solve the position exactly before searching,
+    sharing one EndgameSolver since its results don't depend on the heuristic
+    :param symmetric_tables: both sides' tables share entries between positions that are symmetric images of each
+    other, see TranspositionTable
+    :param moves_log: optional list that every move played after the opening is appended to, as (move, seconds spent
+    choosing it)
+    :return: the winning player of the game tupled with the turn count
+    """
+    board = Board(size=size)
+    solver = EndgameSolver() if solve_endgames else None
+    for move in opening:
+        if not board.do_move(move):
+            raise ValueError("Invalid opening move: " + str(move))
+        player *= -1
+    if cache_file is not None:
+        tables = [SharedCache(cache_file, max_megabytes=table_megabytes, salt=heuristic_salt(heuristic_obj),
+                              symmetric=symmetric_tables)
+                  for heuristic_obj in (heuristic_obj_1, heuristic_obj_2)]
+    else:
+        tables = [TranspositionTable(table_megabytes, symmetric=symmetric_tables) for _i in range(2)]
+    sides = {
+        1: (heuristic_obj_1, depth1, time_budget1, tables[0], MoveOrderer(), selective1),
+        -1: (heuristic_obj_2, depth2, time_budget2, tables[1], MoveOrderer(), selective2),
+    }
+    while True:
+        move_start = time.time()
+        moves = board.get_possible_moves(player=player)
+        if len(moves) == 0:
+            break
+        book_move = book.probe(board, player) if book is not None else None
+        if book_move is not None:
+            move = book_move
+        elif board.get_move_number() < 2:
+            move = moves[0]
+        else:
+            heuristic_obj, depth, time_budget, table, orderer, selective = sides[player]
+            move = knockout_move(board, player)
+            if move is None and solver is not None and solver.should_solve(board, player):
+                start = time.time()
+                solved = solver.solve(board, player, deadline=None if time_budget is None else start + time_budget / 2,
+                                      max_nodes=EndgameSolver.MAX_NODES if time_budget is None else None)
+                if solved is not None and solved[0]:
+                    move = solved[1]
+                elif time_budget is not None:
+                    time_budget = max(0.0, time_budget - (time.time() - start))
+            if move is None:
+                table.set_generation(board.get_move_number())
+                stats = SearchStats() if stats_log is not None else None
+                if time_budget is None:
+                    orderer.new_search()
+                    value, move = alpha_beta(board, player, heuristic_obj, depth, table=table, orderer=orderer,
+                                             stats=stats, selective=selective)[:2]
+                else:
+                    value, move = iterative_deepening(board, player, heuristic_obj, time_budget, max_depth=depth,
+                                                      table=table, orderer=orderer, stats=stats,
+                                                      selective=selective)[:2]
+                if stats is not None:
+                    stats_log.record(board.get_move_number(), player, move, value, stats)
+
+        if not board.do_move(move):
+            raise ValueError("Invalid move: " + str(move))
+        if moves_log is not None:
+            moves_log.append((move, time.time() - move_start))
+        player *= -1
+    if cache_file is not None:
+        for table in tables:
+            table.close()
+    return -player, board.get_move_number()
+
+
+def do_games(game_number, heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5, size=18, verbose=False, book=None):
     """
     Plays <game_number> games and reports on statistics for all of them
     :param game_number: the number of games to play
@@ -56,19 +211,23 @@ def do_games(game_number, heuristic_obj_1, heuristic_obj_2, depth1=5, depth2=5,
     :param depth2: the second depth
     :param size: the size of the board
     :param verbose: the verbosity of the individual games
+    :param book: optional OpeningBook that both sides play from before searching
     :return: player1 win count, player2 win count, total number of moves played
     """
     wins1 = 0
     wins2 = 0
     total_move_numbers = 0
     player = 1
-    for i in range(game_number):
-        winner, move_number = do_game(heuristic_obj_1, heuristic_obj_2, depth1, depth2, size, player, verbose)
-        if winner == 1:
-            wins1 += 1
-        else:
-            wins2 += 1
-        total_move_numbers += move_number
-        player *= -1
-        print()
+    # One pool for every game so the workers and their tables are only set up once
+    with SearchPool() as pool:
+        for i in range(game_number):
+            winner, move_number = do_game(heuristic_obj_1, heuristic_obj_2, depth1, depth2, size, player, verbose,
+                                          pool=pool, book=book)
+            if winner == 1:
+                wins1 += 1
+            else:
+                wins2 += 1
+            total_move_numbers += move_number
+            player *= -1
+            print()
     return wins1, wins2, total_move_numbers
@@ -1,6 +1,24 @@
 import os
 import random
 
+import numpy as np
+
+from movegen import numpy_move_counts
+
+
+def write_file_atomically(file_name, text):
+    """
+    Writes a whole file at once by writing to a temporary file in the same folder and renaming it over the old one
+    :param file_name: the file to write
+    :param text: the new contents of the file, a str or bytes
+    """
+    temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+    with open(temp_name, "wb" if isinstance(text, bytes) else "w") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_name, file_name)
+
 
 class Heuristic:
     """
@@ -15,6 +33,9 @@ class Heuristic:
     __UNIFORM_LOWER = 0
     __UNIFORM_UPPER = 1
 
+    # True if heuristic_batch is faster than calling heuristic on each board
+    BATCH_EVALUATION = False
+
     def __init__(self, randomized_constraints=[], randomness=False):
         """
         Constructor to initialize a new heuristic
@@ -42,6 +63,16 @@ class Heuristic:
         """
         return 0
 
+    def heuristic_batch(self, boards, player):
+        """
+        Evaluates many board states for the same player at once. Override this along with BATCH_EVALUATION when a
+        heuristic can be vectorized.
+        :param boards: a list of boards
+        :param player: the player to evaluate the board states for
+        :return: a numpy array of heuristic values, one per board
+        """
+        return np.array([self.heuristic(board, player) for board in boards], dtype=np.float64)
+
     def get_file_name(self):
         return os.path.join(Heuristic.__CONST_FOLDER, self.__class__.__name__ + ".const")
 
@@ -63,12 +94,11 @@ class Heuristic:
 
     def save_constants_to_file(self, file_name=None):
         """
-        Saves the current static values to a file
+        Saves the current static values to a file. The file is written under a temporary name and then renamed, so
+        readers in other processes never see it half written.
         """
         lines = ["%s=%f\n" % (key, self._constraints[key]) for key in self._constraints.keys()]
-        with open(file_name if file_name else self.get_file_name(), "w+") as file:
-            file.writelines(lines)
-            file.close()
+        write_file_atomically(file_name if file_name else self.get_file_name(), "".join(lines))
 
     def save_data_point(self):
         with open(self.get_file_name() + ".csv", "a+") as file:
@@ -107,7 +137,7 @@ class Heuristic:
 class MoveCountHeuristic(Heuristic):
 
     def heuristic(self, board, player):
-        return len(board.get_possible_moves(player))
+        return board.get_move_count(player)
 
 
 class PieceDifferenceHeuristic(Heuristic):
@@ -125,18 +155,38 @@ class MCPDLearningHeuristic(Heuristic):
     consistently.
     """
 
+    BATCH_EVALUATION = True
+
     def __init__(self, randomness=False):
         super(MCPDLearningHeuristic, self).__init__(randomized_constraints=["mc1", "mc2", "pd1", "pd2"], randomness=randomness)
         self.move_count_h = MoveCountHeuristic()
         self.piece_diff_h = PieceDifferenceHeuristic()
 
     def heuristic(self, board, player):
-        n = board.get_move_number()
         move_count = self.move_count_h.heuristic(board, player)
         piece_diff = self.piece_diff_h.heuristic(board, player)
 
-        heuristics = [move_count, move_count, piece_diff, piece_diff]
-        constants = [self["mc1"], self["mc2"], self["pd1"], self["pd2"]]
-        move_nums = [1, 1, 1, 1 ] # [n, -n, n, -n]
-        h = sum([move_nums[i] * constants[i] * heuristics[i] for i in range(len(heuristics))])
-        return h
+        # Added up in the same order as heuristic_batch so both give exactly the same values
+        return self["mc1"] * move_count + self["mc2"] * move_count + self["pd1"] * piece_diff + \
+            self["pd2"] * piece_diff
+
+    def heuristic_batch(self, boards, player):
+        """
+        Evaluates many board states at once. The move counts and piece differences of every board are put in one
+        feature matrix and the constants are applied to all of its rows together. Gives exactly the same values as
+        heuristic.
+        :param boards: a list of boards, or the boards stacked into a (number of boards, size, size) numpy array. Stacked
+        boards must be past the first two removal moves.
+        :param player: the player to evaluate the board states for
+        :return: a numpy array of heuristic values, one per board
+        """
+        if isinstance(boards, np.ndarray):
+            move_count = numpy_move_counts(boards, player)
+            piece_diff = (boards == player).sum(axis=(1, 2)) - (boards == -player).sum(axis=(1, 2))
+        else:
+            move_count = [board.get_move_count(player) for board in boards]
+            piece_diff = [board.get_player_piece_count(player) - board.get_player_piece_count(-player)
+                          for board in boards]
+        features = np.array([move_count, move_count, piece_diff, piece_diff], dtype=np.float64).T
+        constants = np.array([self["mc1"], self["mc2"], self["pd1"], self["pd2"]], dtype=np.float64)
+        return (features * constants).sum(axis=1)
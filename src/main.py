@@ -5,27 +5,59 @@ try:
     from src.board import Board
     from src.heuristic import *
     from src.artemis_client import ArtemisClient
-    from src.game import do_game, do_games
+    from src.artemis_server import play_local_game
+    from src.ponder import Ponderer
+    from src.training import Tournament, make_heuristic, random_constants
+    from src.match import Match
+    from src.tuning import SPSATuner
+    from src.opening_book import OpeningBook, build_opening_book
+    from src.shared_cache import cache_report
+    from src.benchmark import run_benchmarks, save_results, load_results, compare_results
     from src.GUI import *
 except ModuleNotFoundError:
     from board import Board
     from heuristic import *
     from artemis_client import ArtemisClient
-    from game import do_game, do_games
+    from artemis_server import play_local_game
+    from ponder import Ponderer
+    from training import Tournament, make_heuristic, random_constants
+    from match import Match
+    from tuning import SPSATuner
+    from opening_book import OpeningBook, build_opening_book
+    from shared_cache import cache_report
+    from benchmark import run_benchmarks, save_results, load_results, compare_results
     from GUI import *
 
 """
 Operational Modes
 
 TRAINING:
-Generate a list of random weights 
+Runs self-play tournaments between the current weights and random challengers across every core, keeping the best.
+Every game shares the search cache in CACHE_FILE.
+
+TUNING:
+Tunes the weights with SPSA, playing each iteration's games in parallel and checkpointing to const/ so it can resume
+
+OPENING_BOOK:
+Builds the opening book for the board size from deep searches of every first and second move, used by the other modes
+
+CACHE_REPORT:
+Prints how full the shared search cache is and its hit rate over every process that has used it
+
+BENCHMARK:
+Times move generation, move making, evaluation and fixed depth searches on a seeded set of positions and compares them
+against the baseline in const/. Saves the results as the baseline if there isn't one or BENCHMARK_SAVE_BASELINE is set.
 
 HEURISTIC_COMPETITION:
-Runs a competition between two different heuristics to see which performs better
+Runs a match between two different heuristics across every core to see which performs better. Every game is stored in
+RESULTS_FILE as it finishes, and running the same match again resumes it.
 
 HUMAN_PLAYER:
 Graphics window pops up and the human user can play against the AI
 
+LOCAL_SERVER:
+Plays a game between two asyncio clients through the local stand-in server, to test the server protocol offline
+
 SERVER_ONE_AI_PLAY:
 Code that uses the artemis client class to communicate with the final exam server. Probably won't be a useful mode 
 outside of the final exam date.
@@ -35,7 +67,19 @@ DEPTH = 5
 SIZE = 18
 _X = _Y = 600
 TRAINING_SIZE = 18
-TRAINING_DEPTH = 5
+TRAINING_DEPTH = 2
+TRAINING_CHALLENGERS = 7
+TUNING_ITERATIONS = 200
+BOOK_DEPTH = 6
+BOOK_PLIES = 6
+CACHE_FILE = "../const/search_cache.bin"
+RESULTS_FILE = "../const/matches.sqlite"
+COMPETITION_GAMES = 1000
+COMPETITION_DEPTH = 2
+BENCHMARK_SAVE_BASELINE = False
+LOCAL_CLOCK_SECONDS = 180
+# PREDICT or ALL to search on the opponent's time in the server modes, None to stay idle
+PONDER_MODE = "PREDICT"
 GRAPHICS = True
 USER = "5555"
 OPPONENT = "4444"
@@ -45,57 +89,84 @@ def main(tester=None, test_board=False, test_moves=False):
     __MODE = "TRAINING"
     """Begin Main"""
     if __MODE == "TRAINING":
-        learning_heuristic1 = MCPDLearningHeuristic()
+        champion = MCPDLearningHeuristic()
         session_number = 0
 
         try:
             while True:
                 """
-                Playing training games indefinitely.
+                Playing training tournaments indefinitely.
 
-                Player 1 always has the more favorable heuristic settings
-                If player -1 wins, then player 1 gets player -1's settings and a new set of settings are generated for
-                player -1.
+                Every session the current best settings play a tournament against TRAINING_CHALLENGERS new uniformly
+                random settings, one game per core at a time. The best settings of the tournament are saved and
+                defend in the next session.
                 """
-                learning_heuristic2 = MCPDLearningHeuristic(randomness="UNIFORM")
-                print("Player 1: %s\nPlayer -1: %s" % (str(learning_heuristic1), str(learning_heuristic2)))
-                starting_player = -1 if session_number % 2 == 0 else 1
-                cur = time.time()
-
-                winner, move_count = do_game(learning_heuristic1, learning_heuristic2, depth1=1, depth2=2, size=18,
-                                             player=starting_player, verbose=False)
-                print("\nPlayer %d won in %d turns in %d seconds" % (winner, move_count, time.time() - cur))
-
-                # Checking to see who won, setting the winning value to the first slot, and saving it.
-                if winner == -1:
-                    print("=========> New settings: %s <=========" % str(learning_heuristic2))
-                    learning_heuristic1 = learning_heuristic2
-                    learning_heuristic1.save_constants_to_file()
-                else:
-                    learning_heuristic1.save_data_point()
+                champion_constants = {key: champion[key] for key in champion}
+                candidates = [champion_constants] + [random_constants(champion_constants.keys())
+                                                     for _i in range(TRAINING_CHALLENGERS)]
+                tournament = Tournament(candidates, depth=TRAINING_DEPTH, size=TRAINING_SIZE,
+                                        cache_file=CACHE_FILE)
+                tournament.run_round_robin()
+                tournament.print_standings()
+                tournament.save()
+
+                best = tournament.get_best()
+                if best != champion_constants:
+                    print("=========> New settings: %s <=========" % str(best))
+                champion = make_heuristic(MCPDLearningHeuristic, best)
+                champion.save_data_point()
                 session_number += 1
                 print("Session %d complete\n" % session_number)
 
         except KeyboardInterrupt:
             print("\nNormal Exit, %d training sessions run." % session_number)
+    elif __MODE == "TUNING":
+        """
+        Tunes the learning heuristic's constants with SPSA, one batch of games per iteration across every core. Picks
+        up from the last checkpoint in const/ if there is one.
+        """
+        tuner = SPSATuner(depth=TRAINING_DEPTH, size=TRAINING_SIZE)
+        try:
+            tuner.run(TUNING_ITERATIONS)
+        except KeyboardInterrupt:
+            print("\nNormal Exit, %d iterations run." % tuner.iteration)
+        tuner.save_constants()
+
+    elif __MODE == "OPENING_BOOK":
+        """
+        Builds the opening book for the board size with deep searches across every core and saves it to const/
+        """
+        cur = time.time()
+        book = build_opening_book(size=SIZE, depth=BOOK_DEPTH, plies=BOOK_PLIES, heuristic_obj=MCPDLearningHeuristic())
+        book.save()
+        print("Opening book with %d positions built in %d seconds" % (len(book), time.time() - cur))
+
+    elif __MODE == "CACHE_REPORT":
+        cache_report(CACHE_FILE)
+
+    elif __MODE == "BENCHMARK":
+        results = run_benchmarks()
+        baseline = load_results()
+        if baseline is not None:
+            compare_results(results, baseline)
+        if baseline is None or BENCHMARK_SAVE_BASELINE:
+            save_results(results)
+
     elif __MODE == "HEURISTIC_COMPETITION":
 
-        # Change these to compare different heuristics
+        # Change these to compare different heuristics. A match with other settings needs another name.
         h1 = MoveCountHeuristic()
         h2 = PieceDifferenceHeuristic()
-        total_games = 5
-
-        wins1, wins2, total_turns = do_games(total_games, h1, h2, depth1=5, depth2=5, size=18)
-
-        message = """
-        
-        Heuristic Competition Finished!
-        %d Games played, %d turns played, about %f turns on average per game
-        %d Player 1 wins, about %d%% of the time
-        %d Player -1 wins, about %d%% of the time
-        """ % (total_games, total_turns, total_turns / total_games, wins1, int(wins1 / total_games * 100), wins2,
-               int(wins2 / total_games * 100))
-        print(message)
+        match = Match("MoveCount-PieceDifference-%d" % COMPETITION_DEPTH, h1, h2, depth1=COMPETITION_DEPTH,
+                      depth2=COMPETITION_DEPTH, size=SIZE, book=OpeningBook.load_default(SIZE),
+                      results_file=RESULTS_FILE)
+        try:
+            match.run(COMPETITION_GAMES)
+        except KeyboardInterrupt:
+            print("\nNormal Exit, the finished games are saved and the match resumes from them next time.")
+        print("\n\nHeuristic Competition Finished!")
+        match.print_report()
+        match.close()
 
     elif __MODE == "HUMAN_PLAYER":
         """
@@ -103,6 +174,13 @@ def main(tester=None, test_board=False, test_moves=False):
         """
         pass
 
+    elif __MODE == "LOCAL_SERVER":
+        ponderer = Ponderer(MCPDLearningHeuristic(), mode=PONDER_MODE) if PONDER_MODE else None
+        result, clients = play_local_game(MCPDLearningHeuristic(), MoveCountHeuristic(), size=SIZE, depth=25,
+                                          clock_seconds=LOCAL_CLOCK_SECONDS, verbose=True, ponderer_1=ponderer)
+        print("\n\nGame finished after %d moves, player %d won by %s, remaining time: %s" %
+              (len(result["moves"]), result["winner"], result["reason"], str(result["clocks"])))
+
     elif __MODE == "SERVER_ONE_AI_PLAY":
         pieces = None
         if GRAPHICS:
@@ -111,10 +189,13 @@ def main(tester=None, test_board=False, test_moves=False):
         else:
             client = ArtemisClient()
 
+        ponderer = Ponderer(MCPDLearningHeuristic(), mode=PONDER_MODE) if PONDER_MODE else None
         p, w, b, t = client.do_server_connection(MCPDLearningHeuristic(), 0, verbose=True, username=USER,
                                                  opponent=OPPONENT,
-                                                 depth=25)
+                                                 depth=25, book=OpeningBook.load_default(SIZE), ponderer=ponderer)
         print("\n\nGame finished, played as %d, player %d won, remaining time: %f" % (p, w, t))
+        if ponderer is not None:
+            print("Ponder hit rate: %.2f" % ponderer.get_hit_rate())
         b.print()
 
     else:
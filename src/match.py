@@ -0,0 +1,354 @@
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from statistics import NormalDist
+
+from game import do_serial_game
+from training import random_opening
+
+
+def wilson_interval(wins, games, z=1.96):
+    """
+    Wilson score interval of a win rate, which stays inside [0, 1] and is still sensible for few games or lopsided
+    results
+    :param wins: the number of games won. Draws can't happen in Konane.
+    :param games: the number of games played
+    :param z: the standard normal quantile of the confidence level, 1.96 for 95%
+    :return: (low, high), or (0, 1) if no games were played
+    """
+    if games == 0:
+        return 0.0, 1.0
+    rate = wins / games
+    center = (rate + z ** 2 / (2 * games)) / (1 + z ** 2 / games)
+    spread = z / (1 + z ** 2 / games) * math.sqrt(rate * (1 - rate) / games + z ** 2 / (4 * games ** 2))
+    return max(0.0, center - spread), min(1.0, center + spread)
+
+
+def elo_difference(rate):
+    """
+    :param rate: a win rate
+    :return: the Elo rating difference that the win rate is expected at, or +-inf for a rate of 1 or 0
+    """
+    if rate <= 0:
+        return -float("inf")
+    if rate >= 1:
+        return float("inf")
+    return 400 * math.log10(rate / (1 - rate))
+
+
+def describe_heuristic(heuristic_obj):
+    """
+    :return: a JSON friendly description of a heuristic's class and constants, stored with a match so it can't be
+    resumed with different heuristics
+    """
+    return {"class": heuristic_obj.__class__.__name__,
+            "constants": {key: heuristic_obj[key] for key in sorted(heuristic_obj)}}
+
+
+class ResultsDatabase:
+    """
+    SQLite store of match games.
+
+    A match is a row of settings under a unique name, and every finished game of it is a row with its moves, the
+    seconds spent on each and the result. Games are committed one at a time as they come in, so an interrupted run
+    loses at most the games that were still being played.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS matches (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE NOT NULL,
+            settings TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS games (
+            match_id INTEGER NOT NULL REFERENCES matches (id),
+            game INTEGER NOT NULL,
+            first INTEGER NOT NULL,
+            winner INTEGER NOT NULL,
+            opening INTEGER NOT NULL,
+            move_count INTEGER NOT NULL,
+            seconds REAL NOT NULL,
+            moves TEXT NOT NULL,
+            move_seconds TEXT NOT NULL,
+            finished REAL NOT NULL,
+            PRIMARY KEY (match_id, game)
+        );
+    """
+
+    def __init__(self, file_name):
+        """
+        Opens a results database, creating it if it doesn't exist
+        :param file_name: the SQLite file
+        """
+        self._file_name = file_name
+        self._connection = sqlite3.connect(file_name)
+        self._connection.executescript(ResultsDatabase.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_file_name(self):
+        return self._file_name
+
+    def get_match(self, name, settings):
+        """
+        Finds a match by name, creating it if it doesn't exist
+        :param name: the name of the match
+        :param settings: a JSON friendly dict of the match settings
+        :return: the id of the match
+        :raises ValueError: if the match exists with different settings
+        """
+        text = json.dumps(settings, sort_keys=True)
+        row = self._connection.execute("SELECT id, settings FROM matches WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            if row[1] != text:
+                raise ValueError("Match %s was started with other settings: %s" % (name, row[1]))
+            return row[0]
+        with self._connection:
+            cursor = self._connection.execute("INSERT INTO matches (name, settings, created) VALUES (?, ?, ?)",
+                                              (name, text, time.time()))
+        return cursor.lastrowid
+
+    def get_match_names(self):
+        return [row[0] for row in self._connection.execute("SELECT name FROM matches ORDER BY id")]
+
+    def get_finished_games(self, match_id):
+        """
+        :return: the set of game numbers of the match that are in the database
+        """
+        return {row[0] for row in self._connection.execute("SELECT game FROM games WHERE match_id = ?", (match_id,))}
+
+    def record_game(self, match_id, game, first, winner, opening, moves, move_seconds, seconds):
+        """
+        Stores a finished game
+        :param match_id: the id of the match
+        :param game: the game number within the match
+        :param first: the heuristic that played player 1, 1 or 2
+        :param winner: the heuristic that won, 1 or 2
+        :param opening: the number of moves at the start of the game that were played at random
+        :param moves: every move of the game in order, including the opening
+        :param move_seconds: the seconds spent choosing each move, 0 for the opening
+        :param seconds: the seconds the whole game took
+        """
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (match_id, game, first, winner, opening, len(moves), seconds, json.dumps(moves),
+                                      json.dumps(move_seconds), time.time()))
+
+    def get_results(self, match_id):
+        """
+        :return: a list of (game number, first, winner, move count, seconds) tuples, one per finished game
+        """
+        return self._connection.execute("SELECT game, first, winner, move_count, seconds FROM games "
+                                        "WHERE match_id = ? ORDER BY game", (match_id,)).fetchall()
+
+    def get_moves(self, match_id, game):
+        """
+        :return: the moves of a game as (move, seconds) pairs in the format of Board.do_move, or None if it isn't in
+        the database
+        """
+        row = self._connection.execute("SELECT moves, move_seconds FROM games WHERE match_id = ? AND game = ?",
+                                       (match_id, game)).fetchone()
+        if row is None:
+            return None
+        moves = [(tuple(start), tuple(end) if end is not None else None) for start, end in json.loads(row[0])]
+        return list(zip(moves, json.loads(row[1])))
+
+    def close(self):
+        self._connection.close()
+
+
+def play_match_game(task):
+    """
+    Plays one match game in a worker process
+    :param task: (game number, heuristic playing player 1, heuristic playing player -1, opening moves, keyword
+    arguments of do_serial_game)
+    :return: (game number, winning player, moves, seconds per move, seconds)
+    """
+    game, heuristic_obj_1, heuristic_obj_2, opening, kwargs = task
+    start = time.time()
+    moves_log = []
+    winner, _move_count = do_serial_game(heuristic_obj_1, heuristic_obj_2, player=1, opening=opening,
+                                         moves_log=moves_log, **kwargs)
+    moves = list(opening) + [move for move, _seconds in moves_log]
+    move_seconds = [0.0] * len(opening) + [seconds for _move, seconds in moves_log]
+    return game, winner, moves, move_seconds, time.time() - start
+
+
+class Match:
+    """
+    Batch of games between two heuristics with the results kept in a ResultsDatabase.
+
+    Games are played on a process pool where every worker process plays a single game and exits, so a game that
+    crashes its process or leaks memory can't take the rest of the run with it. If a process dies, the pool is started
+    again and the games that were lost with it are played again. Even games have the first heuristic as player 1 and
+    odd games the second one, and searches have no randomness, so every two games start from the same random opening.
+
+    Every finished game goes into the database as soon as it comes in, and games already in the database are skipped,
+    so running a match again under the same name resumes it, or extends it if more games are asked for.
+    """
+
+    RESULTS_FILE = os.path.join("../const", "matches.sqlite")
+
+    # Confidence level of the intervals in the report
+    CONFIDENCE = 0.95
+
+    # Times the pool is started again after a worker process died before the run gives up
+    MAX_RESTARTS = 3
+
+    def __init__(self, name, heuristic_obj_1, heuristic_obj_2, depth1=2, depth2=2, size=18, time_budget1=None,
+                 time_budget2=None, opening_plies=6, seed=0, processes=None, book=None, cache_file=None,
+                 results_file=RESULTS_FILE):
+        """
+        Match constructor
+        :param name: the name the match is stored under. A match with the same name is resumed, which requires the
+        same settings.
+        :param heuristic_obj_1: the first heuristic
+        :param heuristic_obj_2: the second heuristic
+        :param depth1: the search depth of the first heuristic, or its maximum depth if it has a time budget
+        :param depth2: the search depth of the second heuristic
+        :param size: the size of the board
+        :param time_budget1: optional seconds per move for the first heuristic's search
+        :param time_budget2: optional seconds per move for the second heuristic's search
+        :param opening_plies: the number of random moves every pair of games starts with
+        :param seed: the seed of the openings. Together with the game number it decides each opening, so a resumed
+        match plays the same games it would have without stopping.
+        :param processes: the number of games to play at once, defaults to the number of cores
+        :param book: optional OpeningBook that both sides play from
+        :param cache_file: optional SharedCache file that every game searches with
+        :param results_file: the SQLite file the games are stored in
+        """
+        self._name = name
+        self._heuristics = (heuristic_obj_1, heuristic_obj_2)
+        self._depths = (depth1, depth2)
+        self._time_budgets = (time_budget1, time_budget2)
+        self._size = size
+        self._opening_plies = opening_plies
+        self._seed = seed
+        self._processes = processes or os.cpu_count()
+        self._book = book
+        self._cache_file = cache_file
+        self._database = ResultsDatabase(results_file)
+        # Not including the book or the cache, which only change how fast moves are found
+        self._settings = {
+            "heuristics": [describe_heuristic(heuristic_obj) for heuristic_obj in self._heuristics],
+            "depths": list(self._depths),
+            "time_budgets": list(self._time_budgets),
+            "size": size,
+            "opening_plies": opening_plies,
+            "seed": seed,
+        }
+        self._match_id = self._database.get_match(name, self._settings)
+        self.restarts = 0
+
+    def get_name(self):
+        return self._name
+
+    def get_database(self):
+        return self._database
+
+    def close(self):
+        self._database.close()
+
+    def _opening(self, game):
+        """
+        :return: the random opening of a game, shared by the two games of each pair
+        """
+        return random_opening(self._size, self._opening_plies, random.Random(self._seed * 2 ** 32 + game // 2))
+
+    def _task(self, game):
+        """
+        :return: the play_match_game task of a game number
+        """
+        first = game % 2
+        second = 1 - first
+        kwargs = {
+            "depth1": self._depths[first], "depth2": self._depths[second],
+            "time_budget1": self._time_budgets[first], "time_budget2": self._time_budgets[second],
+            "size": self._size, "book": self._book, "cache_file": self._cache_file,
+        }
+        return game, self._heuristics[first], self._heuristics[second], self._opening(game), kwargs
+
+    def run(self, games, verbose=True):
+        """
+        Plays every game of the match up to the given number that isn't in the database yet
+        :param games: the total number of games the match should have
+        :param verbose: print a line for every finished game
+        :return: the report, see get_report
+        :raises BrokenProcessPool: if worker processes kept dying after MAX_RESTARTS restarts
+        """
+        remaining = sorted(set(range(games)) - self._database.get_finished_games(self._match_id))
+        while remaining:
+            executor = ProcessPoolExecutor(min(self._processes, len(remaining)), max_tasks_per_child=1)
+            try:
+                pending = {executor.submit(play_match_game, self._task(game)): game for game in remaining}
+                while pending:
+                    done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        game = pending.pop(future)
+                        self._record(*future.result(), verbose=verbose)
+                        remaining.remove(game)
+            except BrokenProcessPool:
+                if self.restarts >= Match.MAX_RESTARTS:
+                    raise
+                self.restarts += 1
+                if verbose:
+                    print("A worker process died, playing the %d unfinished games again" % len(remaining))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        return self.get_report()
+
+    def _record(self, game, winner, moves, move_seconds, seconds, verbose=True):
+        first = game % 2 + 1
+        winning_heuristic = first if winner == 1 else 3 - first
+        moves = [[list(start), list(end) if end is not None else None] for start, end in moves]
+        self._database.record_game(self._match_id, game, first, winning_heuristic, self._opening_plies, moves,
+                                   move_seconds, seconds)
+        if verbose:
+            print("Game %d: heuristic %d won as player %d after %d moves in %.1f seconds" %
+                  (game, winning_heuristic, 1 if winning_heuristic == first else -1, len(moves), seconds))
+
+    def get_report(self):
+        """
+        :return: a dict with the number of games, the first heuristic's wins, win rate and its confidence interval
+        overall and by the player it played, the Elo difference the rate is expected at, the average game length and
+        the number of games per hour of playing time
+        """
+        results = self._database.get_results(self._match_id)
+        z = NormalDist().inv_cdf(0.5 + Match.CONFIDENCE / 2)
+        report = {"games": len(results), "wins": sum(winner == 1 for _g, _f, winner, _m, _s in results)}
+        report["win_rate"] = report["wins"] / report["games"] if results else 0.0
+        report["interval"] = wilson_interval(report["wins"], report["games"], z)
+        report["elo"] = elo_difference(report["win_rate"]) if results else 0.0
+        report["elo_interval"] = tuple(elo_difference(rate) for rate in report["interval"])
+        for player, first in ((1, 1), (-1, 2)):
+            side = [winner for _g, game_first, winner, _m, _s in results if game_first == first]
+            wins = sum(winner == 1 for winner in side)
+            report[player] = {"games": len(side), "wins": wins, "win_rate": wins / len(side) if side else 0.0,
+                              "interval": wilson_interval(wins, len(side), z)}
+        report["average_moves"] = sum(moves for _g, _f, _w, moves, _s in results) / len(results) if results else 0.0
+        seconds = sum(seconds for _g, _f, _w, _m, seconds in results)
+        report["games_per_hour"] = len(results) / seconds * 3600 if seconds else 0.0
+        return report
+
+    def print_report(self):
+        report = self.get_report()
+        print("Match %s: %d games, %.1f moves on average, %.0f games per process hour" %
+              (self._name, report["games"], report["average_moves"], report["games_per_hour"]))
+        print("Heuristic 1 won %d (%.1f%%, %.0f%% confidence interval %.1f%% to %.1f%%, Elo %+.0f, %+.0f to %+.0f)" %
+              (report["wins"], 100 * report["win_rate"], 100 * Match.CONFIDENCE, 100 * report["interval"][0],
+               100 * report["interval"][1], report["elo"], *report["elo_interval"]))
+        for player in (1, -1):
+            side = report[player]
+            print("  as player %d: %d of %d (%.1f%%, %.1f%% to %.1f%%)" %
+                  (player, side["wins"], side["games"], 100 * side["win_rate"], 100 * side["interval"][0],
+                   100 * side["interval"][1]))
@@ -0,0 +1,421 @@
+import math
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from board import Board
+from minimax import knockout_move
+from zobrist import Zobrist
+
+# Worker process state of a parallel search: a serial MCTS with the settings of the parent's
+_worker_mcts = None
+# The number of the last root parallel search the worker built its tree for
+_worker_search = None
+
+
+def _init_worker(settings):
+    """
+    Pool initializer that gives each worker its own serial search with the parent's settings
+    :param settings: the keyword arguments of the parent's MCTS, from MCTS.get_settings
+    """
+    global _worker_mcts
+    # Every worker needs its own random numbers or root parallel trees would all be the same
+    settings = dict(settings, seed=None if settings["seed"] is None else settings["seed"] * 7919 + os.getpid())
+    _worker_mcts = MCTS(**settings)
+
+
+def _search_root(task):
+    """
+    Builds a tree from the root in a worker process, for root parallel searches
+    :param task: (root position bytes, player, time.time() deadline or None, iterations, search number)
+    :return: a list of (move, visits, wins) for the children of the root. Empty if the deadline has passed or this
+    worker already built its tree for the search, since the pool may hand one worker several of a search's tasks.
+    """
+    global _worker_search
+    data, player, deadline, iterations, search = task
+    if search == _worker_search:
+        return []
+    time_budget = None
+    if deadline is not None:
+        time_budget = deadline - time.time()
+        if time_budget <= 0:
+            return []
+    _worker_search = search
+    _worker_mcts.search(Board.from_bytes(data), player, time_budget=time_budget, iterations=iterations)
+    return _worker_mcts.get_root_stats()
+
+
+def _simulate(task):
+    """
+    Runs one rollout in a worker process, for tree parallel searches
+    :param task: (leaf position bytes, player to move at the leaf)
+    :return: the result of the rollout for the player to move, from 0 for a loss to 1 for a win
+    """
+    data, player = task
+    return _worker_mcts.simulate(Board.from_bytes(data), player)
+
+
+class MCTSNode:
+    """
+    Node of a Monte Carlo search tree. Holds the statistics of the move that leads to it, with wins counted for the
+    player who made that move.
+    """
+
+    def __init__(self, move, parent, player, key, moves):
+        """
+        Node constructor
+        :param move: the move from the parent to this node, None for the root
+        :param parent: the parent node, None for the root
+        :param player: the player to move at this node
+        :param key: the hash of the position and player to move, used to find the node again when the tree is reused
+        :param moves: the legal moves at this node
+        """
+        self.move = move
+        self.parent = parent
+        self.player = player
+        self.key = key
+        self.untried = list(moves)
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0
+
+    def is_terminal(self):
+        return not self.untried and not self.children
+
+    def best_child(self, exploration):
+        """
+        :return: the child with the highest upper confidence bound (UCT)
+        """
+        log_visits = math.log(self.visits)
+        return max(self.children,
+                   key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+    def most_visited_child(self):
+        return max(self.children, key=lambda child: child.visits)
+
+
+class MCTS:
+    """
+    Monte Carlo tree search with UCT.
+
+    Each iteration walks down the tree choosing children by their upper confidence bound, adds one new node and plays
+    out from it. Playouts are RANDOM moves to the end of the game, GUIDED moves that pick the best of a few random
+    moves by the heuristic, or CUTOFF, a few random moves after which the heuristic value is squashed into a win
+    probability. The move played is the most visited child of the root.
+
+    The tree is kept between searches and the subtree of the position searched next is reused if it is in the tree,
+    normally after one move of each player. With more than one process the search runs either ROOT parallel, where
+    every worker grows its own tree and the root statistics are added up, or TREE parallel, where this process keeps
+    the only tree and workers run the playouts of batches of leaves. Leaves waiting for a playout count as visited
+    losses (virtual loss) so a batch spreads out over the tree.
+
+    Has the same (board, player, heuristic, budget) -> (value, move) shape as parallel_minimax_pool through
+    mcts_search, but values are win probabilities for the player to move.
+    """
+
+    EXPLORATION = 1.4
+    ITERATIONS = 1000
+
+    # Random moves before the heuristic is read in CUTOFF playouts
+    ROLLOUT_DEPTH = 4
+    # Random moves the heuristic picks from at every step of GUIDED playouts
+    ROLLOUT_SAMPLES = 4
+    # Heuristic value that counts as a 73% chance of winning in CUTOFF playouts, 1 / (1 + e^-1)
+    VALUE_SCALE = 4.0
+
+    # Leaves per worker sent out at once in TREE parallel searches
+    LEAVES_PER_WORKER = 4
+
+    def __init__(self, heuristic_obj=None, rollout="RANDOM", exploration=EXPLORATION, rollout_depth=ROLLOUT_DEPTH,
+                 rollout_samples=ROLLOUT_SAMPLES, value_scale=VALUE_SCALE, processes=1, parallel="ROOT", seed=None):
+        """
+        Search constructor
+        :param heuristic_obj: the heuristic of GUIDED and CUTOFF playouts
+        :param rollout: RANDOM, GUIDED or CUTOFF
+        :param exploration: the exploration constant of UCT
+        :param rollout_depth: the number of random moves of CUTOFF playouts
+        :param rollout_samples: the number of moves GUIDED playouts choose from at each step
+        :param value_scale: how the heuristic value of CUTOFF playouts is scaled before it is squashed
+        :param processes: the number of worker processes. 1 searches in this process only.
+        :param parallel: ROOT or TREE, how the search is split between the processes
+        :param seed: optional seed of the random playouts
+        """
+        if rollout not in ("RANDOM", "GUIDED", "CUTOFF"):
+            raise ValueError("%s is an invalid rollout" % str(rollout))
+        if rollout != "RANDOM" and heuristic_obj is None:
+            raise ValueError("%s rollouts need a heuristic" % rollout)
+        if parallel not in ("ROOT", "TREE"):
+            raise ValueError("%s is an invalid parallel mode" % str(parallel))
+        self._heuristic = heuristic_obj
+        self._rollout = rollout
+        self._exploration = exploration
+        self._rollout_depth = rollout_depth
+        self._rollout_samples = rollout_samples
+        self._value_scale = value_scale
+        self._processes = processes
+        self._parallel = parallel
+        self._seed = seed
+        self._rand = random.Random(seed)
+        self._pool = None
+        self._root = None
+        # Numbers the root parallel searches, so a worker can tell the tasks of one search from the next
+        self._searches = 0
+        self.iterations = 0
+        self.reused_visits = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_settings(self):
+        """
+        :return: the constructor arguments of a serial search with the same settings
+        """
+        return {"heuristic_obj": self._heuristic, "rollout": self._rollout, "exploration": self._exploration,
+                "rollout_depth": self._rollout_depth, "rollout_samples": self._rollout_samples,
+                "value_scale": self._value_scale, "seed": self._seed}
+
+    def get_heuristic(self):
+        return self._heuristic
+
+    def set_heuristic(self, heuristic_obj):
+        """
+        Changes the heuristic of the playouts, throwing away the tree and the worker processes built with the old one
+        """
+        if heuristic_obj is self._heuristic:
+            return
+        self._heuristic = heuristic_obj
+        self._root = None
+        self.close()
+
+    def search(self, board, player, time_budget=None, iterations=None):
+        """
+        Searches a position
+        :param board: the root state. Moves are made and unmade on it during the search.
+        :param player: the player whose turn it is at the root state
+        :param time_budget: optional number of seconds to search for
+        :param iterations: optional number of iterations to run. Defaults to ITERATIONS if there is no time budget.
+        :return: (the chance of winning after the best move for player, best move)
+        """
+        if iterations is None and time_budget is None:
+            iterations = MCTS.ITERATIONS
+        moves = board.get_possible_moves(player)
+        if len(moves) == 0:
+            return 0.0, None
+        knockout = knockout_move(board, player)
+        if knockout is not None:
+            return 1.0, knockout
+
+        self._reuse_root(board, player)
+        deadline = None if time_budget is None else time.time() + time_budget
+        if self._processes > 1 and self._parallel == "ROOT":
+            return self._search_root_parallel(board, player, deadline, iterations)
+
+        start = self.iterations
+        while (iterations is None or self.iterations - start < iterations) and \
+                (deadline is None or time.time() < deadline):
+            if self._processes > 1:
+                self._iterate_batch(board)
+            else:
+                self._iterate(board)
+        best = self._root.most_visited_child()
+        return best.wins / best.visits, best.move
+
+    def _reuse_root(self, board, player):
+        """
+        Makes the node of the position the root, if it is within two plies of the current root. Otherwise the tree
+        starts over.
+        """
+        key = board.get_hash() ^ Zobrist.side_key(player)
+        self.reused_visits = 0
+        if self._root is not None:
+            for node in [self._root] + self._root.children + [grandchild for child in self._root.children
+                                                               for grandchild in child.children]:
+                if node.key == key:
+                    node.parent = None
+                    node.move = None
+                    self._root = node
+                    self.reused_visits = node.visits
+                    return
+        self._root = MCTSNode(None, None, player, key, board.get_possible_moves(player))
+
+    def _select(self, board):
+        """
+        Walks down the tree from the root, making the moves on the board, and expands one new node. Every node on the
+        way is counted as visited.
+        :return: (the new node or a terminal node, the number of moves made)
+        """
+        node = self._root
+        node.visits += 1
+        made = 0
+        while not node.untried and node.children:
+            node = node.best_child(self._exploration)
+            board.make_move(node.move)
+            node.visits += 1
+            made += 1
+        if node.untried:
+            move = node.untried.pop(self._rand.randrange(len(node.untried)))
+            board.make_move(move)
+            made += 1
+            player = -node.player
+            child = MCTSNode(move, node, player, board.get_hash() ^ Zobrist.side_key(player),
+                             board.get_possible_moves(player))
+            node.children.append(child)
+            node = child
+            node.visits += 1
+        return node, made
+
+    @staticmethod
+    def _backpropagate(node, result):
+        """
+        Adds a playout result to every node from a leaf up to the root. The visits were already counted by _select.
+        :param node: the leaf the playout started from
+        :param result: the result of the playout for the player to move at the leaf
+        """
+        while node is not None:
+            # Wins are counted for the player who moved into the node
+            node.wins += 1 - result
+            result = 1 - result
+            node = node.parent
+
+    def _iterate(self, board):
+        node, made = self._select(board)
+        result = 0.0 if node.is_terminal() else self.simulate(board, node.player)
+        for _i in range(made):
+            board.unmake_move()
+        MCTS._backpropagate(node, result)
+        self.iterations += 1
+
+    def _iterate_batch(self, board):
+        """
+        Runs one batch of iterations with the playouts on the worker processes
+        """
+        pool = self._get_pool()
+        leaves = []
+        tasks = []
+        for _i in range(self._processes * MCTS.LEAVES_PER_WORKER):
+            node, made = self._select(board)
+            if node.is_terminal():
+                MCTS._backpropagate(node, 0.0)
+            else:
+                leaves.append(node)
+                tasks.append((board.get_bitboard().to_bytes(), node.player))
+            for _j in range(made):
+                board.unmake_move()
+        for node, result in zip(leaves, pool.map(_simulate, tasks)):
+            MCTS._backpropagate(node, result)
+        self.iterations += self._processes * MCTS.LEAVES_PER_WORKER
+
+    def _search_root_parallel(self, board, player, deadline, iterations):
+        """
+        Grows one tree per worker and adds up the statistics of the root children, on top of any reused tree. The
+        workers get the absolute deadline, so a task that starts late can't run past it.
+        :return: (the chance of winning after the best move for player, best move)
+        """
+        pool = self._get_pool()
+        data = board.get_bitboard().to_bytes()
+        per_worker = None if iterations is None else max(1, iterations // self._processes)
+        totals = {child.move: [child.visits, child.wins] for child in self._root.children}
+        self._searches += 1
+        task = (data, player, deadline, per_worker, self._searches)
+        for stats in pool.map(_search_root, [task] * self._processes):
+            for move, visits, wins in stats:
+                total = totals.setdefault(move, [0, 0.0])
+                total[0] += visits
+                total[1] += wins
+            self.iterations += sum(visits for _move, visits, _wins in stats)
+        # The trees are in the workers, so there is nothing to reuse here next time
+        self._root = None
+        if not totals:
+            # Every worker started after the deadline
+            return 0.5, board.get_possible_moves(player)[0]
+        move, (visits, wins) = max(totals.items(), key=lambda item: item[1][0])
+        return wins / visits, move
+
+    def get_root_stats(self):
+        """
+        :return: a list of (move, visits, wins) for the children of the root of the last search
+        """
+        if self._root is None:
+            return []
+        return [(child.move, child.visits, child.wins) for child in self._root.children]
+
+    def simulate(self, board, player):
+        """
+        Plays out a position with the rollout policy. The board is left as it was.
+        :param board: the position to play out
+        :param player: the player to move
+        :return: the result for player, from 0 for a loss to 1 for a win
+        """
+        made = 0
+        to_move = player
+        result = None
+        while result is None:
+            moves = board.get_possible_moves(to_move)
+            if len(moves) == 0:
+                result = 0.0 if to_move == player else 1.0
+            elif self._rollout == "CUTOFF" and made >= self._rollout_depth:
+                value = self._heuristic.heuristic(board, player)
+                result = 1 / (1 + math.exp(-max(-50.0, min(50.0, value / self._value_scale))))
+            else:
+                if self._rollout == "GUIDED":
+                    move = self._guided_move(board, to_move, moves)
+                else:
+                    move = moves[self._rand.randrange(len(moves))]
+                board.make_move(move)
+                made += 1
+                to_move *= -1
+        for _i in range(made):
+            board.unmake_move()
+        return result
+
+    def _guided_move(self, board, player, moves):
+        """
+        :return: the best of ROLLOUT_SAMPLES random moves by the heuristic value for player
+        """
+        best = None
+        best_value = None
+        for move in self._rand.sample(moves, min(self._rollout_samples, len(moves))):
+            board.make_move(move)
+            value = self._heuristic.heuristic(board, player)
+            board.unmake_move()
+            if best is None or value > best_value:
+                best, best_value = move, value
+        return best
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = Pool(self._processes, initializer=_init_worker, initargs=(self.get_settings(),))
+        return self._pool
+
+    def close(self):
+        """
+        Stops the worker processes, if any were started
+        """
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+def mcts_search(board, player, heuristic_obj, time_budget=None, iterations=None, engine=None):
+    """
+    Searches a position with Monte Carlo tree search, in the same shape as parallel_minimax_pool
+    :param board: the root state
+    :param player: the player whose turn it is at the root state
+    :param heuristic_obj: the heuristic of the playouts
+    :param time_budget: optional number of seconds to search for
+    :param iterations: optional number of iterations, defaults to MCTS.ITERATIONS if there is no time budget
+    :param engine: optional MCTS to search with, so its tree and workers are reused. If not specified, a serial search
+    with RANDOM playouts is used, or CUTOFF playouts if there is a heuristic.
+    :return: (the chance of winning after the best move for player, best move)
+    """
+    if engine is None:
+        with MCTS(heuristic_obj, rollout="CUTOFF" if heuristic_obj is not None else "RANDOM") as engine:
+            return engine.search(board, player, time_budget=time_budget, iterations=iterations)
+    if heuristic_obj is not None:
+        engine.set_heuristic(heuristic_obj)
+    return engine.search(board, player, time_budget=time_budget, iterations=iterations)
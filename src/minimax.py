@@ -1,3 +1,59 @@
+import time
+
+from board import Board
+from ordering import MoveOrderer
+from symmetry import Symmetry
+from transposition import TranspositionTable
+from zobrist import Zobrist
+
+# Used by the time budget when the server does not say how much time is left
+DEFAULT_MAX_DEPTH = 25
+
+# Roughly how many plies a game on an 18x18 board lasts and the fewest own moves to assume are still to come
+EXPECTED_GAME_LENGTH = 120
+MIN_MOVES_LEFT = 10
+
+# Seconds kept back from every budget for communication with the server
+SAFETY_MARGIN = 0.5
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside a search when its deadline has passed
+    """
+    pass
+
+
+def time_budget_for_move(remaining_time, move_number, size=18):
+    """
+    Splits the remaining clock time between the moves still expected in the game
+    :param remaining_time: the seconds left on this player's clock
+    :param move_number: the move number of the current board state
+    :param size: the size of the board
+    :return: the number of seconds to search the current move for
+    """
+    expected_length = EXPECTED_GAME_LENGTH * (size / 18) ** 2
+    moves_left = max(MIN_MOVES_LEFT, (expected_length - move_number) / 2)
+    budget = remaining_time / moves_left - SAFETY_MARGIN
+    return max(0.0, min(budget, remaining_time / 4))
+
+
+def knockout_move(board, player):
+    """
+    Finds a move that leaves the other player without any moves, which wins the game on the spot
+    :param board: the current board state. Moves are made and unmade on it.
+    :param player: the player whose turn it is
+    :return: a winning move, or None if there is none
+    """
+    for move in board.get_possible_moves(player):
+        board.make_move(move)
+        knockout = board.get_move_count(-player) == 0
+        board.unmake_move()
+        if knockout:
+            return move
+    return None
+
+
 def minimax(board, player, heuristic_obj, depth, m=1):
     """
     Basic minimax algorithm for Konane
@@ -8,19 +64,21 @@ def minimax(board, player, heuristic_obj, depth, m=1):
     :param m: 1 is starting at max, -1 is starting at min
     :return: (heuristic, move)
     """
+    # The heuristic is always computed for the max player
     if depth == 0:
-        return heuristic_obj.heuristic(board, player), None
+        return heuristic_obj.heuristic(board, player * m), None
 
     # Deriving new states
     moves = board.get_possible_moves(player)
     if len(moves) == 0:
-        return heuristic_obj.heuristic(board, player), None
-    states = board.get_possible_resultant_states(player, moves)
+        return heuristic_obj.heuristic(board, player * m), None
 
     weighted_moves = []
-    for i in range(len(moves)):
-        weight = minimax_helper(states[i], player, heuristic_obj, depth - 1, m * -1)
-        weighted_moves.append((weight, moves[i]))
+    for move in moves:
+        board.make_move(move)
+        weight = minimax_helper(board, player * -1, heuristic_obj, depth - 1, m * -1)
+        board.unmake_move()
+        weighted_moves.append((weight, move))
 
     # Finding the min or max weight
     func = max if m == 1 else min
@@ -37,25 +95,26 @@ def minimax_helper(board, player, heuristic_obj, depth, m=1):
     """
     Minimax helper function
     :param board: Board object
-    :param player: the player whose turn it is at the top level of the search tree
+    :param player: the player whose turn it is at this level of the search tree
     :param heuristic_obj: heuristic to use
     :param depth: the max depth of the search tree
     :param m: 1 is starting at max, -1 is starting at min
     :return: heuristic
     """
     if depth == 0:
-        return heuristic_obj.heuristic(board, player)
+        return heuristic_obj.heuristic(board, player * m)
 
     # Deriving new states
     moves = board.get_possible_moves(player)
     if len(moves) == 0:
-        return heuristic_obj.heuristic(board, player)
-    states = board.get_possible_resultant_states(player, moves)
+        return heuristic_obj.heuristic(board, player * m)
 
     weighted_moves = []
-    for i in range(len(moves)):
-        weight = minimax_helper(states[i], player, heuristic_obj, depth - 1, m * -1)
-        weighted_moves.append((weight, moves[i]))
+    for move in moves:
+        board.make_move(move)
+        weight = minimax_helper(board, player * -1, heuristic_obj, depth - 1, m * -1)
+        board.unmake_move()
+        weighted_moves.append((weight, move))
 
     # Finding the min or max weight
     func = max if m == 1 else min
@@ -84,12 +143,13 @@ def maximaxpp(board, player, heuristic_obj, depth):
     moves = board.get_possible_moves(player)
     if len(moves) == 0:
         return heuristic_obj.heuristic(board, player), None
-    states = board.get_possible_resultant_states(player, moves)
 
     weighted_moves = []
-    for i in range(len(moves)):
-        weight = maximaxpp_helper(states[i], player * -1, heuristic_obj, depth - 1)
-        weighted_moves.append((weight, moves[i]))
+    for move in moves:
+        board.make_move(move)
+        weight = maximaxpp_helper(board, player * -1, heuristic_obj, depth - 1)
+        board.unmake_move()
+        weighted_moves.append((weight, move))
 
     h_lim = weighted_moves[0][0]
     move = weighted_moves[0][1]
@@ -116,12 +176,13 @@ def maximaxpp_helper(board, player, heuristic_obj, depth):
     moves = board.get_possible_moves(player)
     if len(moves) == 0:
         return heuristic_obj.heuristic(board, player)
-    states = board.get_possible_resultant_states(player, moves)
 
     weighted_moves = []
-    for i in range(len(moves)):
-        weight = minimax_helper(states[i], player * -1, heuristic_obj, depth - 1)
-        weighted_moves.append((weight, moves[i]))
+    for move in moves:
+        board.make_move(move)
+        weight = minimax_helper(board, player * -1, heuristic_obj, depth - 1)
+        board.unmake_move()
+        weighted_moves.append((weight, move))
 
     h_lim = weighted_moves[0][0]
     for h, m in weighted_moves:
@@ -130,58 +191,421 @@ def maximaxpp_helper(board, player, heuristic_obj, depth):
     return h_lim
 
 
-def alpha_beta_helper_pool(args):
+def iterative_deepening(board, player, heuristic_obj, time_budget, max_depth=DEFAULT_MAX_DEPTH, table=None,
+                        orderer=None, stats=None, selective=False):
     """
-    For running alpha beta in a process pool
-    :param args: the iterator of arguments to pass to the real alpha beta helper
-    :return: the alpha beta value for the given arguments
+    Searches the board one ply deeper at a time until the time budget runs out. A depth that runs out of time part of
+    the way through is thrown away and the best move of the last completed depth is used. Each iteration searches the
+    principal variation of the previous one first and uses its value as the center of the aspiration window.
+    :param board: the root state. It is not changed.
+    :param player: the player whose turn it is at the root state
+    :param heuristic_obj: heuristic to use
+    :param time_budget: the number of seconds to search for
+    :param max_depth: the depth to stop at even if there is time left
+    :param table: optional TranspositionTable shared between the iterations
+    :param orderer: optional MoveOrderer
+    :param stats: optional SearchStats. Counts every iteration, including one that ran out of time.
+    :param selective: extend and reduce the search as described in AlphaBetaSearch
+    :return: (heuristic, move, the last completed depth, principal variation)
     """
-    board, player, heuristic_obj, depth, m = args
-    return alpha_beta_helper(board, player, heuristic_obj, depth, m=m)
+    start = time.perf_counter()
+    deadline = time.time() + time_budget
+    # Searching a copy so an aborted search can't leave moves made on the caller's board
+    board = Board(board=board)
+    if len(board.get_possible_moves(player)) == 0:
+        return heuristic_obj.heuristic(board, player), None, 0, []
+    if orderer is not None:
+        orderer.new_search()
+
+    search = AlphaBetaSearch(heuristic_obj, player, table=table, orderer=orderer, stats=stats, selective=selective)
+    best = None
+    for depth in range(1, max_depth + 1):
+        # The first iteration always runs to completion so there is a move to fall back on
+        search.set_deadline(deadline if depth > 1 else None)
+        try:
+            value, move, pv = search.search_root(board, player, depth, guess=best[0] if best else None)
+        except SearchTimeout:
+            break
+        best = (value, move, depth, pv)
+        search.previous_pv = pv
+        if time.time() >= deadline:
+            break
+    if stats is not None:
+        stats.depth = best[2]
+        stats.seconds += time.perf_counter() - start
+    return best
 
 
-def alpha_beta_helper(board, player, heuristic_obj, depth, alpha=None, beta=None, m=1):
+def alpha_beta(board, player, heuristic_obj, depth, table=None, orderer=None, deadline=None, stats=None,
+               selective=False):
+    """
+    Fixed depth alpha beta search from the root
+    :param board: the root state. Moves are made and unmade on it during the search.
+    :param player: the player whose turn it is at the root state
+    :param heuristic_obj: heuristic to use
+    :param depth: the depth of the search tree
+    :param table: optional TranspositionTable to probe and fill during the search
+    :param orderer: optional MoveOrderer
+    :param deadline: optional time.time() value after which SearchTimeout is raised
+    :param stats: optional SearchStats to record the search in
+    :param selective: extend and reduce the search as described in AlphaBetaSearch
+    :return: (heuristic, best move, principal variation)
+    """
+    search = AlphaBetaSearch(heuristic_obj, player, table=table, orderer=orderer, deadline=deadline, stats=stats,
+                             selective=selective)
+    if stats is None:
+        return search.search_root(board, player, depth)
+    start = time.perf_counter()
+    result = search.search_root(board, player, depth)
+    stats.depth = depth
+    stats.seconds += time.perf_counter() - start
+    return result
+
+
+def alpha_beta_helper(board, player, heuristic_obj, depth, alpha=None, beta=None, m=1, table=None, deadline=None,
+                      orderer=None, ply=0, stats=None, selective=False):
     """
     Returns the alpha-beta weight for the given board state and heuristic
     :param board: the current board state
-    :param player: the player to compute for (either the max or min depending on m)
+    :param player: the player to compute for. It is this player's turn if m is 1 and the other player's if m is -1.
     :param heuristic_obj:
     :param depth: the depth of the search
-    :param alpha: leave blank
-    :param beta: leave blank
+    :param alpha: the lower bound of the search window from player's point of view, leave blank for no bound
+    :param beta: the upper bound of the search window from player's point of view, leave blank for no bound
     :param m: 1 to start with max player, -1 to start with min player
-    :return: a float
+    :param table: optional TranspositionTable to probe and fill during the search
+    :param deadline: optional time.time() value after which SearchTimeout is raised. The board is left part of the way
+    through the search when this happens.
+    :param orderer: optional MoveOrderer used to sort the moves of every node and count nodes and cutoffs
+    :param ply: the distance from the root of the search, used by the orderer
+    :param stats: optional SearchStats to count the nodes and timings of the search in
+    :param selective: extend and reduce the search as described in AlphaBetaSearch
+    :return: a float, the value of the board state for player
     """
     if alpha is None:
-        alpha = float("inf")
+        alpha = -float("inf")
     if beta is None:
-        beta = -float("inf")
+        beta = float("inf")
 
-    if depth == 0:
-        # altering the player to compute the heuristic for whosever turn it is at the root of the state tree
-        return heuristic_obj.heuristic(board, player * m)
+    search = AlphaBetaSearch(heuristic_obj, player, table=table, orderer=orderer, deadline=deadline, stats=stats,
+                             selective=selective)
+    search.set_horizon(ply + depth)
+    if m == 1:
+        return search.negamax(board, player, depth, alpha, beta, ply)
+    return -search.negamax(board, -player, depth, -beta, -alpha, ply)
 
-    # Deriving new states
-    moves = board.get_possible_moves(player)
-    if len(moves) == 0:
-        return heuristic_obj.heuristic(board, player * m)
-    states = board.get_possible_resultant_states(player, moves)
 
-    if m == 1:
-        # Maximizing player
-        value = -float("inf")
-        for state in states:
-            value = max(value, alpha_beta_helper(state, player, heuristic_obj, depth - 1, alpha, beta, m * -1))
-            alpha = max(alpha, value)
-            if alpha >= beta:
+class AlphaBetaSearch:
+    """
+    Negamax alpha beta search with principal variation search.
+
+    Values inside the search are from the point of view of the player to move. The heuristic is always computed for
+    the root player and negated on the other player's turns, so values match minimax exactly for any heuristic. After
+    the first move of a node the remaining moves are searched with a null window and only searched again with the full
+    window if they turn out to be better.
+
+    A selective search spends its nodes where fixed depth values are least reliable. A horizon node whose player is down
+    to a move or two is in the middle of a forced sequence, so it is searched on instead of evaluated (quiescence). A
+    node with a single move doesn't use up depth (single reply extension). Between them these extensions can go at most
+    MAX_EXTENSION plies past the nominal depth. In return, moves ordered late at nodes with enough depth left are first
+    searched with less depth and only searched again at full depth if they beat alpha (late move reductions). Selective
+    values no longer match minimax.
+    """
+
+    NULL_WINDOW = 1e-6
+
+    # Half width of the first aspiration window and how much it grows each time the search falls outside of it
+    ASPIRATION_WINDOW = 1.0
+    ASPIRATION_GROWTH = 4
+    ASPIRATION_TRIES = 3
+
+    # Selective search: horizon nodes with at most this many moves are searched on, to at most MAX_EXTENSION plies past
+    # the nominal depth
+    QUIESCENCE_MOVES = 2
+    MAX_EXTENSION = 4
+    # Moves from this index on are reduced by LMR_REDUCTION plies at nodes with at least LMR_DEPTH depth left
+    LMR_MOVES = 3
+    LMR_DEPTH = 3
+    LMR_REDUCTION = 1
+
+    def __init__(self, heuristic_obj, root_player, table=None, orderer=None, deadline=None, stats=None,
+                 selective=False):
+        """
+        Search constructor
+        :param heuristic_obj: heuristic to use
+        :param root_player: the player the heuristic is computed for
+        :param table: optional TranspositionTable to probe and fill during the search
+        :param orderer: optional MoveOrderer
+        :param deadline: optional time.time() value after which SearchTimeout is raised
+        :param stats: optional SearchStats to count nodes, cutoffs, table hits and timings in
+        :param selective: extend the search at forcing nodes and reduce late moves
+        """
+        self._heuristic = heuristic_obj
+        self._root_player = root_player
+        self._table = table
+        self._symmetric = table is not None and table.is_symmetric()
+        self._orderer = orderer
+        self._deadline = deadline
+        self._stats = stats
+        self._selective = selective
+        # The ply extensions stop at, MAX_EXTENSION past the nominal depth of the search
+        self._max_ply = 0
+        self._pv = {}
+        self._root_move = None
+        # Moves of the principal variation of an earlier search, tried first at their ply
+        self.previous_pv = []
+
+    def set_deadline(self, deadline):
+        self._deadline = deadline
+
+    def set_horizon(self, horizon):
+        """
+        :param horizon: the ply the search reaches without extensions, i.e. its depth plus the ply it starts at
+        """
+        self._max_ply = horizon + AlphaBetaSearch.MAX_EXTENSION
+
+    def evaluate(self, board, player):
+        """
+        :return: the heuristic value of the board from the point of view of player
+        """
+        if self._stats is not None:
+            start = time.perf_counter()
+            value = self._heuristic.heuristic(board, self._root_player)
+            self._stats.evaluations += 1
+            self._stats.eval_seconds += time.perf_counter() - start
+        else:
+            value = self._heuristic.heuristic(board, self._root_player)
+        return value if player == self._root_player else -value
+
+    def search_root(self, board, player, depth, guess=None):
+        """
+        Searches the root with an aspiration window around a guess of its value. If the value falls outside of the
+        window the window is widened and the root is searched again.
+        :param board: the root state
+        :param player: the player whose turn it is at the root state
+        :param depth: the depth of the search tree
+        :param guess: the expected value, normally from the previous iteration. None to search with a full window.
+        :return: (heuristic, best move, principal variation)
+        """
+        inf = float("inf")
+        if guess is None or abs(guess) == inf:
+            alpha, beta = -inf, inf
+        else:
+            delta = AlphaBetaSearch.ASPIRATION_WINDOW
+            alpha, beta = guess - delta, guess + delta
+
+        self.set_horizon(depth)
+        tries = 0
+        while True:
+            value = self.negamax(board, player, depth, alpha, beta, 0)
+            tries += 1
+            if value <= alpha and alpha != -inf:
+                alpha = -inf if tries >= AlphaBetaSearch.ASPIRATION_TRIES else \
+                    guess - delta * AlphaBetaSearch.ASPIRATION_GROWTH ** tries
+            elif value >= beta and beta != inf:
+                beta = inf if tries >= AlphaBetaSearch.ASPIRATION_TRIES else \
+                    guess + delta * AlphaBetaSearch.ASPIRATION_GROWTH ** tries
+            else:
                 break
-        return value
-    else:
-        # Minimizing player
-        value = float("inf")
-        for state in states:
-            value = min(value, alpha_beta_helper(state, player, heuristic_obj, depth - 1, alpha, beta, m * -1))
-            beta = min(beta, value)
+        return value, self._root_move, list(self._pv.get(0, []))
+
+    def negamax(self, board, player, depth, alpha, beta, ply=0):
+        """
+        Alpha beta search of a node
+        :param board: the current board state
+        :param player: the player whose turn it is
+        :param depth: the remaining depth
+        :param alpha: the lower bound of the window from player's point of view
+        :param beta: the upper bound of the window from player's point of view
+        :param ply: the distance from the root of the search
+        :return: the value of the board for player
+        """
+        if self._deadline is not None and time.time() > self._deadline:
+            raise SearchTimeout()
+        if self._orderer is not None:
+            self._orderer.nodes += 1
+        stats = self._stats
+        if stats is not None:
+            stats.enter_node(ply)
+        self._pv[ply] = []
+
+        if depth == 0:
+            if not self._selective or ply >= self._max_ply or \
+                    not 0 < board.get_move_count(player) <= AlphaBetaSearch.QUIESCENCE_MOVES:
+                return self.evaluate(board, player)
+            # Quiescence: too few moves left for the static value to be trusted
+            depth = 1
+            if stats is not None:
+                stats.extensions += 1
+
+        key = None
+        hint = None
+        transform = Symmetry.IDENTITY
+        if self._table is not None:
+            if self._symmetric:
+                key, transform = Symmetry.canonical_key(board, player, self._root_player)
+            else:
+                key = board.get_hash() ^ Zobrist.side_key(player) ^ Zobrist.perspective_key(self._root_player)
+            entry = self._table.probe(key)
+            if entry is not None:
+                hint = entry[3]
+                if transform != Symmetry.IDENTITY:
+                    hint = Symmetry.map_move(board.get_size(), Symmetry.inverse(transform), hint)
+            if stats is not None:
+                stats.tt_probes += 1
+                stats.tt_hits += entry is not None
+            # The root is always searched so that it has a best move and a principal variation
+            if entry is not None and entry[0] >= depth and ply > 0:
+                _depth, value, bound, _move = entry
+                if bound == TranspositionTable.EXACT:
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return value
+                if bound == TranspositionTable.LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return value
+        alpha_orig = alpha
+
+        # Deriving new states
+        if stats is not None:
+            start = time.perf_counter()
+            moves = board.get_possible_moves(player)
+            stats.expand_node(ply, len(moves), time.perf_counter() - start)
+        else:
+            moves = board.get_possible_moves(player)
+        if len(moves) == 0:
+            return self.evaluate(board, player)
+        if hint is None and ply < len(self.previous_pv):
+            hint = self.previous_pv[ply]
+        if self._orderer is not None:
+            moves = self._orderer.order(moves, ply, hint)
+        if self._selective and len(moves) == 1 and ply < self._max_ply:
+            # Single reply extension, the only move is searched as deep as the node would have been
+            depth += 1
+            if stats is not None:
+                stats.extensions += 1
+        reduce = self._selective and depth >= AlphaBetaSearch.LMR_DEPTH
+
+        best_value = -float("inf")
+        best_move = None
+        for i, move in enumerate(moves):
+            value = self._search_child(board, player, move, depth, alpha, beta, ply, i == 0,
+                                       reduce and i >= AlphaBetaSearch.LMR_MOVES)
+
+            if value > best_value or best_move is None:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    self._pv[ply] = [move] + self._pv.get(ply + 1, [])
             if alpha >= beta:
+                if self._orderer is not None:
+                    self._orderer.record_cutoff(move, ply, depth, i)
+                if stats is not None:
+                    stats.cutoffs += 1
+                    stats.first_move_cutoffs += i == 0
                 break
+
+        if ply == 0:
+            self._root_move = best_move
+        if self._table is not None:
+            if best_value <= alpha_orig:
+                bound = TranspositionTable.UPPER
+            elif best_value >= beta:
+                bound = TranspositionTable.LOWER
+            else:
+                bound = TranspositionTable.EXACT
+            # Stored in the frame of the canonical image, like the key
+            if transform != Symmetry.IDENTITY:
+                best_move = Symmetry.map_move(board.get_size(), transform, best_move)
+            self._table.store(key, depth, best_value, bound, best_move)
+        return best_value
+
+    def _search_child(self, board, player, move, depth, alpha, beta, ply, first, reduced=False):
+        """
+        Searches one child of a node, with the full window if it is the first child and a null window otherwise
+        :param reduced: search the child with LMR_REDUCTION less depth first, and at full depth only if it beats alpha
+        :return: the value of the child from player's point of view
+        """
+        board.make_move(move)
+        if first or alpha == -float("inf"):
+            value = -self.negamax(board, -player, depth - 1, -beta, -alpha, ply + 1)
+        else:
+            value = None
+            if reduced:
+                if self._stats is not None:
+                    self._stats.reductions += 1
+                value = -self.negamax(board, -player, depth - 1 - AlphaBetaSearch.LMR_REDUCTION,
+                                      -alpha - AlphaBetaSearch.NULL_WINDOW, -alpha, ply + 1)
+            if value is None or value > alpha:
+                value = -self.negamax(board, -player, depth - 1, -alpha - AlphaBetaSearch.NULL_WINDOW, -alpha,
+                                      ply + 1)
+            if alpha < value < beta:
+                # The null window search says this move is better, so its real value is needed
+                if self._stats is not None:
+                    self._stats.researches += 1
+                value = -self.negamax(board, -player, depth - 1, -beta, -alpha, ply + 1)
+        board.unmake_move()
         return value
+
+
+def fuzz_against_minimax(trials=50, seed=0, size=6, max_depth=3):
+    """
+    Checks that alpha beta returns the same values as plain minimax on random positions, with and without a
+    transposition table, plain or symmetric, and move ordering. One small SharedCache is kept across every trial, so
+    its entries get evicted and the heuristic salts have to keep positions from earlier trials apart.
+    :param trials: the number of positions to check
+    :param seed: the seed for the random positions
+    :param size: the size of the board
+    :param max_depth: every depth from 1 up to this one is checked
+    :return: the number of searches checked
+    :raises ValueError: if a search disagrees with minimax
+    """
+    # Imported here to keep heuristics optional for the search
+    import os
+    import random
+    import tempfile
+    from heuristic import MoveCountHeuristic, PieceDifferenceHeuristic, MCPDLearningHeuristic
+    from shared_cache import heuristic_salt, SharedCache
+
+    rand = random.Random(seed)
+    checked = 0
+    folder = tempfile.mkdtemp()
+    cache = SharedCache(os.path.join(folder, "cache.bin"), max_megabytes=0.01)
+    for trial in range(trials):
+        board = Board(size=size)
+        player = 1
+        for _i in range(rand.randint(2, size ** 2 // 3)):
+            moves = board.get_possible_moves(player)
+            if len(moves) == 0:
+                break
+            board.do_move(rand.choice(moves))
+            player *= -1
+        heuristic_obj = rand.choice((MoveCountHeuristic(), PieceDifferenceHeuristic(), MCPDLearningHeuristic()))
+        for key in heuristic_obj:
+            heuristic_obj[key] = rand.uniform(0, 1)
+        cache.set_salt(heuristic_salt(heuristic_obj))
+        for depth in range(1, max_depth + 1):
+            expected, _move = minimax(board, player, heuristic_obj, depth)
+            cache.set_generation(trial * max_depth + depth)
+            results = [
+                alpha_beta(board, player, heuristic_obj, depth)[0],
+                alpha_beta(board, player, heuristic_obj, depth, table=TranspositionTable(1), orderer=MoveOrderer())[0],
+                alpha_beta(board, player, heuristic_obj, depth, table=TranspositionTable(1, symmetric=True),
+                           orderer=MoveOrderer())[0],
+                alpha_beta(board, player, heuristic_obj, depth, table=cache, orderer=MoveOrderer())[0],
+                alpha_beta_helper(board, player, heuristic_obj, depth),
+            ]
+            for value in results:
+                if value != expected:
+                    raise ValueError("Alpha beta returned %s instead of %s at depth %d" % (value, expected, depth))
+            checked += 1
+    cache.close()
+    os.remove(os.path.join(folder, "cache.bin"))
+    os.rmdir(folder)
+    return checked
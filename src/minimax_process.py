@@ -1,6 +1,9 @@
-from multiprocessing import Process, Value, Pool
+import time
+from multiprocessing import Process, Value
 
-from minimax import alpha_beta_helper, alpha_beta_helper_pool
+from endgame import EndgameSolver
+from minimax import alpha_beta_helper, knockout_move
+from search_pool import SearchPool
 
 
 class MinimaxProcess(Process):
@@ -23,7 +26,8 @@ class MinimaxProcess(Process):
     def run(self):
         try:
             self._status = "RUNNING"
-            self._return.value = alpha_beta_helper(self._board, self._player, self._heuristic, self._depth, self._m)
+            self._return.value = alpha_beta_helper(self._board, self._player, self._heuristic, self._depth,
+                                                   m=self._m)
         except KeyboardInterrupt:
             pass
 
@@ -81,35 +85,188 @@ def parallel_minimax(board, player, heuristic_obj, depth, m=1):
     return h_lim, move
 
 
-def parallel_minimax_pool(board, player, heuristic_obj, depth, m=1, pool=None):
+def parallel_minimax_pool(board, player, heuristic_obj, depth, m=1, pool=None, time_budget=None, mode="ROOT_SPLIT",
+                          stats=None, selective=False, solve_endgames=True):
     """
     Divides the first layer of the children of the board state into multiple alpha beta calls and separates them
-    between all cores on the machine. Uses process pools because they are more stable.
+    between all cores on the machine. The root is handed to the workers once through shared memory and each child
+    search is a single move index.
     :param board: the root state
     :param player: the player whose turn it is at the root state
     :param heuristic_obj: the heuristic to use in alpha beta
-    :param depth: the depth of the search tree
+    :param depth: the depth of the search tree. When a time budget is given this is the maximum depth instead.
     :param m: 1 to start max, -1 to start min
-    :param pool: optional parameter to specify a process pool to use. If not specificed, one will be created with all
-    cores in use.
+    :param pool: optional SearchPool to use. If not specified, one will be created with all cores in use and closed
+    afterwards, so callers searching more than one position should keep their own.
+    :param time_budget: optional number of seconds to search for. If given, the search is deepened one ply at a time
+    until the budget runs out and the best move of the last completed depth is returned.
+    :param mode: ROOT_SPLIT to search every child with a full window at once, or YBWC to search the first child alone
+    and the rest against the bound it sets (Young Brothers Wait). YBWC needs m to be 1.
+    :param stats: optional SearchStats that the statistics of every worker's searches are added to. The root is at ply
+    0 and the children searched by the workers start at ply 1.
+    :param selective: extend and reduce the searches of the children as described in AlphaBetaSearch
+    :param solve_endgames: once few moves are left, try to solve the position exactly with the pool's EndgameSolver
+    first. A proven win is played at once. Otherwise the search goes ahead, with whatever is left of the time budget.
     :return: (alpha beta of the best move, best move)
     """
+    if mode not in ("ROOT_SPLIT", "YBWC"):
+        raise ValueError("%s is an invalid search mode" % str(mode))
+    if mode == "YBWC" and m != 1:
+        raise ValueError("YBWC searches need the root to be the max player")
+
     moves = board.get_possible_moves(player)
     if len(moves) == 0:
         return heuristic_obj.heuristic(board, player), None
-    states = board.get_possible_resultant_states(player, moves)
 
     # Checking for knockout moves:
-    for i in range(len(states)):
-        if len(states[i].get_possible_moves(player * -1)) == 0:
-            return float("inf"), moves[i]
+    knockout = knockout_move(board, player)
+    if knockout is not None:
+        return float("inf"), knockout
+
+    start = time.perf_counter()
+    if solve_endgames:
+        solver = pool.solver if pool is not None else EndgameSolver()
+        if solver.should_solve(board, player):
+            # Half the budget at most, so a solve that gives up still leaves time to search
+            deadline = None if time_budget is None else time.time() + time_budget / 2
+            solved = solver.solve(board, player, deadline=deadline,
+                                  max_nodes=EndgameSolver.MAX_NODES if time_budget is None else None)
+            if solved is not None and solved[0]:
+                return float("inf"), solved[1]
+            if time_budget is not None:
+                time_budget = max(0.0, time_budget - (time.perf_counter() - start))
 
+    search_children = _search_children_ybw if mode == "YBWC" else _search_children
+    if stats is not None:
+        stats.enter_node(0)
+        stats.expand_node(0, len(moves), 0.0)
     if pool is None:
-        with Pool() as pool:
-            heuristics = pool.map(alpha_beta_helper_pool, [(state, player, heuristic_obj, depth - 1, m * -1) for state in states])
+        with SearchPool() as pool:
+            best = search_children(pool, board, moves, player, heuristic_obj, depth, m, time_budget, stats,
+                                   selective)
     else:
-        heuristics = pool.map(alpha_beta_helper_pool,
-                              [(state, player, heuristic_obj, depth - 1, m * -1) for state in states])
+        best = search_children(pool, board, moves, player, heuristic_obj, depth, m, time_budget, stats, selective)
+    if stats is not None:
+        stats.seconds += time.perf_counter() - start
+    return best
+
+
+def _search_children(pool, board, moves, player, heuristic_obj, depth, m, time_budget, stats, selective):
+    """
+    Runs the alpha beta searches of the root children on the pool, iteratively deepening if there is a time budget
+    :return: (alpha beta of the best move, best move)
+    """
+    pool.set_root(board, heuristic_obj)
+    if time_budget is None:
+        heuristics = pool.search_children(player, len(moves), depth - 1, m * -1, stats=stats, selective=selective)
+        if stats is not None:
+            stats.depth = depth
+        return _best_weighted_move(heuristics, moves, m)
+
+    deadline = time.time() + time_budget
+    best = None
+    for d in range(1, depth + 1):
+        # The first iteration only evaluates the children so there is always a move to fall back on
+        iteration_deadline = deadline if d > 1 else None
+        heuristics = pool.search_children(player, len(moves), d - 1, m * -1, iteration_deadline, stats, selective)
+        if None in heuristics:
+            # At least one child ran out of time, so this depth is incomplete
+            break
+        best = _best_weighted_move(heuristics, moves, m)
+        if stats is not None:
+            stats.depth = d
+        if time.time() >= deadline:
+            break
+    return best
+
+
+def _search_children_ybw(pool, board, moves, player, heuristic_obj, depth, m, time_budget, stats, selective):
+    """
+    Young Brothers Wait version of _search_children. Each iteration searches the best move of the one before first.
+    :return: (alpha beta of the best move, best move)
+    """
+    pool.set_root(board, heuristic_obj)
+    deadline = None if time_budget is None else time.time() + time_budget
+    first_depth = 1 if time_budget is not None else depth
+    best = None
+    best_index = 0
+    for d in range(first_depth, depth + 1):
+        order = [best_index] + [i for i in range(len(moves)) if i != best_index]
+        # The first iteration always finishes so there is a move to fall back on
+        results = pool.search_children_ybw(player, order, d - 1, deadline if d > first_depth else None, stats,
+                                           selective)
+        if results is None:
+            break
+        if stats is not None:
+            stats.depth = d
+        best_value = None
+        for i, (value, exact) in zip(order, results):
+            if exact and (best_value is None or value > best_value):
+                best_value = value
+                best_index = i
+        best = (best_value, moves[best_index])
+        if deadline is not None and time.time() >= deadline:
+            break
+    return best
+
+
+def scaling_benchmark(worker_counts=(1, 2, 4, 8, 16), depth=4, size=10, positions=3, seed=0, mode="YBWC",
+                      heuristic_obj=None):
+    """
+    Measures how a parallel search scales with the number of workers. Every worker count searches the same seeded
+    positions to a fixed depth with a fresh pool, and the time to reach that depth and the nodes searched per second
+    are reported.
+    :param worker_counts: the numbers of worker processes to try
+    :param depth: the depth to search every position to
+    :param size: the size of the board
+    :param positions: the number of positions to search
+    :param seed: the seed for the random playouts the positions come from
+    :param mode: the parallel_minimax_pool mode to measure
+    :param heuristic_obj: the heuristic to search with, defaults to MoveCountHeuristic
+    :return: a list of dicts with workers, seconds, nodes, nodes_per_second and speedup for each worker count
+    """
+    # Imported here to keep heuristics optional for the search
+    import random
+    from board import Board
+    from heuristic import MoveCountHeuristic
+
+    heuristic_obj = heuristic_obj or MoveCountHeuristic()
+    rand = random.Random(seed)
+    boards = []
+    while len(boards) < positions:
+        board = Board(size=size)
+        player = 1
+        for _i in range(rand.randint(4, size ** 2 // 4)):
+            moves = board.get_possible_moves(player)
+            if len(moves) == 0:
+                break
+            board.do_move(rand.choice(moves))
+            player *= -1
+        if len(board.get_possible_moves(player)) > 1:
+            boards.append((board, player))
+
+    results = []
+    print("Workers\tSeconds\tNodes\tNodes/s\tSpeedup")
+    for workers in worker_counts:
+        with SearchPool(processes=workers) as pool:
+            start = time.time()
+            for board, player in boards:
+                parallel_minimax_pool(board, player, heuristic_obj, depth, pool=pool, mode=mode)
+            seconds = time.time() - start
+            nodes = pool.nodes
+        result = {
+            "workers": workers,
+            "seconds": seconds,
+            "nodes": nodes,
+            "nodes_per_second": nodes / seconds if seconds else 0,
+            "speedup": results[0]["seconds"] / seconds if results and seconds else 1.0,
+        }
+        results.append(result)
+        print("%d\t%.3f\t%d\t%.0f\t%.2f" % (workers, seconds, nodes, result["nodes_per_second"], result["speedup"]))
+    return results
+
+
+def _best_weighted_move(heuristics, moves, m):
     weighted_moves = [(heuristics[i], moves[i]) for i in range(len(moves))]
 
     # Finding the min or max weight
@@ -120,5 +277,4 @@ def parallel_minimax_pool(board, player, heuristic_obj, depth, m=1, pool=None):
         if func(h, h_lim) == h:
             h_lim = h
             move = m
-    # print(weighted_moves, h_lim, move)
     return h_lim, move
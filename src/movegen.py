@@ -0,0 +1,156 @@
+import random
+
+import numpy as np
+
+DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+
+
+def _shifted(mask, dr, dc):
+    """
+    Shifts a boolean mask so that out[r][c] == mask[r + dr][c + dc]. Squares that would read off the board are False.
+    The last two axes are the board, so a stack of boards is shifted all at once.
+    """
+    n = mask.shape[-1]
+    out = np.zeros_like(mask)
+    if abs(dr) >= n or abs(dc) >= n:
+        return out
+    out[..., max(0, -dr):min(n, n - dr), max(0, -dc):min(n, n - dc)] = \
+        mask[..., max(0, dr):min(n, n + dr), max(0, dc):min(n, n + dc)]
+    return out
+
+
+def numpy_possible_moves(array, player):
+    """
+    Computes every single and multi jump for a player in one batched pass over the board. For each direction and
+    jump length the legal starting squares are found with shifted boolean masks over the whole array at once.
+    Does not handle the first two removal moves of the game.
+    :param array: the board as a 2D numpy array, as returned by Board.get_array
+    :param player: the player to compute moves for
+    :return: a list of moves in the ((r1, c1), (r2, c2)) format
+    """
+    own = array == player
+    opp = array == -player
+    empty = array == 0
+    moves = []
+    for dr, dc in DIRECTIONS:
+        candidates = own
+        jumps = 1
+        while True:
+            # Every odd square along the line must be an opponent and every even one must be empty
+            candidates = candidates & _shifted(opp, dr * (2 * jumps - 1), dc * (2 * jumps - 1)) & \
+                _shifted(empty, dr * 2 * jumps, dc * 2 * jumps)
+            rows, cols = np.nonzero(candidates)
+            if len(rows) == 0:
+                break
+            for r, c in zip(rows.tolist(), cols.tolist()):
+                moves.append(((r, c), (r + dr * 2 * jumps, c + dc * 2 * jumps)))
+            jumps += 1
+    return moves
+
+
+def numpy_move_counts(arrays, player):
+    """
+    Counts the single and multi jumps of a player on a stack of boards at once, with the same shifted masks as
+    numpy_possible_moves. Does not handle the first two removal moves of the game.
+    :param arrays: the boards as a (number of boards, size, size) numpy array
+    :param player: the player to count moves for
+    :return: a numpy array with the number of moves on each board
+    """
+    own = arrays == player
+    opp = arrays == -player
+    empty = arrays == 0
+    counts = np.zeros(len(arrays), dtype=np.int64)
+    for dr, dc in DIRECTIONS:
+        candidates = own
+        jumps = 1
+        while True:
+            candidates = candidates & _shifted(opp, dr * (2 * jumps - 1), dc * (2 * jumps - 1)) & \
+                _shifted(empty, dr * 2 * jumps, dc * 2 * jumps)
+            found = candidates.sum(axis=(1, 2))
+            if not found.any():
+                break
+            counts += found
+            jumps += 1
+    return counts
+
+
+def fuzz_move_generators(trials=200, seed=0, sizes=(4, 6, 8, 18)):
+    """
+    Checks that the bitboard, numpy and scanning move generators agree on random positions. Half of the positions come
+    from random playouts and half are random fills of the board, which are not reachable but stress the edge cases.
+    :param trials: the number of positions to check
+    :param seed: the seed for the random positions
+    :param sizes: the board sizes to pick from
+    :return: the number of positions checked
+    :raises ValueError: if the generators disagree on any position
+    """
+    # Imported here so board.py can import this module
+    from board import Board
+
+    rand = random.Random(seed)
+    for trial in range(trials):
+        size = rand.choice(sizes)
+        if trial % 2 == 0:
+            board = Board(size=size)
+            player = 1
+            for _i in range(rand.randint(2, size ** 2)):
+                moves = board.get_possible_moves(player)
+                if len(moves) == 0:
+                    break
+                board.do_move(rand.choice(moves))
+                player *= -1
+            if board.get_move_number() <= 2:
+                continue
+        else:
+            array = np.array([[rand.choice((1, -1, 0)) for _c in range(size)] for _r in range(size)], dtype=np.int8)
+            board = Board.from_array(array)
+
+        for player in (1, -1):
+            expected = set(board.get_possible_moves_scan(player))
+            tracked = board.get_possible_moves(player)
+            shifted = set(board.get_bitboard().generate_moves(player))
+            vectorized = set(numpy_possible_moves(board.get_array(), player))
+            if not expected == set(tracked) == shifted == vectorized or len(tracked) != len(expected) or \
+                    board.get_move_count(player) != len(expected):
+                raise ValueError("Move generators disagree for player %d on\n%s" % (player, str(board.get_array())))
+    return trials
+
+
+def fuzz_tracked_moves(trials=50, seed=0, sizes=(4, 6, 8, 18)):
+    """
+    Checks that the moves the bitboard tracks through make_move and unmake_move match the moves generated from
+    scratch. Each trial walks randomly down and back up a game tree, comparing the two at every step.
+    :param trials: the number of walks
+    :param seed: the seed for the random walks
+    :param sizes: the board sizes to pick from
+    :return: the number of positions checked
+    :raises ValueError: if the tracked moves are wrong in any position
+    """
+    # Imported here so board.py can import this module
+    from board import Board
+
+    rand = random.Random(seed)
+    checked = 0
+    for _trial in range(trials):
+        board = Board(size=rand.choice(sizes))
+        bits = board.get_bitboard()
+        player = 1
+        depth = 0
+        for _i in range(rand.randint(1, 2 * board.get_bitboard().get_size() ** 2)):
+            if board.get_move_number() > 2:
+                for p in (1, -1):
+                    tracked = bits.get_possible_moves(p)
+                    if sorted(tracked) != sorted(bits.generate_moves(p)) or bits.get_move_count(p) != len(tracked):
+                        raise ValueError("Tracked moves are wrong for player %d on\n%s" % (p, str(board.get_array())))
+                checked += 1
+            moves = board.get_possible_moves(player)
+            if depth > 0 and (len(moves) == 0 or rand.random() < 0.3):
+                board.unmake_move()
+                depth -= 1
+            elif len(moves) > 0:
+                board.make_move(rand.choice(moves))
+                depth += 1
+            else:
+                break
+            player = 1 if board.get_move_number() % 2 == 1 else -1
+    return checked
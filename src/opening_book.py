@@ -0,0 +1,217 @@
+import os
+import struct
+from multiprocessing import Pool
+
+from board import Board
+from heuristic import MCPDLearningHeuristic, write_file_atomically
+from minimax import alpha_beta
+from ordering import MoveOrderer
+from symmetry import Symmetry
+from transposition import TranspositionTable
+from zobrist import Zobrist
+
+
+def _search_book_line(task):
+    """
+    Plays one opening line in a worker process, searching every position along it
+    :param task: (size, moves that start the line, plies to search, depth, heuristic, symmetric book)
+    :return: a list of (key, move, value, depth) entries, one per searched position, with the moves in the frame of
+    the key
+    """
+    size, start, plies, depth, heuristic_obj, symmetric = task
+    board = Board(size=size)
+    player = 1
+    for move in start:
+        board.do_move(move)
+        player *= -1
+
+    table = TranspositionTable(max_megabytes=16)
+    orderer = MoveOrderer()
+    entries = []
+    for _i in range(plies):
+        if len(board.get_possible_moves(player)) == 0:
+            break
+        table.set_generation(board.get_move_number())
+        orderer.new_search()
+        value, move, _pv = alpha_beta(board, player, heuristic_obj, depth, table=table, orderer=orderer)
+        key, transform = OpeningBook.book_key(board, player, symmetric)
+        entries.append((key, Symmetry.map_move(size, transform, move), value, depth))
+        board.do_move(move)
+        player *= -1
+    return entries
+
+
+class OpeningBook:
+    """
+    Book of precomputed moves for the start of the game.
+
+    Entries are keyed by the Zobrist hash of the position and the player to move, and hold the best move, its value
+    for the player to move and the depth it was searched to. On disk the book is a short header followed by fixed size
+    binary records, so loading is a single read and an unpack.
+
+    A symmetric book is keyed by Symmetry.canonical_key instead, with the moves stored in the frame of the canonical
+    image, so one entry answers for every position that is a symmetric image of it. Symmetric books are saved with
+    their own magic.
+    """
+
+    MAGIC = b"KBK1"
+    SYMMETRIC_MAGIC = b"KBS1"
+    # Magic, board size, number of entries
+    HEADER_FORMAT = "<4sHI"
+    # Key, r1, c1, r2, c2, value, depth. NO_SQUARE marks the missing end square of a removal.
+    RECORD_FORMAT = "<Q4BfB"
+    NO_SQUARE = 255
+
+    def __init__(self, size=18, symmetric=False):
+        """
+        Opening book constructor
+        :param size: the size of the board the book is for
+        :param symmetric: key positions by their canonical image
+        """
+        self._size = size
+        self._symmetric = symmetric
+        self._entries = {}
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_size(self):
+        return self._size
+
+    def is_symmetric(self):
+        return self._symmetric
+
+    @staticmethod
+    def key(board, player):
+        return board.get_hash() ^ Zobrist.side_key(player)
+
+    @staticmethod
+    def book_key(board, player, symmetric=False):
+        """
+        :return: (key, symmetry) where symmetry maps moves in the position to the frame of the key. The key is the plain
+        one and the symmetry the identity for a book that isn't symmetric.
+        """
+        if symmetric:
+            return Symmetry.canonical_key(board, player)
+        return OpeningBook.key(board, player), Symmetry.IDENTITY
+
+    @staticmethod
+    def default_file_name(size):
+        return os.path.join("../const", "opening_book.%d.bin" % size)
+
+    def add(self, key, move, value, depth):
+        """
+        Adds an entry, keeping an existing one if it was searched deeper
+        :param key: the book_key of the position
+        :param move: the move, in the frame of the key
+        """
+        old = self._entries.get(key)
+        if old is None or old[2] <= depth:
+            self._entries[key] = (move, value, depth)
+
+    def probe(self, board, player):
+        """
+        Looks up the move to play
+        :param board: the current board state
+        :param player: the player whose turn it is
+        :return: the book move, or None if the position is not in the book
+        """
+        self.probes += 1
+        if board.get_size() != self._size:
+            return None
+        key, transform = OpeningBook.book_key(board, player, self._symmetric)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        move = Symmetry.map_move(self._size, Symmetry.inverse(transform), entry[0])
+        if move not in board.get_possible_moves(player):
+            return None
+        self.hits += 1
+        return move
+
+    def save(self, file_name=None):
+        """
+        Writes the book to disk. The file is written under a temporary name and then renamed.
+        :param file_name: the file to write, defaults to default_file_name
+        """
+        file_name = file_name or OpeningBook.default_file_name(self._size)
+        none = OpeningBook.NO_SQUARE
+        magic = OpeningBook.SYMMETRIC_MAGIC if self._symmetric else OpeningBook.MAGIC
+        data = [struct.pack(OpeningBook.HEADER_FORMAT, magic, self._size, len(self._entries))]
+        for key, (((r1, c1), end), value, depth) in self._entries.items():
+            r2, c2 = end if end is not None else (none, none)
+            data.append(struct.pack(OpeningBook.RECORD_FORMAT, key, r1, c1, r2, c2, value, depth))
+        write_file_atomically(file_name, b"".join(data))
+
+    @staticmethod
+    def load(file_name):
+        """
+        Reads a book written by save
+        :param file_name: the file to read
+        :return: the OpeningBook
+        """
+        with open(file_name, "rb") as file:
+            data = file.read()
+        magic, size, count = struct.unpack_from(OpeningBook.HEADER_FORMAT, data)
+        if magic not in (OpeningBook.MAGIC, OpeningBook.SYMMETRIC_MAGIC):
+            raise ValueError("%s is not an opening book" % file_name)
+        book = OpeningBook(size=size, symmetric=magic == OpeningBook.SYMMETRIC_MAGIC)
+        none = OpeningBook.NO_SQUARE
+        start = struct.calcsize(OpeningBook.HEADER_FORMAT)
+        end = start + count * struct.calcsize(OpeningBook.RECORD_FORMAT)
+        for key, r1, c1, r2, c2, value, depth in struct.iter_unpack(OpeningBook.RECORD_FORMAT, data[start:end]):
+            book._entries[key] = (((r1, c1), (r2, c2) if r2 != none else None), value, depth)
+        return book
+
+    @staticmethod
+    def load_default(size=18):
+        """
+        :return: the book saved at default_file_name for the board size, or None if there isn't one
+        """
+        file_name = OpeningBook.default_file_name(size)
+        return OpeningBook.load(file_name) if os.path.isfile(file_name) else None
+
+
+def build_opening_book(size=18, depth=6, plies=6, heuristic_obj=None, processes=None, symmetric=True):
+    """
+    Builds an opening book with deep searches. The starting position and every position after each of the first moves
+    are searched directly. Then one self-play line per pair of first and second moves is searched for more plies, each
+    line on its own worker process. A symmetric book only searches one of the starts that are symmetric images of each
+    other.
+    :param size: the size of the board
+    :param depth: the depth to search every position to
+    :param plies: the number of plies to search along each line after the two removals
+    :param heuristic_obj: the heuristic to search with, defaults to MCPDLearningHeuristic
+    :param processes: the number of lines to search at once, defaults to the number of cores
+    :param symmetric: build a symmetric book, see OpeningBook
+    :return: the OpeningBook
+    """
+    heuristic_obj = heuristic_obj or MCPDLearningHeuristic()
+    book = OpeningBook(size=size, symmetric=symmetric)
+    board = Board(size=size)
+
+    starts = [[]]
+    seen = set()
+    for first in board.get_first_moves():
+        board.do_move(first)
+        lines = [[first]] + [[first, second] for second in board.get_second_moves()]
+        board.unmake_move()
+        for start in lines:
+            for move in start:
+                board.do_move(move)
+            key = OpeningBook.book_key(board, 1 if len(start) % 2 == 0 else -1, symmetric)[0]
+            for _move in start:
+                board.unmake_move()
+            if key not in seen:
+                seen.add(key)
+                starts.append(start)
+
+    # Positions before the removals are searched once each, the rest are followed for plies moves
+    tasks = [(size, start, 1 if len(start) < 2 else plies, depth, heuristic_obj, symmetric) for start in starts]
+    with Pool(processes or os.cpu_count()) as pool:
+        for entries in pool.imap_unordered(_search_book_line, tasks):
+            for key, move, value, entry_depth in entries:
+                book.add(key, move, value, entry_depth)
+    return book
@@ -0,0 +1,94 @@
+class MoveOrderer:
+    """
+    Orders moves for alpha beta so that the moves most likely to cause a cutoff are searched first.
+
+    The order is:
+    1. The best move from the transposition table or the previous iteration
+    2. Killer moves, which caused a cutoff in a sibling node at the same ply
+    3. Every other move by the number of pieces it captures, then by its history score
+
+    Also counts the nodes visited and the cutoffs made so orderings can be compared. Each part of the ordering can be
+    turned off, and with everything off the moves are searched in move generator order.
+    """
+
+    KILLERS_PER_PLY = 2
+
+    def __init__(self, use_static=True, use_killers=True, use_history=True, use_best_move=True):
+        """
+        Move orderer constructor
+        :param use_static: order by the number of captured pieces
+        :param use_killers: search killer moves early
+        :param use_history: break ties with the history table
+        :param use_best_move: search the best move from the table or previous iteration first
+        """
+        self._use_static = use_static
+        self._use_killers = use_killers
+        self._use_history = use_history
+        self._use_best_move = use_best_move
+        self._killers = {}
+        self._history = {}
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def new_search(self):
+        """
+        Called before searching a new root position. Killers are forgotten and the history table is aged so older
+        results count for less.
+        """
+        self._killers = {}
+        self._history = {move: score // 2 for move, score in self._history.items() if score > 1}
+
+    def reset_counters(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    def order(self, moves, ply, best_move=None):
+        """
+        Sorts moves from most to least promising
+        :param moves: the moves available in the current position
+        :param ply: the distance from the root of the search
+        :param best_move: the best move found by an earlier search of this position, or None
+        :return: a new list of moves
+        """
+        if not (self._use_static or self._use_history):
+            ordered = list(moves)
+        else:
+            ordered = sorted(moves, key=self._score, reverse=True)
+
+        front = []
+        if self._use_best_move and best_move is not None:
+            front.append(best_move)
+        if self._use_killers:
+            front.extend(self._killers.get(ply, ()))
+        if front:
+            # Only moves that are legal here can be moved to the front
+            front = [move for i, move in enumerate(front) if move in ordered and move not in front[:i]]
+            ordered = front + [move for move in ordered if move not in front]
+        return ordered
+
+    def _score(self, move):
+        captured = 0
+        if self._use_static and move[1] is not None:
+            ((r1, c1), (r2, c2)) = move
+            captured = (abs(r1 - r2) + abs(c1 - c2)) // 2
+        history = self._history.get(move, 0) if self._use_history else 0
+        return captured, history
+
+    def record_cutoff(self, move, ply, depth, move_index=0):
+        """
+        Records a move that caused a beta cutoff
+        :param move: the move that caused the cutoff
+        :param ply: the distance from the root of the search
+        :param depth: the remaining depth of the node. Deeper cutoffs are worth more in the history table.
+        :param move_index: where the move was in the searched order
+        """
+        self.cutoffs += 1
+        if move_index == 0:
+            self.first_move_cutoffs += 1
+        killers = self._killers.setdefault(ply, [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[MoveOrderer.KILLERS_PER_PLY:]
+        self._history[move] = self._history.get(move, 0) + depth * depth
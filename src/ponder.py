@@ -0,0 +1,215 @@
+import threading
+import time
+
+from board import Board
+from minimax import alpha_beta, iterative_deepening, knockout_move, AlphaBetaSearch, SearchTimeout, \
+    DEFAULT_MAX_DEPTH
+from ordering import MoveOrderer
+from transposition import TranspositionTable
+
+
+class Ponderer:
+    """
+    Searches on the opponent's time.
+
+    Once a player has moved, start searches the positions the opponent's replies lead to on a background thread, with
+    its own transposition table and move orderer. In PREDICT mode only the expected reply is searched, taken from the
+    principal variation of the player's own search or from a shallow search if there isn't one. In ALL mode every reply
+    is searched one ply deeper at a time, all sharing the table, so positions common to several replies are only
+    searched once. When the actual reply arrives respond stops the thread and either plays the pondered move straight
+    away or keeps searching from it with the table still warm. A reply that wasn't searched is a ponder miss and the
+    caller searches as usual.
+
+    The thread is a Python thread, so pondering only gets a core of its own while the opponent searches in other
+    processes or the process is waiting for the server.
+    """
+
+    MODES = ("PREDICT", "ALL")
+
+    # Depth of the search that predicts the reply when there is no principal variation
+    PREDICT_DEPTH = 2
+
+    def __init__(self, heuristic_obj, mode="PREDICT", max_depth=DEFAULT_MAX_DEPTH,
+                 table_megabytes=TranspositionTable.DEFAULT_MEGABYTES):
+        """
+        Ponderer constructor
+        :param heuristic_obj: the heuristic of the player pondering
+        :param mode: PREDICT to search the expected reply or ALL to search every reply
+        :param max_depth: the depth to stop pondering at
+        :param table_megabytes: the memory cap of the transposition table, kept for the whole game
+        """
+        if mode not in Ponderer.MODES:
+            raise ValueError("%s is an invalid ponder mode" % str(mode))
+        self._heuristic = heuristic_obj
+        self._mode = mode
+        self._max_depth = max_depth
+        self._table = TranspositionTable(table_megabytes)
+        self._orderer = MoveOrderer()
+        self._thread = None
+        self._search = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._player = None
+        self._start_time = 0.0
+        # Reply -> (value, move, depth, principal variation) of the deepest completed search after that reply
+        self._results = {}
+        self.ponders = 0
+        self.hits = 0
+        self.pondered_seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def is_pondering(self):
+        return self._thread is not None
+
+    def get_hit_rate(self):
+        """
+        :return: the fraction of the opponent's replies that had been pondered
+        """
+        return self.hits / self.ponders if self.ponders else 0
+
+    def predict(self, board, player, pv=None):
+        """
+        Predicts the opponent's reply
+        :param board: the position after player's move, with the opponent to move
+        :param player: the player pondering
+        :param pv: optional principal variation of player's search, starting with the move just played
+        :return: the expected reply, or None if the opponent has no moves
+        """
+        replies = board.get_possible_moves(-player)
+        if len(replies) == 0:
+            return None
+        if pv is not None and len(pv) > 1 and pv[1] in replies:
+            return pv[1]
+        # The opponent's heuristic is unknown, so the reply player's own heuristic would choose is expected
+        self._table.set_generation(board.get_move_number())
+        return alpha_beta(Board(board=board), -player, self._heuristic, Ponderer.PREDICT_DEPTH, table=self._table,
+                          orderer=self._orderer)[1]
+
+    def start(self, board, player, pv=None):
+        """
+        Starts pondering in the background. Any earlier pondering is stopped first.
+        :param board: the position after player's move, with the opponent to move. It is not changed.
+        :param player: the player pondering
+        :param pv: optional principal variation of player's search, starting with the move just played
+        """
+        self.stop()
+        replies = board.get_possible_moves(-player)
+        if len(replies) == 0:
+            return
+        predicted = self.predict(board, player, pv)
+        if self._mode == "PREDICT":
+            replies = [predicted]
+        else:
+            replies = [predicted] + [reply for reply in replies if reply != predicted]
+
+        self._player = player
+        self._results = {}
+        self._stopped.clear()
+        self._search = AlphaBetaSearch(self._heuristic, player, table=self._table, orderer=self._orderer)
+        self._start_time = time.time()
+        self._thread = threading.Thread(target=self._ponder, args=(Board(board=board), replies), daemon=True)
+        self._thread.start()
+
+    def _ponder(self, board, replies):
+        """
+        Searches the positions after each reply one depth at a time until stopped or max_depth is reached
+        :param board: a copy of the position the replies are played on
+        :param replies: the replies to search, most likely first
+        """
+        search = self._search
+        self._orderer.new_search()
+        self._table.set_generation(board.get_move_number() + 1)
+        pvs = {}
+        for depth in range(1, self._max_depth + 1):
+            for reply in replies:
+                if self._stopped.is_set():
+                    return
+                board.make_move(reply)
+                if depth == 1:
+                    knockout = knockout_move(board, self._player)
+                    if knockout is not None or len(board.get_possible_moves(self._player)) == 0:
+                        # Nothing left to search after this reply, so its result is final
+                        value = float("inf") if knockout is not None else -float("inf")
+                        with self._lock:
+                            self._results[reply] = (value, knockout, self._max_depth, [])
+                        board.unmake_move()
+                        continue
+                elif self._results[reply][2] >= depth:
+                    board.unmake_move()
+                    continue
+                previous = self._results.get(reply)
+                search.previous_pv = pvs.get(reply, [])
+                try:
+                    value, move, pv = search.search_root(board, self._player, depth,
+                                                         guess=previous[0] if previous else None)
+                except SearchTimeout:
+                    # The board copy is left part of the way through the search, but it isn't used again
+                    return
+                board.unmake_move()
+                pvs[reply] = pv
+                with self._lock:
+                    self._results[reply] = (value, move, depth, pv)
+
+    def stop(self):
+        """
+        Stops the background search and waits for it to finish. The results found so far are kept.
+        """
+        if self._thread is None:
+            return
+        self._stopped.set()
+        # The search checks its deadline at every node, so it gives up almost at once
+        self._search.set_deadline(0)
+        self._thread.join()
+        self.pondered_seconds += time.time() - self._start_time
+        self._thread = None
+
+    def get_result(self, reply):
+        """
+        :return: (value, move, depth, principal variation) of the deepest completed search after reply, or None
+        """
+        with self._lock:
+            return self._results.get(reply)
+
+    def respond(self, board, reply, depth=None, time_budget=None):
+        """
+        Stops pondering once the opponent's reply is known and picks the move to answer it with. Counts a ponder hit if
+        the reply had been searched.
+        :param board: the position after the reply, with the player pondering to move
+        :param reply: the move the opponent played
+        :param depth: the depth the player searches to without a time budget. A pondered result at least this deep is
+        played as it is and a shallower one is searched again to this depth with the warm table.
+        :param time_budget: optional seconds the player would search for. The time spent pondering counts towards it,
+        so the pondered move is played at once if pondering took longer and otherwise the search carries on from the
+        pondered depth with the warm table for the rest of the budget.
+        :return: (value, move), or None on a ponder miss
+        """
+        if self._thread is None and not self._results:
+            return None
+        pondered = time.time() - self._start_time
+        self.stop()
+        self.ponders += 1
+        result = self._results.get(reply)
+        self._results = {}
+        if result is None or result[1] is None:
+            return None
+        self.hits += 1
+        value, move, pondered_depth, _pv = result
+        if time_budget is None:
+            if depth is None or pondered_depth >= depth:
+                return value, move
+            self._orderer.new_search()
+            return alpha_beta(board, self._player, self._heuristic, depth, table=self._table,
+                              orderer=self._orderer)[:2]
+        if pondered_depth >= self._max_depth or pondered >= time_budget:
+            return value, move
+        # The iterations up to the pondered depth are mostly table cutoffs now
+        continued = iterative_deepening(board, self._player, self._heuristic, time_budget - pondered,
+                                        max_depth=self._max_depth, table=self._table, orderer=self._orderer)
+        if continued[2] < pondered_depth:
+            return value, move
+        return continued[:2]
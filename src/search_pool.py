@@ -0,0 +1,305 @@
+import os
+import pickle
+import struct
+from multiprocessing import Pool, Value
+from multiprocessing.shared_memory import SharedMemory
+
+from board import Board
+from endgame import EndgameSolver
+from minimax import alpha_beta_helper, AlphaBetaSearch, SearchTimeout
+from ordering import MoveOrderer
+from search_stats import SearchStats
+from shared_cache import heuristic_salt, SharedCache
+from transposition import TranspositionTable
+
+# Worker process state. Lives as long as the pool does, so tables stay warm across moves and games.
+_worker_table = None
+_worker_orderer = None
+_worker_memory = None
+# The best root value found so far in a Young Brothers Wait search, shared by every worker
+_worker_bound = None
+# (block name, sequence number, root board, root moves, heuristic) of the root position last read from shared memory
+_worker_root = None
+# The pickled heuristics the worker table was filled with, most recent last
+_worker_heuristics = []
+
+
+def _init_worker(table_megabytes, bound, cache_file=None, symmetric=False):
+    """
+    Pool initializer that gives each worker process its own transposition table and move orderer
+    :param table_megabytes: the memory cap of each worker's table
+    :param bound: the shared Value holding the best root value of a Young Brothers Wait search
+    :param cache_file: optional SharedCache file to use as the table instead, shared by every worker
+    :param symmetric: key the table by canonical position, see TranspositionTable
+    """
+    global _worker_table, _worker_orderer, _worker_bound
+    if cache_file is not None:
+        _worker_table = SharedCache(cache_file, max_megabytes=table_megabytes, symmetric=symmetric)
+    else:
+        _worker_table = TranspositionTable(max_megabytes=table_megabytes, symmetric=symmetric)
+    _worker_orderer = MoveOrderer()
+    _worker_bound = bound
+
+
+def _load_root(name, sequence, player):
+    """
+    Reads the root position and heuristic from shared memory unless this worker already has them
+    :param name: the name of the shared memory block
+    :param sequence: the sequence number of the root position
+    :param player: the player whose turn it is at the root
+    :return: (root board, root moves, heuristic)
+    """
+    global _worker_memory, _worker_root
+    if _worker_root is not None and _worker_root[0] == name and _worker_root[1] == sequence:
+        return _worker_root[2:]
+
+    if _worker_memory is None or _worker_memory.name != name:
+        if _worker_memory is not None:
+            _worker_memory.close()
+        _worker_memory = SharedMemory(name=name)
+
+    buffer = _worker_memory.buf
+    _sequence, position_bytes, heuristic_bytes = struct.unpack_from(SearchPool.HEADER_FORMAT, buffer)
+    start = struct.calcsize(SearchPool.HEADER_FORMAT)
+    board = Board.from_bytes(buffer[start:start + position_bytes])
+    heuristic_data = bytes(buffer[start + position_bytes:start + position_bytes + heuristic_bytes])
+    heuristic_obj = pickle.loads(heuristic_data)
+
+    if isinstance(_worker_table, SharedCache):
+        # Other processes may still be using the cache, so entries are kept apart by heuristic instead of cleared
+        _worker_table.set_salt(heuristic_salt(heuristic_obj))
+    elif heuristic_data not in _worker_heuristics:
+        # Values stored for a different heuristic would be wrong, so the table starts over. The two most recent
+        # heuristics are kept because the two sides of a game normally use different ones.
+        _worker_table.clear()
+        _worker_heuristics.append(heuristic_data)
+        del _worker_heuristics[:-2]
+    _worker_table.set_generation(board.get_move_number())
+    _worker_orderer.new_search()
+
+    _worker_root = (name, sequence, board, board.get_possible_moves(player), heuristic_obj)
+    return _worker_root[2:]
+
+
+def _flush_stats():
+    """
+    Adds the worker's counters to the shared cache file, if the worker uses one, so cache_report is up to date
+    """
+    if isinstance(_worker_table, SharedCache):
+        _worker_table.flush_stats()
+
+
+def _search_child(task):
+    """
+    Searches one child of the root position in a worker process
+    :param task: (block name, sequence number, move index, root player, depth, m, deadline, collect statistics,
+    selective search)
+    :return: (the alpha beta value of the child or None if the deadline passed, the number of nodes searched, a
+    SearchStats dict or None if statistics weren't collected)
+    """
+    global _worker_root
+    name, sequence, index, player, depth, m, deadline, collect, selective = task
+    board, moves, heuristic_obj = _load_root(name, sequence, player)
+    nodes = _worker_orderer.nodes
+    stats = SearchStats() if collect else None
+    board.make_move(moves[index])
+    try:
+        # The children of the root are at ply 1
+        value = alpha_beta_helper(board, player, heuristic_obj, depth, m=m, table=_worker_table, deadline=deadline,
+                                  orderer=_worker_orderer, ply=1, stats=stats, selective=selective)
+    except SearchTimeout:
+        # The search stopped part of the way down the tree, so the root is read again next time
+        _worker_root = None
+        return None, _worker_orderer.nodes - nodes, stats.to_dict() if collect else None
+    board.unmake_move()
+    _flush_stats()
+    return value, _worker_orderer.nodes - nodes, stats.to_dict() if collect else None
+
+
+def _search_younger_brother(task):
+    """
+    Searches a child of the root after the eldest brother has set the shared bound. The child is first searched with a
+    null window around the best root value found so far, which is read at the start so it includes the results of
+    brothers that finished earlier. Only a child that beats it is searched again to get its exact value, which then
+    raises the shared bound for the brothers that come after it.
+    :param task: (block name, sequence number, move index, root player, depth, deadline, collect statistics, selective
+    search)
+    :return: (the value of the child or None if the deadline passed, True if the value is exact and False if it is
+    only an upper bound, the number of nodes searched, a SearchStats dict or None if statistics weren't collected)
+    """
+    global _worker_root
+    name, sequence, index, player, depth, deadline, collect, selective = task
+    board, moves, heuristic_obj = _load_root(name, sequence, player)
+    nodes = _worker_orderer.nodes
+    stats = SearchStats() if collect else None
+    search = lambda a, b: alpha_beta_helper(board, player, heuristic_obj, depth, alpha=a, beta=b, m=-1,
+                                            table=_worker_table, deadline=deadline, orderer=_worker_orderer, ply=1,
+                                            stats=stats, selective=selective)
+    board.make_move(moves[index])
+    try:
+        alpha = _worker_bound.value
+        value = None
+        if alpha != -float("inf"):
+            value = search(alpha, alpha + AlphaBetaSearch.NULL_WINDOW)
+        exact = False
+        if value is None or value > alpha:
+            # Better than every brother so far, or there was no bound to test against
+            alpha = _worker_bound.value
+            value = search(alpha, None)
+            exact = value > alpha
+            if exact:
+                with _worker_bound.get_lock():
+                    if value > _worker_bound.value:
+                        _worker_bound.value = value
+    except SearchTimeout:
+        _worker_root = None
+        return None, False, _worker_orderer.nodes - nodes, stats.to_dict() if collect else None
+    board.unmake_move()
+    _flush_stats()
+    return value, exact, _worker_orderer.nodes - nodes, stats.to_dict() if collect else None
+
+
+class SearchPool:
+    """
+    Long lived pool of search worker processes.
+
+    The root position and heuristic are written once per move into a shared memory block and the workers are only sent
+    the index of the root move to search, instead of a pickled Board per child. Each worker keeps its own
+    transposition table and move orderer for as long as the pool is open, so one pool should be reused for every move
+    of every game. The workers can share a SharedCache file as their table instead.
+
+    Children can either all be searched with a full window at once, or with Young Brothers Wait: the first child is
+    searched alone and the rest are searched in parallel against the best value found so far, which the workers share.
+
+    The pool also keeps an EndgameSolver in this process, so positions solved on one move are still known on the next.
+    """
+
+    # Sequence number, position length, heuristic length
+    HEADER_FORMAT = "<QII"
+
+    DEFAULT_BLOCK_BYTES = 2 ** 16
+
+    def __init__(self, processes=None, table_megabytes=TranspositionTable.DEFAULT_MEGABYTES, cache_file=None,
+                 symmetric_tables=False):
+        """
+        Search pool constructor
+        :param processes: the number of worker processes, defaults to the number of cores
+        :param table_megabytes: the memory cap of each worker's transposition table, or the size of the cache file if
+        it has to be created
+        :param cache_file: optional SharedCache file that every worker uses as its table instead of a private one.
+        Results then carry over between workers, pools and runs.
+        :param symmetric_tables: key the workers' tables by canonical position, so positions that are symmetric images
+        of each other share entries
+        """
+        self._processes = processes or os.cpu_count()
+        # Created before the workers so they share this process's resource tracker instead of each starting their own
+        self._memory = SharedMemory(create=True, size=SearchPool.DEFAULT_BLOCK_BYTES)
+        self._bound = Value("d", -float("inf"))
+        self._pool = Pool(self._processes, initializer=_init_worker,
+                          initargs=(table_megabytes, self._bound, cache_file, symmetric_tables))
+        self._sequence = 0
+        self.nodes = 0
+        self.solver = EndgameSolver()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get_processes(self):
+        return self._processes
+
+    def reset_counters(self):
+        self.nodes = 0
+
+    def set_root(self, board, heuristic_obj):
+        """
+        Writes a new root position and heuristic into shared memory for the workers to read
+        :param board: the root state
+        :param heuristic_obj: the heuristic to search with
+        :return: the sequence number of the new root
+        """
+        position = board.get_bitboard().to_bytes()
+        heuristic_data = pickle.dumps(heuristic_obj)
+        header_bytes = struct.calcsize(SearchPool.HEADER_FORMAT)
+        total = header_bytes + len(position) + len(heuristic_data)
+        if total > self._memory.size:
+            # Growing the block. Tasks carry the block name so workers attach to the new one.
+            size = max(total, 2 * self._memory.size)
+            self._memory.close()
+            self._memory.unlink()
+            self._memory = SharedMemory(create=True, size=size)
+
+        self._sequence += 1
+        buffer = self._memory.buf
+        struct.pack_into(SearchPool.HEADER_FORMAT, buffer, 0, self._sequence, len(position), len(heuristic_data))
+        buffer[header_bytes:header_bytes + len(position)] = position
+        buffer[header_bytes + len(position):total] = heuristic_data
+        return self._sequence
+
+    def search_children(self, player, num_moves, depth, m=1, deadline=None, stats=None, selective=False):
+        """
+        Searches every child of the root set with set_root, one task per child
+        :param player: the player whose turn it is at the root state
+        :param num_moves: the number of root moves, which must match board.get_possible_moves(player) for the root
+        :param depth: the depth to search each child to
+        :param m: 1 if player is the max player, -1 otherwise
+        :param deadline: optional time.time() value after which a child search gives up
+        :param stats: optional SearchStats that the statistics of every child search are added to
+        :param selective: extend and reduce the child searches as described in AlphaBetaSearch
+        :return: a list with the value of each child in root move order. A child that ran out of time is None.
+        """
+        name = self._memory.name
+        results = self._pool.map(_search_child, [(name, self._sequence, i, player, depth, m, deadline,
+                                                  stats is not None, selective) for i in range(num_moves)])
+        self.nodes += sum(nodes for _value, nodes, _stats in results)
+        SearchPool._merge_stats(stats, [child_stats for _value, _nodes, child_stats in results])
+        return [value for value, _nodes, _stats in results]
+
+    def search_children_ybw(self, player, order, depth, deadline=None, stats=None, selective=False):
+        """
+        Searches the children of the root set with set_root with Young Brothers Wait. The first child in order is
+        searched on its own with a full window and the rest are searched in parallel with the bound it sets.
+        :param player: the player whose turn it is at the root state. The root is always a max node.
+        :param order: the indices of the root moves in the order to search them. The first one should be the move
+        expected to be best.
+        :param depth: the depth to search each child to
+        :param deadline: optional time.time() value after which a child search gives up
+        :param stats: optional SearchStats that the statistics of every child search are added to
+        :param selective: extend and reduce the child searches as described in AlphaBetaSearch
+        :return: a list of (value, exact) pairs in the same order as order. Values that are not exact are upper
+        bounds no better than the best exact value. None if any child ran out of time.
+        """
+        name = self._memory.name
+        collect = stats is not None
+        first, nodes, first_stats = self._pool.apply(_search_child, ((name, self._sequence, order[0], player, depth,
+                                                                      -1, deadline, collect, selective),))
+        self.nodes += nodes
+        SearchPool._merge_stats(stats, [first_stats])
+        if first is None:
+            return None
+        self._bound.value = first
+
+        results = self._pool.map(_search_younger_brother, [(name, self._sequence, i, player, depth, deadline,
+                                                            collect, selective) for i in order[1:]])
+        self.nodes += sum(nodes for _value, _exact, nodes, _stats in results)
+        SearchPool._merge_stats(stats, [child_stats for _value, _exact, _nodes, child_stats in results])
+        if any(value is None for value, _exact, _nodes, _stats in results):
+            return None
+        return [(first, True)] + [(value, exact) for value, exact, _nodes, _stats in results]
+
+    @staticmethod
+    def _merge_stats(stats, child_stats):
+        if stats is not None:
+            for data in child_stats:
+                stats.merge(data)
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory block
+        """
+        self._pool.close()
+        self._pool.join()
+        self._memory.close()
+        self._memory.unlink()
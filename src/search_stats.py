@@ -0,0 +1,198 @@
+import io
+import json
+
+from heuristic import write_file_atomically
+
+
+class SearchStats:
+    """
+    Counters for one search, filled in by AlphaBetaSearch when it is given one.
+
+    Counts nodes, leaf evaluations, cutoffs, principal variation re-searches, selective extensions and reductions and
+    transposition table use, the nodes and children at every ply for the branching factor, and the time spent
+    generating moves and evaluating leaves. Searches without a SearchStats only pay for an is None check at each of
+    these points. Counters from several searches, like the child searches of pool workers, can be added together with
+    merge.
+    """
+
+    # Counters added together by merge, in the order they are reported
+    COUNTERS = ("nodes", "evaluations", "cutoffs", "first_move_cutoffs", "researches", "extensions", "reductions",
+                "tt_probes", "tt_hits", "tt_cutoffs", "movegen_seconds", "eval_seconds")
+
+    def __init__(self):
+        self.nodes = 0
+        self.evaluations = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.researches = 0
+        self.extensions = 0
+        self.reductions = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.movegen_seconds = 0.0
+        self.eval_seconds = 0.0
+        # Nodes visited and children generated at every ply, indexed by ply
+        self.ply_nodes = []
+        self.ply_children = []
+        self.ply_expanded = []
+        # The deepest completed iteration and the wall clock time of the whole search, set by the caller
+        self.depth = 0
+        self.seconds = 0.0
+
+    def enter_node(self, ply):
+        self.nodes += 1
+        if ply >= len(self.ply_nodes):
+            self._grow(ply)
+        self.ply_nodes[ply] += 1
+
+    def expand_node(self, ply, children, seconds):
+        """
+        Records the move generation of a node
+        :param ply: the distance of the node from the root
+        :param children: the number of moves generated
+        :param seconds: the time move generation took
+        """
+        self.movegen_seconds += seconds
+        if ply >= len(self.ply_children):
+            self._grow(ply)
+        self.ply_children[ply] += children
+        self.ply_expanded[ply] += 1
+
+    def _grow(self, ply):
+        for counts in (self.ply_nodes, self.ply_children, self.ply_expanded):
+            counts.extend([0] * (ply + 1 - len(counts)))
+
+    def get_max_ply(self):
+        """
+        :return: the deepest ply any node was visited at
+        """
+        return len(self.ply_nodes) - 1
+
+    def get_branching_factors(self):
+        """
+        :return: the average number of moves of the nodes expanded at each ply, 0 at plies where no node was
+        expanded
+        """
+        return [children / expanded if expanded else 0
+                for children, expanded in zip(self.ply_children, self.ply_expanded)]
+
+    def get_nodes_per_second(self):
+        return self.nodes / self.seconds if self.seconds else 0
+
+    def merge(self, other):
+        """
+        Adds the counters of another search into this one
+        :param other: a SearchStats or a dict from to_dict
+        """
+        if isinstance(other, SearchStats):
+            other = other.to_dict()
+        for name in SearchStats.COUNTERS:
+            setattr(self, name, getattr(self, name) + other[name])
+        if other["ply_nodes"]:
+            self._grow(len(other["ply_nodes"]) - 1)
+        for name in ("ply_nodes", "ply_children", "ply_expanded"):
+            counts = getattr(self, name)
+            for ply, count in enumerate(other[name]):
+                counts[ply] += count
+        self.depth = max(self.depth, other["depth"])
+
+    def to_dict(self):
+        """
+        :return: the counters as a dict of numbers and lists that can be pickled or written as JSON
+        """
+        data = {name: getattr(self, name) for name in SearchStats.COUNTERS}
+        data.update({
+            "ply_nodes": list(self.ply_nodes),
+            "ply_children": list(self.ply_children),
+            "ply_expanded": list(self.ply_expanded),
+            "branching_factors": self.get_branching_factors(),
+            "max_ply": self.get_max_ply(),
+            "depth": self.depth,
+            "seconds": self.seconds,
+            "nodes_per_second": self.get_nodes_per_second(),
+        })
+        return data
+
+    def print(self):
+        print("Depth %d, %d nodes in %.3fs (%.0f/s), %d evaluations, max ply %d" %
+              (self.depth, self.nodes, self.seconds, self.get_nodes_per_second(), self.evaluations,
+               self.get_max_ply()))
+        print("Cutoffs %d (%d on the first move), %d re-searches, %d extensions, %d reductions" %
+              (self.cutoffs, self.first_move_cutoffs, self.researches, self.extensions, self.reductions))
+        print("Table %d/%d hits, %d cutoffs" % (self.tt_hits, self.tt_probes, self.tt_cutoffs))
+        print("Move generation %.3fs, evaluation %.3fs" % (self.movegen_seconds, self.eval_seconds))
+        print("Branching factor by ply: %s" % " ".join("%.1f" % b for b in self.get_branching_factors()))
+
+
+class SearchLog:
+    """
+    Statistics of every searched move of a game, exported as JSON lines with one object per move
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def record(self, move_number, player, move, value, stats):
+        """
+        Adds the statistics of one move
+        :param move_number: the move number of the position that was searched
+        :param player: the player who searched
+        :param move: the move that was played
+        :param value: the value the search gave the move
+        :param stats: the SearchStats of the search
+        """
+        record = {"move_number": move_number, "player": player, "move": move, "value": value}
+        record.update(stats.to_dict())
+        self.records.append(record)
+
+    def to_json(self):
+        # Infinite values of won and lost positions aren't valid JSON, so they are written as strings
+        return "".join(json.dumps({key: str(value) if value in (float("inf"), -float("inf")) else value
+                                   for key, value in record.items()}) + "\n" for record in self.records)
+
+    def save(self, file_name):
+        write_file_atomically(file_name, self.to_json())
+
+
+def profile_search(search_function, *args, profiler="CPROFILE", limit=30, **kwargs):
+    """
+    Runs one search under a profiler and prints where the time went
+    :param search_function: the search to run, e.g. alpha_beta
+    :param args: the positional arguments of the search
+    :param profiler: CPROFILE for the standard library profiler, or PYINSTRUMENT for the sampling profiler if it is
+    installed
+    :param limit: the number of functions the CPROFILE report lists
+    :param kwargs: the keyword arguments of the search
+    :return: (the result of the search, the report)
+    """
+    if profiler == "CPROFILE":
+        import cProfile
+        import pstats
+
+        profile = cProfile.Profile()
+        result = profile.runcall(search_function, *args, **kwargs)
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+        report = stream.getvalue()
+    elif profiler == "PYINSTRUMENT":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ValueError("PYINSTRUMENT profiling needs the pyinstrument package")
+
+        profile = Profiler()
+        profile.start()
+        try:
+            result = search_function(*args, **kwargs)
+        finally:
+            profile.stop()
+        report = profile.output_text()
+    else:
+        raise ValueError("%s is an invalid profiler" % str(profiler))
+    print(report)
+    return result, report
+
@@ -0,0 +1,272 @@
+import hashlib
+import mmap
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    # Windows. Statistics are then added up without a lock.
+    fcntl = None
+
+
+def heuristic_salt(heuristic_obj):
+    """
+    Key to xor into every position key of a cache, so values computed with different heuristics or constants never
+    mix when processes share a cache
+    :return: a 64 bit salt, the same in every process for equal heuristics
+    """
+    constants = sorted((key, heuristic_obj[key]) for key in heuristic_obj)
+    text = repr((heuristic_obj.__class__.__name__, constants)).encode("ascii")
+    return int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "little")
+
+
+def _value_bits(value):
+    return struct.unpack("<Q", struct.pack("<d", value))[0]
+
+
+class SharedCache:
+    """
+    Persistent search cache in a memory-mapped file that any number of processes can read and write at once.
+
+    It has the same interface as TranspositionTable, so it can be used as the table of any search. The file is a header
+    followed by a fixed number of 24 byte slots in buckets of BUCKET_SIZE. A position can go in any slot of the bucket
+    its key hashes to. When the bucket is full, the entry from the oldest generation is evicted first, then the
+    shallowest one.
+
+    There are no locks on the slots. Each slot stores key ^ value ^ info next to value and info, and a probe only hits
+    if the xor gives back the key. A slot torn by two processes writing it at the same time is then just a miss. Probe
+    and store counters are kept per process and added into the header by flush_stats.
+
+    Like a TranspositionTable, a cache can be symmetric. Processes with and without symmetric keys can share a file:
+    a canonical key is only equal to the plain key of a position when the canonical image is the position itself, in
+    which case the stored move is in the same frame either way.
+    """
+
+    MAGIC = b"KCC1"
+    # Magic, number of slots, probes, hits, stores, evictions
+    HEADER_FORMAT = "<4sIQQQQ"
+    HEADER_BYTES = 64
+    # Checked key, value, info. Info holds the depth, bound, generation and move.
+    SLOT_FORMAT = "<QdQ"
+    SLOT_BYTES = 24
+    BUCKET_SIZE = 4
+
+    DEFAULT_MEGABYTES = 64
+
+    def __init__(self, file_name, max_megabytes=DEFAULT_MEGABYTES, salt=0, symmetric=False):
+        """
+        Opens a cache file, creating it if it doesn't exist
+        :param file_name: the file backing the cache
+        :param max_megabytes: the size of a new cache file. An existing file keeps its own size.
+        :param salt: a key xored into every position key, see heuristic_salt
+        :param symmetric: key positions by their canonical image, see TranspositionTable
+        """
+        self._file_name = file_name
+        if not os.path.isfile(file_name):
+            num_buckets = max(1, int(max_megabytes * 2 ** 20 / (SharedCache.SLOT_BYTES * SharedCache.BUCKET_SIZE)))
+            num_slots = num_buckets * SharedCache.BUCKET_SIZE
+            temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+            with open(temp_name, "wb") as file:
+                file.write(struct.pack(SharedCache.HEADER_FORMAT, SharedCache.MAGIC, num_slots, 0, 0, 0, 0))
+                file.truncate(SharedCache.HEADER_BYTES + num_slots * SharedCache.SLOT_BYTES)
+            try:
+                # Linking instead of renaming so a process creating the same file at the same time doesn't replace it
+                os.link(temp_name, file_name)
+            except FileExistsError:
+                pass
+            os.remove(temp_name)
+
+        self._file = open(file_name, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, self._num_slots = struct.unpack_from(SharedCache.HEADER_FORMAT, self._map)[:2]
+        if magic != SharedCache.MAGIC:
+            raise ValueError("%s is not a cache file" % file_name)
+        self._num_buckets = self._num_slots // SharedCache.BUCKET_SIZE
+        self._salt = salt
+        self._symmetric = symmetric
+        self._generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __getstate__(self):
+        raise TypeError("SharedCache can't be pickled, open the file in each process instead")
+
+    def get_num_slots(self):
+        return self._num_slots
+
+    def get_file_name(self):
+        return self._file_name
+
+    def is_symmetric(self):
+        return self._symmetric
+
+    def set_salt(self, salt):
+        self._salt = salt
+
+    def set_generation(self, generation):
+        """
+        Marks the start of a new search. Entries from other generations are evicted first.
+        :param generation: any number, e.g. the move number of the root position. Only the low 16 bits are kept.
+        """
+        self._generation = generation & 0xFFFF
+
+    @staticmethod
+    def _pack_info(depth, bound, generation, move):
+        if move is None:
+            packed_move = 0
+        else:
+            (r1, c1), end = move
+            packed_move = 1 | r1 << 1 | c1 << 6
+            if end is not None:
+                packed_move |= 1 << 11 | end[0] << 12 | end[1] << 17
+        return min(depth, 255) | bound << 8 | generation << 10 | packed_move << 26
+
+    @staticmethod
+    def _unpack_info(info):
+        depth = info & 0xFF
+        bound = (info >> 8) & 0x3
+        generation = (info >> 10) & 0xFFFF
+        packed_move = info >> 26
+        move = None
+        if packed_move & 1:
+            start = ((packed_move >> 1) & 0x1F, (packed_move >> 6) & 0x1F)
+            end = ((packed_move >> 12) & 0x1F, (packed_move >> 17) & 0x1F) if packed_move >> 11 & 1 else None
+            move = (start, end)
+        return depth, bound, generation, move
+
+    def _bucket_offset(self, key):
+        bucket = (key * 0x9E3779B97F4A7C15 >> 32) % self._num_buckets
+        return SharedCache.HEADER_BYTES + bucket * SharedCache.BUCKET_SIZE * SharedCache.SLOT_BYTES
+
+    def _find(self, key):
+        """
+        :return: (value, info) of the slot holding key, or None
+        """
+        offset = self._bucket_offset(key)
+        for i in range(SharedCache.BUCKET_SIZE):
+            checked, value, info = struct.unpack_from(SharedCache.SLOT_FORMAT, self._map,
+                                                      offset + i * SharedCache.SLOT_BYTES)
+            if info and checked ^ _value_bits(value) ^ info == key:
+                return value, info
+        return None
+
+    def probe(self, key):
+        """
+        Looks up a position
+        :param key: the hash of the position
+        :return: (depth, value, bound, best move) or None if the position is not stored
+        """
+        self.probes += 1
+        found = self._find(key ^ self._salt)
+        if found is None:
+            return None
+        self.hits += 1
+        value, info = found
+        depth, bound, _generation, move = SharedCache._unpack_info(info)
+        return depth, value, bound, move
+
+    def get_move(self, key):
+        """
+        :return: the best move stored for a position, or None
+        """
+        found = self._find(key ^ self._salt)
+        return SharedCache._unpack_info(found[1])[3] if found is not None else None
+
+    def store(self, key, depth, value, bound, move):
+        """
+        Stores the result of a search, evicting an entry of the bucket if it is full
+        :param key: the hash of the position
+        :param depth: the remaining depth the position was searched to
+        :param value: the value of the search
+        :param bound: EXACT, LOWER or UPPER, as in TranspositionTable
+        :param move: the best move found, or None
+        """
+        key ^= self._salt
+        offset = self._bucket_offset(key)
+        victim = None
+        victim_score = None
+        for i in range(SharedCache.BUCKET_SIZE):
+            slot = offset + i * SharedCache.SLOT_BYTES
+            checked, old_value, info = struct.unpack_from(SharedCache.SLOT_FORMAT, self._map, slot)
+            old_depth, _bound, old_generation, old_move = SharedCache._unpack_info(info)
+            if info and checked ^ _value_bits(old_value) ^ info == key:
+                if old_generation == self._generation and old_depth > depth:
+                    return
+                if move is None:
+                    # Keeping the best move of an earlier search of the same position
+                    move = old_move
+                victim, victim_score = slot, None
+                break
+            # Empty slots first, then entries from other searches, then the shallowest
+            score = (-1, 0) if info == 0 else (int(old_generation == self._generation), old_depth)
+            if victim is None or score < victim_score:
+                victim, victim_score = slot, score
+        if victim_score is not None and victim_score[0] >= 0:
+            self.evictions += 1
+
+        info = SharedCache._pack_info(depth, bound, self._generation, move)
+        checked = key ^ _value_bits(value) ^ info
+        struct.pack_into(SharedCache.SLOT_FORMAT, self._map, victim, checked, value, info)
+        self.stores += 1
+
+    def clear(self):
+        """
+        Empties the cache for every process using it
+        """
+        self._map[SharedCache.HEADER_BYTES:] = bytes(self._num_slots * SharedCache.SLOT_BYTES)
+
+    def get_hit_rate(self):
+        return self.hits / self.probes if self.probes else 0
+
+    def flush_stats(self):
+        """
+        Adds this process's counters into the totals in the file header and resets them
+        """
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            magic, num_slots, probes, hits, stores, evictions = struct.unpack_from(SharedCache.HEADER_FORMAT, self._map)
+            struct.pack_into(SharedCache.HEADER_FORMAT, self._map, 0, magic, num_slots, probes + self.probes,
+                             hits + self.hits, stores + self.stores, evictions + self.evictions)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self.probes = self.hits = self.stores = self.evictions = 0
+
+    def close(self):
+        self.flush_stats()
+        self._map.close()
+        self._file.close()
+
+
+def cache_report(file_name, verbose=True):
+    """
+    Reports how full a cache file is and the hit rate of every process that flushed its statistics into it
+    :param file_name: the cache file
+    :param verbose: print the report
+    :return: a dict with slots, used, probes, hits, hit_rate, stores and evictions
+    """
+    with open(file_name, "rb") as file:
+        data = file.read()
+    magic, num_slots, probes, hits, stores, evictions = struct.unpack_from(SharedCache.HEADER_FORMAT, data)
+    if magic != SharedCache.MAGIC:
+        raise ValueError("%s is not a cache file" % file_name)
+    slots = data[SharedCache.HEADER_BYTES:SharedCache.HEADER_BYTES + num_slots * SharedCache.SLOT_BYTES]
+    used = sum(1 for _checked, _value, info in struct.iter_unpack(SharedCache.SLOT_FORMAT, slots) if info)
+    report = {
+        "slots": num_slots,
+        "used": used,
+        "probes": probes,
+        "hits": hits,
+        "hit_rate": hits / probes if probes else 0,
+        "stores": stores,
+        "evictions": evictions,
+    }
+    if verbose:
+        print("%s: %d of %d slots used (%.1f%%), %d probes, %d hits (%.1f%%), %d stores, %d evictions" %
+              (file_name, used, num_slots, 100 * used / num_slots, probes, hits, 100 * report["hit_rate"], stores,
+               evictions))
+    return report
@@ -0,0 +1,207 @@
+from zobrist import Zobrist
+
+
+class Symmetry:
+    """
+    The 8 symmetries of the square board and canonical position keys.
+
+    A symmetry is a number t from 0 to 7: bit 0 transposes the board, then bit 1 flips the rows and bit 2 flips the
+    columns. On an even sized board half of them move every square onto a square of the other color, so a position is
+    only equivalent to its image under those with the colors of the pieces, the player to move and the player the
+    search is for all swapped. The heuristics only count moves and pieces of each player, so equivalent positions have
+    the same value.
+
+    A board can keep the hashes of all 8 of its images up to date as moves are made, see
+    BitBoard.get_symmetric_hashes. The canonical key of a position is the smallest of the keys of its images, so the 8
+    equivalent positions share one entry in a table keyed by it. Moves are stored in the frame of the image the key came
+    from and mapped back with the inverse symmetry.
+    """
+
+    COUNT = 8
+    IDENTITY = 0
+
+    __KEYS = {}
+    __INVERSES = None
+
+    @staticmethod
+    def map_square(size, transform, square):
+        """
+        :param size: one side length of the board
+        :param transform: the symmetry, 0 to 7
+        :param square: the (row, col) square to map
+        :return: the square that square is moved to by the symmetry
+        """
+        r, c = square
+        if transform & 1:
+            r, c = c, r
+        if transform & 2:
+            r = size - 1 - r
+        if transform & 4:
+            c = size - 1 - c
+        return r, c
+
+    @staticmethod
+    def map_move(size, transform, move):
+        """
+        :param move: a move in the format of Board.do_move, or None
+        :return: the image of the move under the symmetry
+        """
+        if move is None:
+            return None
+        start, end = move
+        return Symmetry.map_square(size, transform, start), \
+            None if end is None else Symmetry.map_square(size, transform, end)
+
+    @staticmethod
+    def inverse(transform):
+        """
+        :return: the symmetry that undoes the given one
+        """
+        if Symmetry.__INVERSES is None:
+            # (0, 1) on a 5x5 board has 8 different images, so it tells every pair of symmetries apart
+            Symmetry.__INVERSES = [next(u for u in range(Symmetry.COUNT)
+                                        if Symmetry.map_square(5, u, Symmetry.map_square(5, t, (0, 1))) == (0, 1))
+                                   for t in range(Symmetry.COUNT)]
+        return Symmetry.__INVERSES[transform]
+
+    @staticmethod
+    def swaps_colors(transform):
+        """
+        :return: True if the symmetry moves every square onto a square of the other color. Flipping the rows or the
+        columns of an even sized board does, transposing doesn't.
+        """
+        return bool(transform & 2) != bool(transform & 4)
+
+    @staticmethod
+    def keys(size):
+        """
+        Gets the keys that images of pieces hash with, generating them the first time
+        :param size: one side length of the board
+        :return: (black keys, white keys), each a list indexed by r * size + c of tuples with the Zobrist key of the
+        image of a piece on that square under each symmetry
+        """
+        if size not in Symmetry.__KEYS:
+            black_keys, white_keys = Zobrist.keys(size)
+            black, white = [], []
+            for i in range(size ** 2):
+                images = [Symmetry.map_square(size, t, divmod(i, size)) for t in range(Symmetry.COUNT)]
+                for own_keys, other_keys, keys in ((black_keys, white_keys, black), (white_keys, black_keys, white)):
+                    keys.append(tuple((other_keys if Symmetry.swaps_colors(t) else own_keys)[r * size + c]
+                                      for t, (r, c) in enumerate(images)))
+            Symmetry.__KEYS[size] = (black, white)
+        return Symmetry.__KEYS[size]
+
+    @staticmethod
+    def update_hashes(size, hashes, black, white):
+        """
+        Xors pieces into or out of the hashes of all the images of a position
+        :param size: one side length of the board
+        :param hashes: the 8 hashes, indexed by symmetry
+        :param black: the bits of the black pieces that were added or removed
+        :param white: the bits of the white pieces that were added or removed
+        :return: the new tuple of hashes
+        """
+        black_keys, white_keys = Symmetry.keys(size)
+        h0, h1, h2, h3, h4, h5, h6, h7 = hashes
+        for bits, keys in ((black, black_keys), (white, white_keys)):
+            while bits:
+                low = bits & -bits
+                k0, k1, k2, k3, k4, k5, k6, k7 = keys[low.bit_length() - 1]
+                h0 ^= k0
+                h1 ^= k1
+                h2 ^= k2
+                h3 ^= k3
+                h4 ^= k4
+                h5 ^= k5
+                h6 ^= k6
+                h7 ^= k7
+                bits ^= low
+        return h0, h1, h2, h3, h4, h5, h6, h7
+
+    @staticmethod
+    def hash_bits(size, black, white):
+        """
+        Computes the hashes of all the images of a position from scratch
+        :return: the 8 hashes, indexed by symmetry. The first one is the Zobrist hash of the position itself.
+        """
+        return Symmetry.update_hashes(size, (0,) * Symmetry.COUNT, black, white)
+
+    @staticmethod
+    def canonical_key(board, player, root_player=None):
+        """
+        Finds the image of a position with the smallest key
+        :param board: the position, a Board or BitBoard
+        :param player: the player whose turn it is
+        :param root_player: optional player the values stored under the key are computed for
+        :return: (key, symmetry) where key is the same for all 8 equivalent positions and symmetry maps the position
+        onto the image the key was computed for
+        """
+        best_key = None
+        best_transform = Symmetry.IDENTITY
+        for transform, h in enumerate(board.get_symmetric_hashes()):
+            sign = -1 if Symmetry.swaps_colors(transform) else 1
+            key = h ^ Zobrist.side_key(sign * player)
+            if root_player is not None:
+                key ^= Zobrist.perspective_key(sign * root_player)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_transform = transform
+        return best_key, best_transform
+
+
+def fuzz_symmetric_hashes(trials=20, seed=0, size=8):
+    """
+    Plays random games and checks the symmetric hashes and canonical keys along the way
+    :param trials: the number of games to play
+    :param seed: the seed for the random games
+    :param size: the size of the board
+    :return: the number of positions checked
+    :raises ValueError: if an incrementally updated hash differs from one computed from scratch, an image of a position
+    gets another canonical key, or a mapped move isn't legal in the image or isn't mapped back
+    """
+    # Imported here so the symmetries don't depend on the board module
+    import random
+    from board import Board
+
+    rand = random.Random(seed)
+    checked = 0
+    for _trial in range(trials):
+        board = Board(size=size)
+        board.get_symmetric_hashes()
+        player = 1
+        while True:
+            moves = board.get_possible_moves(player)
+            bits = board.get_bitboard()
+            expected = Symmetry.hash_bits(size, bits.get_bits(1), bits.get_bits(-1))
+            if board.get_symmetric_hashes() != expected or expected[0] != board.get_hash():
+                raise ValueError("Stale symmetric hashes at move %d" % board.get_move_number())
+            key, _transform = Symmetry.canonical_key(board, player, root_player=1)
+            array = board.get_array()
+            for t in range(Symmetry.COUNT):
+                sign = -1 if Symmetry.swaps_colors(t) else 1
+                image = [[0] * size for _r in range(size)]
+                for r in range(size):
+                    for c in range(size):
+                        r2, c2 = Symmetry.map_square(size, t, (r, c))
+                        image[r2][c2] = sign * array[r][c]
+                image = Board.from_array(image, move_number=board.get_move_number())
+                if Symmetry.canonical_key(image, sign * player, root_player=sign)[0] != key:
+                    raise ValueError("Image %d of the position at move %d has another key" %
+                                     (t, board.get_move_number()))
+                if moves and board.get_move_number() > 2:
+                    move = rand.choice(moves)
+                    mapped = Symmetry.map_move(size, t, move)
+                    if not image.is_valid_move(mapped, sign * player):
+                        raise ValueError("Image %d of move %s isn't legal" % (t, str(move)))
+                    if Symmetry.map_move(size, Symmetry.inverse(t), mapped) != move:
+                        raise ValueError("Symmetry %d isn't undone by its inverse" % t)
+            checked += 1
+            if len(moves) == 0:
+                break
+            board.make_move(rand.choice(moves))
+            player *= -1
+            if rand.random() < 0.2 and board.get_move_number() > 3:
+                # Back to the same player's turn
+                board.unmake_move()
+                board.unmake_move()
+    return checked
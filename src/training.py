@@ -0,0 +1,215 @@
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from board import Board
+from game import do_serial_game
+from heuristic import MCPDLearningHeuristic, write_file_atomically
+
+
+def make_heuristic(heuristic_class, constants):
+    """
+    Creates a heuristic with the given constants instead of the ones in its file
+    :param heuristic_class: the Heuristic subclass to create
+    :param constants: a dict of constant names to values
+    :return: the new heuristic
+    """
+    heuristic_obj = heuristic_class()
+    for key, value in constants.items():
+        heuristic_obj[key] = value
+    return heuristic_obj
+
+
+def random_constants(keys, rand=None):
+    """
+    :return: a dict with a uniformly random value from 0 to 1 for every key, like Heuristic's UNIFORM randomness
+    """
+    rand = rand or random.Random()
+    return {key: rand.uniform(0, 1) for key in keys}
+
+
+def random_opening(size, plies, rand=None):
+    """
+    Plays random moves from the starting position
+    :param size: the size of the board
+    :param plies: the number of moves to play, including the two removals
+    :param rand: optional random.Random to draw the moves with
+    :return: the list of moves played. Shorter than plies if a player ran out of moves.
+    """
+    rand = rand or random.Random()
+    board = Board(size=size)
+    player = 1
+    opening = []
+    for _i in range(plies):
+        moves = board.get_possible_moves(player)
+        if len(moves) == 0:
+            break
+        # Sorted so the same seed always gives the same opening
+        move = rand.choice(sorted(moves))
+        board.do_move(move)
+        opening.append(move)
+        player *= -1
+    return opening
+
+
+def play_training_game(task):
+    """
+    Plays one tournament game in a worker process
+    :param task: (index of the first candidate, index of the second candidate, heuristic class, constants of the first,
+    constants of the second, depth, size, opening moves, SharedCache file or None). The first candidate is player 1.
+    :return: (index of the first candidate, index of the second candidate, winning player, move count, seconds)
+    """
+    i, j, heuristic_class, constants_i, constants_j, depth, size, opening, cache_file = task
+    start = time.time()
+    winner, move_count = do_serial_game(make_heuristic(heuristic_class, constants_i),
+                                        make_heuristic(heuristic_class, constants_j), depth1=depth, depth2=depth,
+                                        size=size, player=1, opening=opening, cache_file=cache_file)
+    return i, j, winner, move_count, time.time() - start
+
+
+class Tournament:
+    """
+    Self-play tournament between candidate constant sets for a learning heuristic.
+
+    Every game is played start to finish by one worker of a process pool, so many games run at the same time and the
+    number of games per hour grows with the number of cores. Candidates can be scored with a round robin, or rated
+    with Elo over rounds where neighbours in the ratings play each other. Searches have no randomness, so every pair of
+    games starts from its own random opening and the two candidates take one side each in turn.
+    """
+
+    ELO_START = 1500
+    ELO_K = 32
+
+    def __init__(self, candidates, heuristic_class=MCPDLearningHeuristic, depth=2, size=18, processes=None,
+                 opening_plies=6, seed=0, cache_file=None):
+        """
+        Tournament constructor
+        :param candidates: a list of constant dicts, one per candidate
+        :param heuristic_class: the Heuristic subclass the constants are for
+        :param depth: the search depth of both sides in every game
+        :param size: the size of the board
+        :param processes: the number of games to play at once, defaults to the number of cores
+        :param opening_plies: the number of random moves every game starts with. 0 starts every game from the
+        starting position, in which case a pair of candidates only has two different games.
+        :param seed: the seed of the random openings
+        :param cache_file: optional SharedCache file that every game searches with, so a candidate's games reuse each
+        other's results
+        """
+        self._candidates = [dict(constants) for constants in candidates]
+        self._heuristic_class = heuristic_class
+        self._depth = depth
+        self._size = size
+        self._processes = processes or os.cpu_count()
+        self._opening_plies = opening_plies
+        self._cache_file = cache_file
+        self._rand = random.Random(seed)
+        self.ratings = [float(Tournament.ELO_START)] * len(candidates)
+        self.wins = [0] * len(candidates)
+        self.games = [0] * len(candidates)
+        # (first candidate, second candidate, winning candidate, move count, seconds) of every game played
+        self.results = []
+        self._seconds = 0.0
+
+    def get_candidates(self):
+        return self._candidates
+
+    def run_round_robin(self, games_per_pair=2):
+        """
+        Plays every candidate against every other candidate
+        :param games_per_pair: the number of games per pair. Every two games share an opening and the candidates swap
+        sides between them.
+        """
+        pairings = []
+        for i in range(len(self._candidates)):
+            for j in range(i + 1, len(self._candidates)):
+                for g in range(0, games_per_pair, 2):
+                    pairings.extend(self._game_pair(i, j)[:games_per_pair - g])
+        self._play(pairings)
+
+    def _game_pair(self, i, j):
+        """
+        :return: two (first candidate, second candidate, opening) games where each candidate starts once from the same
+        random opening
+        """
+        opening = random_opening(self._size, self._opening_plies, self._rand)
+        return [(i, j, opening), (j, i, opening)]
+
+    def run_elo(self, rounds=5):
+        """
+        Plays rounds where candidates are paired with their neighbours in the current ratings, updating the ratings
+        after every game
+        :param rounds: the number of rounds to play
+        """
+        for round_number in range(rounds):
+            ranked = sorted(range(len(self._candidates)), key=lambda i: self.ratings[i], reverse=True)
+            if round_number % 2 == 1:
+                # Shifting the pairs every other round so candidates don't always meet the same neighbour
+                ranked = ranked[1:] + ranked[:1]
+            pairs = [(ranked[k], ranked[k + 1]) for k in range(0, len(ranked) - 1, 2)]
+            self._play([game for i, j in pairs for game in self._game_pair(i, j)])
+
+    def _play(self, pairings):
+        """
+        Plays a game for every pairing on the pool, recording results as they finish
+        :param pairings: (first candidate, second candidate, opening) games. The first candidate plays player 1.
+        """
+        tasks = [(i, j, self._heuristic_class, self._candidates[i], self._candidates[j], self._depth, self._size,
+                  opening, self._cache_file) for i, j, opening in pairings]
+        if len(tasks) == 0:
+            # Fewer than two candidates, nobody to pair
+            return
+        start = time.time()
+        with Pool(min(self._processes, len(tasks))) as pool:
+            for i, j, winner, move_count, seconds in pool.imap_unordered(play_training_game, tasks):
+                self._record(i, j, i if winner == 1 else j, move_count, seconds)
+        self._seconds += time.time() - start
+
+    def _record(self, i, j, winner, move_count, seconds):
+        loser = j if winner == i else i
+        expected = 1 / (1 + 10 ** ((self.ratings[loser] - self.ratings[winner]) / 400))
+        self.ratings[winner] += Tournament.ELO_K * (1 - expected)
+        self.ratings[loser] -= Tournament.ELO_K * (1 - expected)
+        self.wins[winner] += 1
+        self.games[i] += 1
+        self.games[j] += 1
+        self.results.append((i, j, winner, move_count, seconds))
+
+    def get_games_per_hour(self):
+        return len(self.results) / self._seconds * 3600 if self._seconds else 0
+
+    def get_standings(self):
+        """
+        :return: the candidate indices from best to worst, by rating and then by win rate
+        """
+        return sorted(range(len(self._candidates)),
+                      key=lambda i: (self.ratings[i], self.wins[i] / self.games[i] if self.games[i] else 0),
+                      reverse=True)
+
+    def get_best(self):
+        """
+        :return: the constants of the best candidate
+        """
+        return dict(self._candidates[self.get_standings()[0]])
+
+    def save(self, folder="../const"):
+        """
+        Writes the standings to <heuristic class>.tournament.csv and the best candidate's constants to the heuristic's
+        constants file. Both files are replaced atomically.
+        :param folder: the folder to write to
+        """
+        name = self._heuristic_class.__name__
+        keys = sorted({key for constants in self._candidates for key in constants})
+        lines = [",".join(["rating", "wins", "games"] + keys) + "\n"]
+        for i in self.get_standings():
+            values = ["%f" % self.ratings[i], str(self.wins[i]), str(self.games[i])]
+            lines.append(",".join(values + [str(self._candidates[i].get(key, 0)) for key in keys]) + "\n")
+        write_file_atomically(os.path.join(folder, name + ".tournament.csv"), "".join(lines))
+        make_heuristic(self._heuristic_class, self.get_best()).save_constants_to_file(
+            os.path.join(folder, name + ".const"))
+
+    def print_standings(self):
+        print("Rating\tWins\tGames\tConstants")
+        for i in self.get_standings():
+            print("%.0f\t%d\t%d\t%s" % (self.ratings[i], self.wins[i], self.games[i], str(self._candidates[i])))
+        print("%d games, %.0f games/hour" % (len(self.results), self.get_games_per_hour()))
@@ -0,0 +1,98 @@
+class TranspositionTable:
+    """
+    Bounded transposition table for alpha-beta search.
+
+    Entries are (key, depth, value, bound, best move, generation) tuples stored in a fixed number of slots indexed by
+    the position hash. When two positions land in the same slot the new entry replaces the old one if the old one is
+    from an earlier search, or if the new one was searched at least as deep.
+
+    A symmetric table is keyed by Symmetry.canonical_key instead of the plain hash, so the up to 8 positions that are
+    images of each other under the symmetries of the board share one entry, with the best move stored in the frame of
+    the canonical image. The search computes the keys and maps the moves, the table only tells it to.
+    """
+
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    DEFAULT_MEGABYTES = 64
+
+    # Rough size of one stored entry in bytes, including the slot in the list
+    ENTRY_BYTES = 200
+
+    def __init__(self, max_megabytes=DEFAULT_MEGABYTES, symmetric=False):
+        """
+        Transposition table constructor
+        :param max_megabytes: the memory cap of the table. The number of slots is derived from it.
+        :param symmetric: key positions by their canonical image, so equivalent positions share an entry
+        """
+        self._num_slots = max(1, int(max_megabytes * 2 ** 20 / TranspositionTable.ENTRY_BYTES))
+        self._symmetric = symmetric
+        self._slots = [None] * self._num_slots
+        self._generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __len__(self):
+        return sum(1 for entry in self._slots if entry is not None)
+
+    def get_num_slots(self):
+        return self._num_slots
+
+    def is_symmetric(self):
+        return self._symmetric
+
+    def set_generation(self, generation):
+        """
+        Marks the start of a new search. Entries from older generations are replaced first.
+        :param generation: any increasing number, e.g. the move number of the root position
+        """
+        self._generation = generation
+
+    def clear(self):
+        self._slots = [None] * self._num_slots
+        self.probes = 0
+        self.hits = 0
+
+    def probe(self, key):
+        """
+        Looks up a position
+        :param key: the hash of the position
+        :return: (depth, value, bound, best move) or None if the position is not stored
+        """
+        self.probes += 1
+        entry = self._slots[key % self._num_slots]
+        if entry is None or entry[0] != key:
+            return None
+        self.hits += 1
+        return entry[1:5]
+
+    def get_move(self, key):
+        """
+        :return: the best move stored for a position, or None
+        """
+        entry = self._slots[key % self._num_slots]
+        if entry is None or entry[0] != key:
+            return None
+        return entry[4]
+
+    def store(self, key, depth, value, bound, move):
+        """
+        Stores the result of a search, subject to the replacement policy
+        :param key: the hash of the position
+        :param depth: the remaining depth the position was searched to
+        :param value: the value of the search
+        :param bound: EXACT, LOWER if the value is a lower bound (fail high) or UPPER if it is an upper bound (fail low)
+        :param move: the best move found, or None
+        """
+        index = key % self._num_slots
+        old = self._slots[index]
+        if old is not None and old[0] != key and old[5] == self._generation and old[1] > depth:
+            return
+        if old is not None and old[0] == key and move is None:
+            # Keeping the best move of an earlier search of the same position
+            move = old[4]
+        self._slots[index] = (key, depth, value, bound, move, self._generation)
+
+    def get_hit_rate(self):
+        return self.hits / self.probes if self.probes else 0
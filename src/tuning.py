@@ -0,0 +1,163 @@
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from heuristic import MCPDLearningHeuristic, write_file_atomically
+from training import make_heuristic, play_training_game, random_opening
+
+
+class SPSATuner:
+    """
+    Tunes heuristic constants with simultaneous perturbation stochastic approximation (SPSA).
+
+    Every iteration draws a batch of random +1/-1 perturbation directions. For each one, the constants nudged forwards
+    and backwards along it play each other twice from a random opening, swapping sides, and all of these games are
+    played at once on a process pool. The win difference of each pair estimates the slope along its direction, and the
+    constants take a step along the average. Every constant moves every iteration, unlike a winner-stays loop that
+    throws away all but one of each game's results.
+
+    The state after every iteration is written to a checkpoint file so a run can be stopped and resumed.
+    """
+
+    # Standard SPSA gain sequence exponents
+    ALPHA = 0.602
+    GAMMA = 0.101
+
+    def __init__(self, constants=None, heuristic_class=MCPDLearningHeuristic, depth=2, size=18, batch_size=None,
+                 step=0.1, perturbation=0.2, lower=0.0, upper=1.0, opening_plies=6, seed=0, processes=None,
+                 checkpoint=None):
+        """
+        Tuner constructor
+        :param constants: the dict of constants to start from, defaults to the ones in the heuristic's file
+        :param heuristic_class: the Heuristic subclass the constants are for
+        :param depth: the search depth of both sides in every game
+        :param size: the size of the board
+        :param batch_size: the number of perturbation directions per iteration, defaults to the number of processes
+        :param step: the size of the first step, as a fraction of the distance between lower and upper
+        :param perturbation: the size of the first perturbation, as a fraction of the distance between lower and upper
+        :param lower: the smallest value a constant can take
+        :param upper: the largest value a constant can take
+        :param opening_plies: the number of random moves every pair of games starts with
+        :param seed: the seed of the perturbations and openings. Together with the iteration number it decides each
+        batch, so a resumed run draws the same perturbations it would have without stopping.
+        :param processes: the number of games to play at once, defaults to the number of cores
+        :param checkpoint: the file to save the state to after every iteration, defaults to
+        ../const/<heuristic class>.spsa.json. If it exists the run resumes from it.
+        """
+        if constants is None:
+            heuristic_obj = heuristic_class()
+            constants = {key: heuristic_obj[key] for key in heuristic_obj}
+        self._heuristic_class = heuristic_class
+        self._depth = depth
+        self._size = size
+        self._processes = processes or os.cpu_count()
+        self._batch_size = batch_size or self._processes
+        self._step = step * (upper - lower)
+        self._perturbation = perturbation * (upper - lower)
+        self._lower = lower
+        self._upper = upper
+        self._opening_plies = opening_plies
+        self._seed = seed
+        self._checkpoint = checkpoint or os.path.join("../const", heuristic_class.__name__ + ".spsa.json")
+
+        self._keys = sorted(constants)
+        self.theta = [float(constants[key]) for key in self._keys]
+        self.iteration = 0
+        self.games_played = 0
+        self.history = []
+        if os.path.isfile(self._checkpoint):
+            self.load_checkpoint()
+
+    def get_constants(self):
+        return dict(zip(self._keys, self.theta))
+
+    def _clip(self, values):
+        return [min(self._upper, max(self._lower, value)) for value in values]
+
+    def run(self, iterations, verbose=True):
+        """
+        Runs SPSA iterations, saving a checkpoint after each one
+        :param iterations: the number of iterations to run
+        :param verbose: print the constants after every iteration
+        :return: the tuned constants
+        """
+        with Pool(self._processes) as pool:
+            for _i in range(iterations):
+                start = time.time()
+                wins = self.step(pool)
+                self.save_checkpoint()
+                if verbose:
+                    print("Iteration %d: %d/%d games won by the forward perturbation, %d games in total, %.1fs, %s" %
+                          (self.iteration, wins, 2 * self._batch_size, self.games_played, time.time() - start,
+                           str(self.get_constants())))
+        return self.get_constants()
+
+    def step(self, pool):
+        """
+        Runs one iteration with the games of all perturbations played on the pool at once
+        :param pool: the multiprocessing Pool to play the games on
+        :return: the number of games won by the forward perturbations
+        """
+        t = self.iteration
+        step = self._step / (t + 1) ** SPSATuner.ALPHA
+        perturbation = self._perturbation / (t + 1) ** SPSATuner.GAMMA
+        rand = random.Random("%d-%d" % (self._seed, t))
+
+        deltas = [[rand.choice((1, -1)) for _key in self._keys] for _k in range(self._batch_size)]
+        tasks = []
+        for k, delta in enumerate(deltas):
+            plus = dict(zip(self._keys, self._clip([x + perturbation * d for x, d in zip(self.theta, delta)])))
+            minus = dict(zip(self._keys, self._clip([x - perturbation * d for x, d in zip(self.theta, delta)])))
+            opening = random_opening(self._size, self._opening_plies, rand)
+            # Candidate 2k is the forward perturbation and 2k + 1 the backward one. There is no shared cache since
+            # perturbed constants are never played again.
+            tasks.append((2 * k, 2 * k + 1, self._heuristic_class, plus, minus, self._depth, self._size, opening,
+                          None))
+            tasks.append((2 * k + 1, 2 * k, self._heuristic_class, minus, plus, self._depth, self._size, opening,
+                          None))
+
+        scores = [0] * self._batch_size
+        for i, _j, winner, _move_count, _seconds in pool.imap_unordered(play_training_game, tasks):
+            forward_won = (winner == 1) == (i % 2 == 0)
+            scores[i // 2] += 1 if forward_won else -1
+
+        gradient = [0.0] * len(self._keys)
+        for delta, score in zip(deltas, scores):
+            for n, d in enumerate(delta):
+                # score / 2 is the result of the pair from -1 to 1, and 1 / d == d for d in (1, -1)
+                gradient[n] += score / 2 / (2 * perturbation) * d / self._batch_size
+        self.theta = self._clip([x + step * g for x, g in zip(self.theta, gradient)])
+
+        self.iteration += 1
+        self.games_played += len(tasks)
+        self.history.append(list(self.theta))
+        return sum((score + 2) // 2 for score in scores)
+
+    def save_checkpoint(self):
+        state = {
+            "keys": self._keys,
+            "theta": self.theta,
+            "iteration": self.iteration,
+            "games_played": self.games_played,
+            "history": self.history,
+            "seed": self._seed,
+        }
+        write_file_atomically(self._checkpoint, json.dumps(state, indent=1))
+
+    def load_checkpoint(self):
+        with open(self._checkpoint, "r") as file:
+            state = json.load(file)
+        self._keys = state["keys"]
+        self.theta = state["theta"]
+        self.iteration = state["iteration"]
+        self.games_played = state["games_played"]
+        self.history = state["history"]
+        self._seed = state["seed"]
+
+    def save_constants(self, file_name=None):
+        """
+        Saves the tuned constants to the heuristic's constants file
+        """
+        make_heuristic(self._heuristic_class, self.get_constants()).save_constants_to_file(file_name)
@@ -0,0 +1,63 @@
+import random
+
+
+class Zobrist:
+    """
+    Zobrist keys for Konane positions.
+
+    Every (square, color) pair gets a random 64 bit key and a position's hash is the xor of the keys of all the pieces
+    on the board, so a move only has to xor in the squares it changes. The keys come from a fixed seed so hashes are
+    the same in every process and every run, which lets them be used for on-disk books and shared caches.
+    """
+
+    SEED = 0x4B6F6E616E65
+    BITS = 64
+
+    __KEYS = {}
+
+    @staticmethod
+    def keys(size):
+        """
+        Gets the piece keys for a board size, generating them the first time
+        :param size: one side length of the board
+        :return: (black keys, white keys), each a list indexed by r * size + c
+        """
+        if size not in Zobrist.__KEYS:
+            rand = random.Random(Zobrist.SEED + size)
+            black = [rand.getrandbits(Zobrist.BITS) for _i in range(size ** 2)]
+            white = [rand.getrandbits(Zobrist.BITS) for _i in range(size ** 2)]
+            Zobrist.__KEYS[size] = (black, white)
+        return Zobrist.__KEYS[size]
+
+    @staticmethod
+    def hash_bits(size, black, white):
+        """
+        Computes a hash from scratch
+        :param size: one side length of the board
+        :param black: the bits of player 1's pieces
+        :param white: the bits of player -1's pieces
+        :return: the Zobrist hash of the position
+        """
+        black_keys, white_keys = Zobrist.keys(size)
+        h = 0
+        for bits, keys in ((black, black_keys), (white, white_keys)):
+            while bits:
+                low = bits & -bits
+                h ^= keys[low.bit_length() - 1]
+                bits ^= low
+        return h
+
+    @staticmethod
+    def side_key(player):
+        """
+        Key to xor in for the player whose turn it is
+        """
+        return 0x5D1E5C2F3A7B9E11 if player == 1 else 0x2C6A9F04E8D3B757
+
+    @staticmethod
+    def perspective_key(player):
+        """
+        Key to xor in for the player the search values are computed for. Keeps entries from searches run for the
+        two different players apart when they share a table.
+        """
+        return 0x71C3E5A90B2D4F68 if player == 1 else 0x0E9B47D2C5A6183F